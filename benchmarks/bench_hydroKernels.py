@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+""" Benchmark suite for the hydrological kernels of SLOTH.
+
+This script measures wall time and peak memory of the hydrological kernels
+(`toolBox.calc_catchment()`, `toolBox.calc_riverNetwork()`, `mapper.MapRaw()`,
+`mapper.MapBestQ()`, and `mapper.MapBestCatchment()`) on synthetic but realistic data of production
+size. No input data or network access is needed, all fields are generated 
+on the fly:
+
+- the simulation grids are rotated pole grids with the size and resolution 
+  of the EUR-11 (436x424), DE06 (2000x2000), and MB3km (1592x1544) grids,
+- the D4 slopes are generated by a stochastic growth of drainage trees from
+  outlets along the domain border, what results in dendritic river networks
+  without pits or loops,
+- the GRDC-like stations are placed on river pixel, with a catchment area 
+  and mean discharge related to the flow accumulation of the synthetic 
+  network.
+
+The results could be stored as JSON and compared against a previous run, to
+gate changes on the runtime of the kernels:
+
+    python bench_hydroKernels.py --json baseline.json
+    # [...] change something
+    python bench_hydroKernels.py --compare baseline.json --tolerance 1.2
+
+With --compare the script exits with status 1 if any kernel is slower than
+`tolerance` times the baseline. Before timing, the flow accumulation based 
+kernels are checked against `toolBox.calc_catchment()` on a small grid (see
+`check_consistency()`), and the script exits with status 1 if they differ.
+"""
+import numpy as np
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sloth_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(sloth_path)
+import sloth.toolBox
+import sloth.mapper
+import sloth.coordTrafo
+
+###############################################################################
+### Grid definitions (rotated pole grids)
+###############################################################################
+# nx, ny, dlon/dlat in [deg], pixel size in [m]
+GRIDS = {
+    'EUR-11': {'nx': 436, 'ny': 424, 'dres': 0.11,   'dxy': 12500.},
+    'DE06':   {'nx': 2000, 'ny': 2000, 'dres': 0.0055, 'dxy': 611.},
+    'MB3km':  {'nx': 1592, 'ny': 1544, 'dres': 0.0275, 'dxy': 3000.},
+}
+KERNELS = ['calc_catchment', 'calc_riverNetwork', 'MapRaw', 'MapBestQ', 'MapBestCatchment']
+
+###############################################################################
+### Synthetic data generators
+###############################################################################
+def create_rotatedGrid(nx, ny, dres, np_lat=39.25, np_lon=-162.):
+    """ Create 2D lon / lat of a rotated pole grid centred at rlon=rlat=0 """
+    rlon = (np.arange(nx) - 0.5*(nx-1)) * dres
+    rlat = (np.arange(ny) - 0.5*(ny-1)) * dres
+    rlon2D, rlat2D = np.meshgrid(rlon, rlat)
+    lat2D, lon2D = sloth.coordTrafo.undo_grid_rotation(rlat=rlat2D, rlon=rlon2D,
+            np_lat=np_lat, np_lon=np_lon)
+    return lon2D, lat2D
+
+def create_D4Slopes(ny, nx, outletSpacing=40, growth=0.3, seed=42):
+    """ Create synthetic D4 slopes by growing drainage trees from the border.
+
+    Starting from outlets placed along the domain border, each iteration a
+    random fraction (`growth`) of all not yet drained pixel, which do have an 
+    already drained neighbour, is attached to one of those neighbours (chosen
+    randomly). This is a stochastic (Eden like) growth process which results
+    in dendritic drainage networks, free of pits and loops.
+
+    Returns
+    -------
+    slopex, slopey : ndarray
+        2D slopes in x- and y-direction, only one of both is non-zero for each
+        pixel. Outlets are sinks with both slopes zero.
+    flowAcc : ndarray
+        2D flow accumulation (number of upstream pixel including the pixel 
+        itself).
+    """
+    rng = np.random.default_rng(seed)
+    n = nx * ny
+    parent = np.full(n, -2, dtype=np.int64)
+    # outlets along the domain border
+    border = np.unique(np.concatenate([
+        np.arange(nx), (ny-1)*nx + np.arange(nx),
+        np.arange(ny)*nx, np.arange(ny)*nx + nx-1]))
+    seeds = rng.choice(border, size=max(1, border.size // outletSpacing), replace=False)
+    parent[seeds] = -1
+    levels = [seeds]
+    active = seeds
+    # neighbour offsets (dy, dx)
+    offsets = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    while active.size > 0:
+        ay, ax = np.divmod(active, nx)
+        tmp_child = []
+        tmp_parent = []
+        for dy, dx in offsets:
+            cy, cx = ay + dy, ax + dx
+            inside = (cy >= 0) & (cy < ny) & (cx >= 0) & (cx < nx)
+            child = cy[inside] * nx + cx[inside]
+            free = parent[child] == -2
+            tmp_child.append(child[free])
+            tmp_parent.append(active[inside][free])
+        child = np.concatenate(tmp_child)
+        par = np.concatenate(tmp_parent)
+        if child.size == 0:
+            break
+        # random parent for each child, and only a random fraction grows
+        perm = rng.permutation(child.size)
+        child, first = np.unique(child[perm], return_index=True)
+        par = par[perm][first]
+        grow = rng.random(child.size) < growth
+        if not grow.any():
+            grow[:] = True
+        child, par = child[grow], par[grow]
+        parent[child] = par
+        levels.append(child)
+        # cells which are not fully surrounded yet stay active
+        active = np.concatenate([active, child])
+        ay, ax = np.divmod(active, nx)
+        stillFree = np.zeros(active.size, dtype=bool)
+        for dy, dx in offsets:
+            cy, cx = ay + dy, ax + dx
+            inside = (cy >= 0) & (cy < ny) & (cx >= 0) & (cx < nx)
+            idx = np.where(inside, cy * nx + cx, 0)
+            stillFree |= inside & (parent[idx] == -2)
+        active = active[stillFree]
+
+    # flow accumulation: process the levels from the leafs to the outlets
+    flowAcc = np.ones(n, dtype=np.int64)
+    for level in reversed(levels[1:]):
+        np.add.at(flowAcc, parent[level], flowAcc[level])
+
+    # convert 'drain to parent' into ParFlow like slopes
+    magnitude = rng.lognormal(mean=np.log(1e-3), sigma=1., size=n)
+    slopex = np.zeros(n)
+    slopey = np.zeros(n)
+    drained = parent >= 0
+    step = np.zeros(n, dtype=np.int64)
+    step[drained] = parent[drained] - np.flatnonzero(drained)
+    slopex = np.where(step == 1, -magnitude, slopex)
+    slopex = np.where(step == -1, magnitude, slopex)
+    slopey = np.where(step == nx, -magnitude, slopey)
+    slopey = np.where(step == -nx, magnitude, slopey)
+    return slopex.reshape(ny, nx), slopey.reshape(ny, nx), flowAcc.reshape(ny, nx)
+
+def create_stations(flowAcc, lons, lats, dxy, nStations=20, minAcc=100,
+        maxAcc=None, seed=42):
+    """ Create a GRDC like station set located on the synthetic rivers.
+
+    Returns a dict with the keys ObsIDs, ObsLons, ObsLats, ObsMeanArea, 
+    ObsMeanQ, and SimMeanQ, which could directly be passed to mapper().
+    """
+    rng = np.random.default_rng(seed)
+    ny, nx = flowAcc.shape
+    maxAcc = flowAcc.max() if maxAcc is None else maxAcc
+    # do not use the outer most pixel, so all search windows stay inside
+    onRiver = (flowAcc >= minAcc) & (flowAcc <= maxAcc)
+    onRiver[:5] = onRiver[-5:] = False
+    onRiver[:, :5] = onRiver[:, -5:] = False
+    candidates = np.flatnonzero(onRiver)
+    picked = rng.choice(candidates, size=min(nStations, candidates.size), replace=False)
+    y, x = np.divmod(picked, nx)
+    pixelArea = dxy * dxy / (1000. * 1000.)
+    # runoff of ~300 mm/a as mean discharge in [m^3/s]
+    runoff = 0.3 / (365. * 24. * 3600.)
+    SimMeanQ = flowAcc * dxy * dxy * runoff * rng.lognormal(0., 0.1, size=flowAcc.shape)
+    # shift the stations location within one pixel
+    jitterLon = rng.uniform(-0.5, 0.5, size=y.size) * (lons[y, np.minimum(x+1, nx-1)] - lons[y, x])
+    jitterLat = rng.uniform(-0.5, 0.5, size=y.size) * (lats[np.minimum(y+1, ny-1), x] - lats[y, x])
+    return {
+        'ObsIDs':      np.arange(1, y.size+1),
+        'ObsLons':     lons[y, x] + jitterLon,
+        'ObsLats':     lats[y, x] + jitterLat,
+        'ObsMeanArea': flowAcc[y, x] * pixelArea * rng.uniform(0.9, 1.1, size=y.size),
+        'ObsMeanQ':    SimMeanQ[y, x] * rng.uniform(0.8, 1.2, size=y.size),
+        'SimMeanQ':    SimMeanQ,
+        'x':           x,
+        'y':           y,
+    }
+
+###############################################################################
+### Consistency check
+###############################################################################
+def create_demSlopes(ny, nx, seed=42):
+    """ Create slopes out of a smooth random DEM, where most pixel drain in 
+    x- and y-direction at once (see toolBox.get_dualDrain()) """
+    rng = np.random.default_rng(seed)
+    dem = np.cumsum(np.cumsum(rng.random((ny, nx)), axis=0), axis=1)
+    gradY, gradX = np.gradient(dem)
+    return -gradX, -gradY
+
+def check_consistency(ny=40, nx=50, seed=42):
+    """ Check the flow accumulation based kernels against calc_catchment().
+
+    On a small synthetic grid the flow accumulation has to equal the traced
+    catchment size of each pixel for single direction D4 slopes, and 
+    MapFlowPath() has to fit the same catchment areas as calc_catchment() 
+    also for slopes draining in x- and y-direction at once.
+
+    Returns a list of failed checks (empty if all passed).
+    """
+    failed = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        slopex, slopey, flowAcc = create_D4Slopes(ny, nx, seed=seed)
+        catchmentSize = np.array([[np.sum(sloth.toolBox.calc_catchment(slopex, slopey, x, y))
+                                   for x in range(nx)] for y in range(ny)])
+        if not np.array_equal(sloth.toolBox.calc_flowAccumulation(slopex, slopey), catchmentSize):
+            failed.append('calc_flowAccumulation() != calc_catchment()')
+        if not np.array_equal(flowAcc, catchmentSize):
+            failed.append('create_D4Slopes() flowAcc != calc_catchment()')
+
+        lons, lats = create_rotatedGrid(nx, ny, 0.11)
+        for name, (sx, sy) in [('D4', (slopex, slopey)),
+                               ('DEM', create_demSlopes(ny, nx, seed=seed))]:
+            network = sloth.toolBox.calc_riverNetwork(sx, sy, threshold=5)
+            rng = np.random.default_rng(seed)
+            y, x = rng.integers(0, ny, 20), rng.integers(0, nx, 20)
+            Mapper = sloth.mapper.mapper(SimLons=lons, SimLats=lats,
+                    ObsLons=lons[y, x], ObsLats=lats[y, x], ObsIDs=np.arange(y.size))
+            Mapper.ObsMeanArea = rng.uniform(1., 50., size=y.size)
+            Mapper.MapFlowPath(flow_dist=3, criterion='area', network=network,
+                               slopex=sx, slopey=sy, dx=1000., dy=1000.)
+            traced = [np.sum(sloth.toolBox.calc_catchment(sx, sy, fx, fy))
+                      for fx, fy in zip(Mapper.MapXIdx_fit, Mapper.MapYIdx_fit)]
+            if not np.allclose(Mapper.SimMeanArea, traced):
+                failed.append(f'MapFlowPath() area != calc_catchment() ({name} slopes)')
+    return failed
+
+###############################################################################
+### Benchmark helper
+###############################################################################
+def measure(func, repeat=3):
+    """ Return best and median wall time [s] and peak memory [MB] of func() """
+    times = []
+    peak = 0
+    for n in range(repeat):
+        # the kernels are rather verbose, so silence them while measuring
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            if n == 0:
+                # measure memory in the first run only, as tracemalloc does
+                # slow down the execution
+                tracemalloc.start()
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+    return min(times), float(np.median(times)), peak / (1024.*1024.)
+
+def setup_case(gridName, nStations, seed):
+    grid = GRIDS[gridName]
+    lons, lats = create_rotatedGrid(grid['nx'], grid['ny'], grid['dres'])
+    slopex, slopey, flowAcc = create_D4Slopes(grid['ny'], grid['nx'], seed=seed)
+    # keep the catchments of production size, but cap them to ~ 1/20 of
+    # the domain, so MapBestCatchment stays feasible for the large grids
+    stations = create_stations(flowAcc, lons, lats, grid['dxy'],
+            nStations=nStations, maxAcc=flowAcc.size // 20, seed=seed)
+    return {'grid': grid, 'lons': lons, 'lats': lats, 'slopex': slopex,
+            'slopey': slopey, 'flowAcc': flowAcc, 'stations': stations}
+
+def get_mapper(case):
+    st = case['stations']
+    Mapper = sloth.mapper.mapper(SimLons=case['lons'], SimLats=case['lats'],
+            ObsLons=st['ObsLons'], ObsLats=st['ObsLats'], ObsIDs=st['ObsIDs'],
+            SimMeanQ=st['SimMeanQ'], ObsMeanQ=st['ObsMeanQ'])
+    Mapper.ObsMeanArea = st['ObsMeanArea']
+    return Mapper
+
+def get_kernel(name, case, search_rad):
+    """ Return a callable running the kernel `name` on `case` """
+    st = case['stations']
+    dxy = case['grid']['dxy']
+    if name == 'calc_catchment':
+        def run():
+            for x, y in zip(st['x'], st['y']):
+                sloth.toolBox.calc_catchment(case['slopex'], case['slopey'], x, y)
+        return run
+    if name == 'calc_riverNetwork':
+        return lambda: sloth.toolBox.calc_riverNetwork(case['slopex'],
+                case['slopey'], threshold=100)
+    # Create a fresh mapper for each run, as the mapper caches the spatial
+    # index of SimGrid and the results of each ObsID, so each run after the
+    # first would be a cache hit otherwise
+    if name == 'MapRaw':
+        return lambda: get_mapper(case).MapRaw()
+    if name == 'MapBestQ':
+        return lambda: get_mapper(case).MapBestQ(search_rad=search_rad)
+    if name == 'MapBestCatchment':
+        return lambda: get_mapper(case).MapBestCatchment(search_rad=search_rad,
+                dx=dxy, dy=dxy, slopex=case['slopex'], slopey=case['slopey'])
+    raise KeyError(name)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the hydrological kernels of SLOTH on synthetic grids.')
+    parser.add_argument('--grids', type=str, nargs='+', default=list(GRIDS.keys()),
+            choices=list(GRIDS.keys()), help='grids to run (default: all)')
+    parser.add_argument('--kernels', type=str, nargs='+', default=KERNELS,
+            choices=KERNELS, help='kernels to run (default: all)')
+    parser.add_argument('--stations', type=int, default=20,
+            help='number of synthetic stations (default: 20)')
+    parser.add_argument('--search_rad', type=int, default=1,
+            help='search radius used by MapBestXXX (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='number of timed repetitions per kernel (default: 3)')
+    parser.add_argument('--seed', type=int, default=42,
+            help='seed of the synthetic data (default: 42)')
+    parser.add_argument('--json', type=str, default=None,
+            help='write results to this JSON file')
+    parser.add_argument('--compare', type=str, default=None,
+            help='JSON file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.2,
+            help='allowed slowdown factor compared to --compare (default: 1.2)')
+    args = parser.parse_args()
+
+    failed = check_consistency(seed=args.seed)
+    for check in failed:
+        print(f'CHECK FAILED: {check}')
+    if failed:
+        sys.exit(1)
+
+    results = {}
+    print(f'{"grid":<8} {"kernel":<18} {"best [s]":>10} {"median [s]":>11} {"peak [MB]":>10}')
+    for gridName in args.grids:
+        case = setup_case(gridName, args.stations, args.seed)
+        for kernelName in args.kernels:
+            run = get_kernel(kernelName, case, args.search_rad)
+            best, median, peak = measure(run, repeat=args.repeat)
+            results[f'{gridName}/{kernelName}'] = {'best': best, 'median': median, 'peak_MB': peak}
+            print(f'{gridName:<8} {kernelName:<18} {best:10.4f} {median:11.4f} {peak:10.1f}', flush=True)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        failed = []
+        print(f'\nCompared to {args.compare} (tolerance {args.tolerance}):')
+        for key, res in results.items():
+            if key not in baseline:
+                continue
+            ratio = res['best'] / baseline[key]['best']
+            status = 'OK' if ratio <= args.tolerance else 'SLOWER'
+            if status != 'OK':
+                failed.append(key)
+            print(f'{key:<28} {ratio:6.2f}x {status}')
+        if failed:
+            sys.exit(1)
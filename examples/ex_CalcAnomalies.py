@@ -6,6 +6,11 @@ import os
 import glob
 import cftime
 
+sloth_path='../'
+sys.path.append(sloth_path)
+import sloth.analysis
+import sloth.Climatology
+
 
 ###############################################################################
 ##### Read in climate means
@@ -32,9 +37,8 @@ try:
     print(f'intervalMean.shape: {intervalMean.shape}')
     intervalTime = np.load(f'../data/example_ClimateMeans/intervalTime_{meanInterval}.npy', allow_pickle=True)
     print(f'intervalTime.dtype: {intervalTime.dtype}')
-    clima = np.load(f'../data/example_ClimateMeans/climate_{meanInterval}.npy')
-    clima = np.ma.masked_where(clima==-9999, clima)
-    print(f'np.min(clima): {np.min(clima)}')
+    climatology = sloth.Climatology.Climatology.load(f'../data/example_ClimateMeans/climatology_{meanInterval}.npz')
+    print(f'np.nanmin(clima): {np.nanmin(climatology.get_mean())}')
 except FileNotFoundError:
     print(f'needed climateMeans files were not found: EXIT')
     sys.exit()
@@ -48,11 +52,14 @@ try:
     print(f'intervalAnomalyDomain.shape: {intervalAnomalyDomain.shape}')
     print(f'intervalAnomalyDomain.dtype: {intervalAnomalyDomain.dtype}')
 except FileNotFoundError:
-    intervalAnomalyDomain = np.empty(intervalMean.shape[0])
-    for n, interval in enumerate(intervalMean):
-        idx_interval = n%NoI
-        intervalAnomalyDomain[n] = np.ma.mean(interval, dtype=float) - np.ma.mean(clima[idx_interval], dtype=float)
-    #intervalAnomalyDomain = np.ma.masked_where(intervalAnomalyDomain==0, intervalAnomalyDomain)
+    # Calculate the anomaly of each interval against the climatology of the 
+    # related calendar interval (e.g. all Januaries) and the domain mean of 
+    # those anomalies at once. For mor detailed information see
+    # sloth/analysis.py --> calc_anomalies()
+    anomalies = sloth.analysis.calc_anomalies(intervalMean.filled(fill_value=np.nan), 
+                                              climatology, dates=intervalTime,
+                                              domainMean=True)
+    intervalAnomalyDomain = anomalies['domainMean']
     # dump anomalies
     with open(f'../data/example_ClimateMeans/IntervalyAnomalies_{meanInterval}.npy', 'wb') as f:
         np.save(f, intervalAnomalyDomain)
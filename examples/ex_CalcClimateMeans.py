@@ -10,12 +10,13 @@ The correct slicing depends on the actual data we are facing as e.g. the
 starting time step and the time resolution (hours, daily, monthly, or even 
 yearly data?). Individual datasets need individual treatment.
 
-This example make use of the function 'get_intervalSlice()' which aims to 
-generalize the progress to get the correct slices or intervals.
+This example make use of the function 'calc_intervalStats()' which is based on 
+'get_intervalSlice()' and aims to generalize the progress to get the correct 
+slices or intervals.
 Mandatory for this purpose is, the handled data does contain the correct 
 time information, as e.g. the correct time-variables with netCDF files.
-If this is the case the function does loop over all your dates and returns
-a list of slices to extract the correct intervals out of your data. If you 
+If this is the case the function does calculate the intervals out of your 
+dates and returns the mean of each interval. If you 
 data-set does consist out of individual files or is represented by one big 
 file does not matter.
 """
@@ -31,6 +32,8 @@ import cftime
 sloth_path='../'
 sys.path.append(sloth_path)
 import sloth.toolBox
+import sloth.analysis
+import sloth.Climatology
 import sloth.PlotLib
 
 
@@ -74,51 +77,27 @@ NoI = 12
 # (np.append()) at each iteration step.
 tmp_IntervalMean = []
 tmp_IntervalTime = []
+# The climatology is accumulated file by file, so it is independent of how 
+# many years the data-set does cover. See sloth/Climatology.py
+climatology = sloth.Climatology.Climatology(sliceInterval=meanInterval)
 # Loop over all files of our data-set.
 for file in files:
-    # Open the file and read in data and time
-    with nc.Dataset(file, 'r') as nc_file:
-        data  = nc_file.variables[varName]
-        print(f'data.shape: {data.shape}')
-        # Extract data, units, time, etc for later usage.
-        data         = data[...]
-        nc_time      = nc_file.variables['time']
-        calendar     = nc_time.calendar
-        dates        = nc.num2date(nc_time[:],units=nc_time.units,calendar=nc_time.calendar)
-        timeValues   = nc_time[:]
-        timeCalendar = nc_time.calendar
-        timeUnits    = nc_time.units
-
-    # Calculate the slices for the current file based on the choose meanInterval
-    # For mor detailed information about how get_intervalSlice() does work, see
+    # Calculate the interval means for the current file based on the choose 
+    # meanInterval. The data are read in time chunks and only running sums 
+    # are kept in memory, so the memory usage does not depend on the file 
+    # size. For mor detailed information see
+    # sloth/analysis.py --> calc_intervalStats() and
     # sloth/toolBox.py --> get_intervalSlice()
-    Slices = sloth.toolBox.get_intervalSlice(dates=dates, sliceInterval=meanInterval)
-    # Loop over all slices, mask 'missing' values with np.nan, and calculate 
-    # related mean. The averaged data gets appended for each file and slice.
-    for Slice in Slices:
-        tmp_time     = timeValues[Slice]
-        #tmp_time     = tmp_time.filled(fill_value=np.nan)
-        tmp_var      = data[Slice]
-        #tmp_var_mask = tmp_var.mask
-        #if not tmp_var_mask.any():
-        #    tmp_var_mask  = np.zeros(tmp_var.shape, dtype=bool)
-        #tmp_var       = tmp_var.filled(fill_value=np.nan)
-
-        # tmp_timeMean  = np.nanmean(tmp_time, axis=0, keepdims=True)
-        tmp_timeMean  = np.ma.mean(tmp_time, axis=0, keepdims=True)
-        tmp_timeMean  = nc.num2date(tmp_timeMean, units=timeUnits,calendar=timeCalendar)
-        # tmp_monthMean = np.nanmean(tmp_var, axis=0, keepdims=True, dtype=float)
-        tmp_monthMean = np.ma.mean(tmp_var, axis=0, keepdims=True, dtype=float)
-
-        tmp_IntervalMean.append(tmp_monthMean)
-        tmp_IntervalTime.append(tmp_timeMean)
-        print(f'len(tmp_IntervalMean): {len(tmp_IntervalMean)}')
-
+    stats = sloth.analysis.calc_intervalStats(file, varName=varName, 
+                                              sliceInterval=meanInterval, 
+                                              stats=['mean'])
+    tmp_IntervalMean.append(stats['mean'])
+    tmp_IntervalTime.append(stats['time'])
+    climatology.update(stats['mean'], dates=stats['time'])
+    print(f'len(tmp_IntervalMean): {len(tmp_IntervalMean)}')
 
-    print('##################')
-    print('##################')
 intervalMean = np.concatenate(tmp_IntervalMean, axis=0)
-intervalMean = np.ma.masked_where(intervalMean==0, intervalMean)
+intervalMean = np.ma.masked_invalid(intervalMean)
 print(f'intervalMean.shape: {intervalMean.shape}')
 intervalTime = np.concatenate(tmp_IntervalTime, axis=0)
 # save everything for later use         
@@ -127,22 +106,22 @@ if not os.path.exists(f'../data/example_ClimateMeans/'):
 with open(f'../data/example_ClimateMeans/intervalMean_{meanInterval}.npy', 'wb') as f:
     np.save(f, intervalMean.filled(fill_value=-9999))
 with open(f'../data/example_ClimateMeans/intervalTime_{meanInterval}.npy', 'wb') as f:
-    np.save(f, intervalTime.filled(fill_value=-9999))
+    np.save(f, intervalTime)
 
 
-# First create an empty array of same shape as intervalMean but with 
-# t-dim (0-axis) = NoI
-climaDim = [NoI]    
-climaDim = climaDim + [dim for dim in intervalMean[0].shape]
-clima = np.empty(climaDim)
-    
-for curr_Interval in range(NoI):
-    # The climat mean is simple the mean of all entries with NoI in distance.
-    clima[curr_Interval] = np.ma.mean(intervalMean[curr_Interval::NoI], axis=0, dtype=float)        
-clima = np.ma.masked_where(clima==0, clima)
+# The climate mean is simple the mean of all intervals belonging to the same
+# calendar interval (e.g. all Januaries). Climatology does take care to 
+# assign each interval to the correct calendar interval, also if the 
+# data-set does not start with the first interval of a year.
+clima = climatology.get_mean()
+clima = np.ma.masked_invalid(clima)
 # dump climate data
 with open(f'../data/example_ClimateMeans/climate_{meanInterval}.npy', 'wb') as f:
     np.save(f, clima.filled(fill_value=-9999))
+# dump the full climatology (count, mean, variance, min, max) as well, which 
+# could be loaded with sloth.Climatology.Climatology.load() and extended 
+# later on
+climatology.save(f'../data/example_ClimateMeans/climatology_{meanInterval}.npz')
 
 # plot if meanInterval='month'
 if meanInterval == 'month':
@@ -30,11 +30,20 @@ slopeFileY    = f'{dataRootDir}/{datasetName}/geo/ParFlow_MB3km_SLPY_x1592y1544.
 ###############################################################################
 ### Read in data
 ###############################################################################
-with nc.Dataset(dischargeFile,'r') as ncFile:
-    Q = ncFile.variables['flow'][...]
-
-print(f'Q.shape: {Q.shape}')
-SimMeanQ = np.ma.mean(Q, axis=0)
+# The discharge is not read at once, but the temporal mean is accumulated 
+# chunk by chunk, so the memory needed is bound by the chunk size.
+# For mor detailed information about how iter_timeChunks() does work, see
+# sloth/IO.py --> iter_timeChunks()
+QSum   = None
+for tStart, chunk in sloth.IO.iter_timeChunks(dischargeFile, varName='flow'):
+    if QSum is None:
+        QSum   = np.zeros(chunk.shape[1:])
+        QCount = np.zeros(chunk.shape[1:], dtype=np.int64)
+    # masked values are returned as NaN
+    valid   = ~np.isnan(chunk)
+    QSum   += np.where(valid, chunk, 0.).sum(axis=0)
+    QCount += valid.sum(axis=0)
+SimMeanQ = np.ma.masked_where(QCount == 0, QSum / np.maximum(QCount, 1))
 print(f'SimMeanQ.shape: {SimMeanQ.shape}')
 
 with nc.Dataset(CoordFile,'r') as ncFile:
@@ -110,3 +119,30 @@ MapBestCatchment_Y = Mapper.MapYIdx_fit
 print(f'MeanArea:')
 print(f'Mapper.ObsMeanArea: {Mapper.ObsMeanArea}')
 print(f'Mapper.SimMeanArea: {Mapper.SimMeanArea}')
+
+###############################################################################
+### Read simulated discharge at mapped pixel only
+###############################################################################
+# For mor detailed information about how get_SimSeries() does work, see
+# sloth/mapper.py --> get_SimSeries()
+with nc.Dataset(dischargeFile,'r') as ncFile:
+    ncTime  = ncFile.variables['time']
+    SimDates = nc.num2date(ncTime[...], units=ncTime.units, calendar=ncTime.calendar,
+                           only_use_cftime_datetimes=False)
+SimSeries = Mapper.get_SimSeries(dischargeFile, varName='flow', dates=SimDates,
+                                 alignDates=GRDC_example.time, sliceInterval='month')
+print(f'SimSeries.shape: {SimSeries.shape} vs GRDC_example.data.shape: {GRDC_example.data.shape}')
+
+###############################################################################
+### Compare simulated and observed discharge at each station
+###############################################################################
+bothValid = ~np.isnan(SimSeries) & ~np.isnan(GRDC_example.data)
+for idx, ObsID in enumerate(GRDC_example.id):
+    sim = SimSeries[idx][bothValid[idx]]
+    obs = GRDC_example.data[idx][bothValid[idx]]
+    if sim.size < 2:
+        print(f'{ObsID}: not enough common data-points')
+        continue
+    bias = np.mean(sim - obs)
+    corr = np.corrcoef(sim, obs)[0, 1]
+    print(f'{ObsID}: bias {bias:.2f} m^3/s, correlation {corr:.2f}')
@@ -0,0 +1,241 @@
+import numpy as np
+
+from . import toolBox
+
+
+class Climatology():
+    ''' Class aimed to accumulate a climatology out of interval means.
+
+    A climatology is the mean (and variance, min, max) of the same calendar
+    interval over many years, e.g. the mean of all Januaries. Instead of
+    stacking all interval means of the entire run (n_years x NoI x ny x nx)
+    and slicing them with `intervalMean[i::NoI]`, this class does hold only
+    per calendar interval running statistics, which are updated with each
+    new set of interval means. So the memory needed is independent of the
+    length of the run.
+
+    Mean and variance are updated with the algorithm of Welford, extended
+    by Chan et al. for merging whole batches, which is numerically stable
+    also for long runs (no sum of squares is accumulated). For each
+    calendar interval the following (per pixel) ndarrays are kept:
+    -) count: number of valid (not NaN) interval means
+    -) mean:  running mean (0 where count is 0)
+    -) M2:    running sum of squared differences from the mean
+    -) min, max: running minimum and maximum
+    Two climatologies could be merged (see merge()), e.g. if different
+    periods were processed by different workers, and a climatology could
+    be saved and loaded again (see save() and load()).
+
+    Example
+    -------
+    >>> clima = Climatology(sliceInterval='month')
+    >>> for file in files:
+    ...     results = sloth.analysis.calc_intervalStats(file, varName='TSA')
+    ...     clima.update(results['mean'], dates=results['time'])
+    >>> clima.get_mean().shape
+    (12, 412, 424)
+    '''
+
+    ###########################################################################
+    ############################# Definition ##################################
+    ###########################################################################
+    def __init__(self, sliceInterval='month'):
+        ''' Default constructor of Climatology-class
+
+        Parameters
+        ----------
+        sliceInterval : str
+            the interval the climatology is based on. Supported are: 'hour',
+            'day', 'pentad', 'month', 'season', 'year', and 'diurnal' (see
+            toolBox.get_calendarIndex()).
+        '''
+        self.sliceInterval = sliceInterval
+        _, self.NoI        = toolBox.get_calendarIndex({'month': np.array([1]),
+                                                        'day':   np.array([1]),
+                                                        'hour':  np.array([0])},
+                                                       sliceInterval=sliceInterval)
+        # the accumulators are allocated with the first update, once the
+        # spatial shape is known
+        self.count = None
+        self.mean  = None
+        self.M2    = None
+        self.min   = None
+        self.max   = None
+
+    ###########################################################################
+    ########################## Auxiliary tools ################################
+    ###########################################################################
+    def __allocate(self, shape):
+        ''' Allocate the accumulators for the given spatial shape '''
+        fullShape  = (self.NoI,) + tuple(shape)
+        self.count = np.zeros(fullShape, dtype=np.int64)
+        self.mean  = np.zeros(fullShape, dtype=np.float64)
+        self.M2    = np.zeros(fullShape, dtype=np.float64)
+        self.min   = np.full(fullShape, np.nan, dtype=np.float64)
+        self.max   = np.full(fullShape, np.nan, dtype=np.float64)
+
+    def __combine(self, slots, count, mean, M2, vmin, vmax):
+        ''' Merge batch statistics into the accumulators of given slots '''
+        countA = self.count[slots]
+        meanA  = self.mean[slots]
+        total  = countA + count
+        delta  = mean - meanA
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fracB = np.where(total > 0, count / total, 0.)
+        self.mean[slots]  = meanA + delta * fracB
+        self.M2[slots]    = self.M2[slots] + M2 + delta**2 * countA * fracB
+        self.count[slots] = total
+        self.min[slots]   = np.fmin(self.min[slots], vmin)
+        self.max[slots]   = np.fmax(self.max[slots], vmax)
+
+    ###########################################################################
+    ########################### Core functions ################################
+    ###########################################################################
+    def update(self, data, dates=None, index=None):
+        ''' Add interval means to the climatology.
+
+        Parameters
+        ----------
+        data : ndarray
+            Interval means with the interval as first axis (e.g. as returned
+            by analysis.calc_intervalStats()). Masked values and NaN are
+            ignored.
+        dates : NDarray, optional
+            The date of each interval, used to derive the calendar index
+            (see toolBox.get_calendarIndex()).
+        index : NDarray, optional
+            The calendar index of each interval (0 <= index < NoI). Could
+            be passed instead of dates.
+
+        Returns
+        -------
+        None
+        '''
+        if index is None:
+            if dates is None:
+                print(f'ERROR: either dates or index has to be passed')
+                return None
+            index, _ = toolBox.get_calendarIndex(np.asarray(dates), sliceInterval=self.sliceInterval)
+        index = np.asarray(index, dtype=np.int64)
+        if np.ma.isMaskedArray(data):
+            data = data.astype(np.float64).filled(fill_value=np.nan)
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape[0] != index.shape[0]:
+            print(f'ERROR: data.shape[0] {data.shape[0]} != number of intervals {index.shape[0]}')
+            return None
+        if index.shape[0] == 0:
+            return None
+        if index.min() < 0 or index.max() >= self.NoI:
+            print(f'ERROR: index out of range [0, {self.NoI})')
+            return None
+        if self.count is None:
+            self.__allocate(data.shape[1:])
+        elif data.shape[1:] != self.count.shape[1:]:
+            print(f'ERROR: data.shape[1:] {data.shape[1:]} != climatology shape {self.count.shape[1:]}')
+            return None
+
+        # group the passed intervals by calendar index and calculate the
+        # batch statistics of all groups at once
+        order  = np.argsort(index, kind='stable')
+        index  = index[order]
+        data   = data[order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(index)) + 1])
+        sizes  = np.diff(np.concatenate([starts, [index.size]]))
+        slots  = index[starts]
+
+        valid = ~np.isnan(data)
+        count = np.add.reduceat(valid, starts, axis=0, dtype=np.int64)
+        total = np.add.reduceat(np.where(valid, data, 0.), starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0.)
+        dev  = np.where(valid, data - np.repeat(mean, sizes, axis=0), 0.)
+        M2   = np.add.reduceat(dev**2, starts, axis=0)
+        vmin = np.fmin.reduceat(data, starts, axis=0)
+        vmax = np.fmax.reduceat(data, starts, axis=0)
+
+        self.__combine(slots, count, mean, M2, vmin, vmax)
+
+    def merge(self, other):
+        ''' Merge another climatology into this one.
+
+        Parameters
+        ----------
+        other : Climatology
+            A climatology of the same sliceInterval and spatial shape, e.g.
+            calculated by another worker for another period.
+
+        Returns
+        -------
+        self : Climatology
+        '''
+        if other.sliceInterval != self.sliceInterval:
+            print(f'ERROR: cannot merge sliceInterval "{other.sliceInterval}" into "{self.sliceInterval}"')
+            return self
+        if other.count is None:
+            return self
+        if self.count is None:
+            self.__allocate(other.count.shape[1:])
+        elif other.count.shape != self.count.shape:
+            print(f'ERROR: cannot merge shape {other.count.shape} into {self.count.shape}')
+            return self
+        slots = np.arange(self.NoI)
+        self.__combine(slots, other.count, other.mean, other.M2, other.min, other.max)
+        return self
+
+    def get_mean(self):
+        ''' Return the climatological mean, NaN where no valid value was found '''
+        if self.count is None:
+            return None
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    def get_var(self, ddof=1):
+        ''' Return the variance of the interval means around the climatological mean.
+
+        Parameters
+        ----------
+        ddof : int
+            Delta degrees of freedom, the divisor used is count - ddof
+            (default is 1, the sample variance). NaN is returned where
+            count <= ddof.
+        '''
+        if self.count is None:
+            return None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.M2 / (self.count - ddof), np.nan)
+
+    def get_std(self, ddof=1):
+        ''' Return the standard deviation, see get_var() '''
+        if self.count is None:
+            return None
+        return np.sqrt(self.get_var(ddof=ddof))
+
+    def save(self, filename):
+        ''' Save the climatology to a .npz file, see load()
+
+        The extension .npz is appended to filename if missing.
+        '''
+        if self.count is None:
+            print(f'ERROR: climatology is empty and therefore not saved')
+            return None
+        np.savez(toolBox.get_npzFile(filename), sliceInterval=self.sliceInterval,
+                 count=self.count, mean=self.mean, M2=self.M2,
+                 min=self.min, max=self.max)
+
+    @classmethod
+    def load(cls, filename):
+        ''' Load a climatology saved with save()
+
+        The extension .npz is appended to filename if missing.
+
+        Returns
+        -------
+        Climatology
+        '''
+        with np.load(toolBox.get_npzFile(filename)) as stored:
+            clima       = cls(sliceInterval=str(stored['sliceInterval']))
+            clima.count = stored['count']
+            clima.mean  = stored['mean']
+            clima.M2    = stored['M2']
+            clima.min   = stored['min']
+            clima.max   = stored['max']
+        return clima
@@ -472,3 +472,265 @@ def writeSa(file, data):
             for j in range(ny):
                 for i in range(nx):
                     f.write(f'{data[k,j,i]}\n')
+
+################################################################################
+############################# chunked reading ##################################
+################################################################################
+
+def get_timeChunkSize(var, maxBytes=2**28):
+    """
+    Return a time chunk size aligned to the storage chunking of a variable.
+
+    The returned number of time-steps is a multiple of the time-chunking of
+    the passed netCDF variable (if chunked), and is chosen as large as possible
+    while one chunk of data stays below `maxBytes`.
+
+    Parameters
+    ----------
+    var : netCDF4.Variable or ndarray
+        The (lazy) variable to read in chunks. The time-axis is expected to be
+        the first axis.
+    maxBytes : int, optional
+        Upper limit of memory one chunk should occupy (default is 256 MB).
+
+    Returns
+    -------
+    int
+        Number of time-steps to read at once.
+
+    """
+    nt = var.shape[0]
+    # bytes of one time-step; chunks are returned as float64 by default,
+    # so count 8 bytes per value independent of the on-disk dtype.
+    stepBytes = 8 * int(np.prod(var.shape[1:], dtype=np.int64))
+    # take storage chunking into account (netCDF4 only)
+    align = 1
+    if hasattr(var, 'chunking'):
+        chunking = var.chunking()
+        if isinstance(chunking, (list, tuple)) and chunking[0] > 0:
+            align = int(chunking[0])
+    nSteps = max(1, maxBytes // max(stepBytes, 1))
+    # round down to a multiple of the storage chunking
+    nSteps = max(align, (nSteps // align) * align)
+    return int(min(nSteps, nt)) if nt > 0 else 1
+
+def iter_timeChunks(source, chunkSize=None, varName=None, layer=None,
+        dtype=np.float64):
+    """
+    Iterate over a 3D (or 4D) time-series in blocks of time-steps.
+
+    This generator reads a (t, ...) time-series piece by piece, so the entire
+    series never has to be in memory at once. Supported sources are
+
+    - an in memory ndarray (or masked array) with time as first axis,
+    - a netCDF4.Variable (or any lazy object supporting `shape` and slicing),
+    - a path to a netCDF file, in which case `varName` is required,
+    - a list of PFB files, where each file holds one time-step.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series to read.
+    chunkSize : int, optional
+        Number of time-steps per chunk. If None, the chunk size is derived
+        with `get_timeChunkSize()` (aligned to the netCDF storage chunking),
+        or set to 1 for PFB files.
+    varName : str, optional
+        Name of the variable to read if `source` is a netCDF file.
+    layer : int, optional
+        Select one layer of the second axis, e.g. the upper most layer of a
+        ParFlow pressure (`layer=-1`). For PFB series this is the z-axis of
+        the individual files.
+    dtype : dtype, optional
+        The dtype of the returned chunks (default is np.float64). Masked
+        values are returned as NaN.
+
+    Yields
+    ------
+    tStart : int
+        Index of the first time-step of the chunk in the entire series.
+    chunk : ndarray
+        Data of the current chunk with time as first axis.
+
+    If `source` is a netCDF file and `varName` is not passed or not found,
+    an error is printed and nothing is yielded.
+
+    Examples
+    --------
+    >>> for tStart, chunk in iter_timeChunks('TSA.nc', varName='TSA'):
+    ...     print(tStart, chunk.shape)
+
+    """
+    # list of PFB files
+    if isinstance(source, (list, tuple)):
+        chunkSize = 1 if chunkSize is None else chunkSize
+        for tStart in range(0, len(source), chunkSize):
+            chunk = np.stack([read_pfb(pfbFile) for pfbFile
+                              in source[tStart:tStart+chunkSize]])
+            if layer is not None:
+                chunk = chunk[:, layer]
+            yield tStart, chunk.astype(dtype)
+        return
+
+    # path to netCDF file
+    if isinstance(source, str):
+        if varName is None:
+            print(f'ERROR: varName is required to read {source} --> EXIT')
+            return
+        with nc.Dataset(source, 'r') as nc_file:
+            if varName not in nc_file.variables:
+                print(f'ERROR: variable {varName} not found in {source} --> EXIT')
+                return
+            yield from iter_timeChunks(nc_file.variables[varName],
+                    chunkSize=chunkSize, layer=layer, dtype=dtype)
+        return
+
+    # ndarray or lazy netCDF4.Variable
+    if chunkSize is None:
+        chunkSize = get_timeChunkSize(source)
+    nt = source.shape[0]
+    for tStart in range(0, nt, chunkSize):
+        if layer is None:
+            chunk = source[tStart:tStart+chunkSize]
+        else:
+            chunk = source[tStart:tStart+chunkSize, layer]
+        if np.ma.isMaskedArray(chunk):
+            chunk = chunk.astype(dtype).filled(fill_value=np.nan)
+        yield tStart, np.asarray(chunk, dtype=dtype)
+
+def get_pointBoxes(y, x, boxSize=32):
+    """
+    Coalesce nearby points into shared bounding boxes.
+
+    The grid is divided into tiles of boxSize x boxSize pixel, and all points
+    within the same tile are grouped. Each group is described by the bounding
+    box of its points, which is never larger than one tile. Reading one box 
+    per group instead of one pixel per point does reduce the number of read 
+    calls a lot, while the data read stays small.
+
+    Parameters
+    ----------
+    y : ndarray
+        1D ndarray of the y-index of each point.
+    x : ndarray
+        1D ndarray of the x-index of each point.
+    boxSize : int, optional
+        The edge length of the tiles in pixel (default is 32).
+
+    Returns
+    -------
+    list of tuple
+        One tuple (y0, y1, x0, x1, members) per box, where y0:y1 and x0:x1 
+        are the slices of the box and members are the indices of the points
+        within the box.
+
+    """
+    y = np.asarray(y, dtype=np.int64)
+    x = np.asarray(x, dtype=np.int64)
+    tileKeys = np.stack([y // boxSize, x // boxSize], axis=1)
+    _, groupIdx = np.unique(tileKeys, axis=0, return_inverse=True)
+    groupIdx = groupIdx.ravel()
+    order = np.argsort(groupIdx, kind='stable')
+    starts = np.flatnonzero(np.diff(groupIdx[order], prepend=-1))
+    boxes = []
+    for members in np.split(order, starts[1:]):
+        boxes.append((int(y[members].min()), int(y[members].max()) + 1,
+                      int(x[members].min()), int(x[members].max()) + 1,
+                      members))
+    return boxes
+
+def read_pointSeries(source, y, x, varName=None, layer=None, chunkSize=None,
+        boxSize=32, dtype=np.float64):
+    """
+    Read the time-series of individual points out of a (t, y, x) source.
+
+    Instead of reading the entire field, only the bounding boxes of nearby
+    points are read (see `get_pointBoxes()`), chunk-wise along the time-axis.
+    So the memory needed is bound by the returned series. Supported sources
+    are the same as for `iter_timeChunks()`. PFB files do not support 
+    partial reads, so each file is read at once, but only the points are 
+    kept.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series to read.
+    y : ndarray
+        1D ndarray of the y-index of each point.
+    x : ndarray
+        1D ndarray of the x-index of each point.
+    varName : str, optional
+        Name of the variable to read if `source` is a netCDF file.
+    layer : int, optional
+        Select one layer of the second axis (see `iter_timeChunks()`). If 
+        None (default), the upper most layer (-1) is selected for 4D sources
+        (t, z, y, x) and for PFB files (each holding z, y, x), e.g. the 
+        surface of 3D pressure or saturation files.
+    chunkSize : int, optional
+        Number of time-steps read at once. If None, the chunk size is derived
+        with `get_timeChunkSize()`.
+    boxSize : int, optional
+        Edge length of the tiles points are grouped into (see 
+        `get_pointBoxes()`).
+    dtype : dtype, optional
+        The dtype of the returned series (default is np.float64). Masked
+        values are returned as NaN.
+
+    Returns
+    -------
+    ndarray
+        2D ndarray of shape (n_points, t).
+
+    Examples
+    --------
+    >>> series = read_pointSeries('discharge.nc', mapper.MapYIdx_fit,
+    ...                           mapper.MapXIdx_fit, varName='flow')
+
+    """
+    y = np.asarray(y, dtype=np.int64)
+    x = np.asarray(x, dtype=np.int64)
+    if y.shape != x.shape or y.ndim != 1:
+        print(f'ERROR: y {y.shape} and x {x.shape} have to be 1D and of same shape')
+        return None
+
+    # list of PFB files
+    if isinstance(source, (list, tuple)):
+        layer  = -1 if layer is None else layer
+        series = np.empty((y.size, len(source)), dtype=dtype)
+        for t, pfbFile in enumerate(source):
+            series[:, t] = read_pfb(pfbFile)[layer, y, x]
+        return series
+
+    # path to netCDF file
+    if isinstance(source, str):
+        if varName is None:
+            print(f'ERROR: varName is required to read {source} --> EXIT')
+            return None
+        with nc.Dataset(source, 'r') as nc_file:
+            if varName not in nc_file.variables:
+                print(f'ERROR: variable {varName} not found in {source} --> EXIT')
+                return None
+            return read_pointSeries(nc_file.variables[varName], y, x,
+                    layer=layer, chunkSize=chunkSize, boxSize=boxSize,
+                    dtype=dtype)
+
+    # ndarray or lazy netCDF4.Variable
+    if layer is None and len(source.shape) == 4:
+        layer = -1
+    if chunkSize is None:
+        chunkSize = get_timeChunkSize(source)
+    nt = source.shape[0]
+    boxes = get_pointBoxes(y, x, boxSize=boxSize)
+    series = np.empty((y.size, nt), dtype=dtype)
+    for tStart in range(0, nt, chunkSize):
+        tSlice = slice(tStart, tStart + chunkSize)
+        for y0, y1, x0, x1, members in boxes:
+            if layer is None:
+                box = source[tSlice, y0:y1, x0:x1]
+            else:
+                box = source[tSlice, layer, y0:y1, x0:x1]
+            if np.ma.isMaskedArray(box):
+                box = box.astype(dtype).filled(fill_value=np.nan)
+            box = np.asarray(box, dtype=dtype)
+            series[members, tSlice] = box[:, y[members] - y0, x[members] - x0].T
+    return series
@@ -0,0 +1,375 @@
+import numpy as np
+
+from . import toolBox
+
+
+class IntervalAggregator():
+    ''' Class aimed to calculate interval statistics of streamed time-series.
+
+    Calculating e.g. monthly means out of hourly model output usually means
+    to read in the entire data, to slice it into intervals (see
+    toolBox.get_intervalSlice()), and to apply np.mean() to each slice. This
+    does keep at least one full interval of the 3D time-series in memory.
+
+    This class does the same but accumulates running sums, counts, minima,
+    and maxima per interval instead. Data could be passed chunk by chunk
+    (any number of time-steps, not aligned to the intervals) with update(),
+    so the memory needed is bound by the chunk size and not by the size of
+    the data or the length of the interval.
+
+    Each interval is hold as a so called record, a dict with the keys:
+    -) key:    the interval key (see toolBox.get_intervalKeys())
+    -) first:  date of the first time-step in the interval
+    -) last:   date of the last time-step in the interval
+    -) nSteps: number of time-steps in the interval
+    -) sum, count, min, max: accumulated (per pixel) ndarrays, as far as
+               needed for the requested stats
+    Records with the same key could be merged (see mergeRecords()), what
+    allows to combine partial intervals, e.g. read from different files.
+
+    Time-steps are assigned to intervals with toolBox.get_intervalGroups(),
+    so each chunk is sorted and cleaned from duplicates first. Time-steps 
+    not later than the last time-step already passed (e.g. the overlap 
+    written again after a restart) are dropped. An interval is complete if
+    it holds the number of time-steps expected from its length and the 
+    dumpInterval (see toolBox.get_intervalExpected()), so missing 
+    time-steps within the series are flagged as well.
+
+    Finished intervals are kept in self.records until get_results() is 
+    called. To keep the memory bound for long time-series, pass onClose 
+    instead: each interval is then passed to onClose once it is closed and
+    is not kept, so only the open interval is hold in memory.
+
+    Example
+    -------
+    >>> aggregator = IntervalAggregator(sliceInterval='month', stats=['mean', 'max'])
+    >>> for tStart, chunk in sloth.IO.iter_timeChunks(var):
+    ...     aggregator.update(chunk, dates[tStart:tStart+chunk.shape[0]])
+    >>> results = aggregator.get_results()
+    >>> results['mean'].shape
+    (12, 412, 424)
+
+    >>> def write(result):
+    ...     ncMean[result['key'] - firstKey] = result['mean']
+    >>> aggregator = IntervalAggregator(sliceInterval='month', onClose=write)
+    '''
+
+    supportedStats = ['mean', 'sum', 'min', 'max', 'count']
+
+    ###########################################################################
+    ############################# Definition ##################################
+    ###########################################################################
+    def __init__(self, sliceInterval='month', stats=('mean',), startAfter=None,
+            onClose=None):
+        ''' Default constructor of IntervalAggregator-class
+
+        Parameters
+        ----------
+        sliceInterval : str
+            defining the interval. Supported are: 'hour', 'day', 'pentad',
+            'month', 'season', 'year'
+        stats : list of str
+            the statistics to calculate per interval. Supported are: 'mean',
+            'sum', 'min', 'max', 'count' (number of valid values per pixel).
+        startAfter : datetime, cftime, or np.datetime64, optional
+            Time-steps not later than startAfter are dropped, e.g. to skip
+            the overlap with a previous aggregation.
+        onClose : callable, optional
+            Called with the result of each interval once it is closed (see
+            get_result()), e.g. to write it to disk. Closed intervals are 
+            then not kept in memory.
+        '''
+        for stat in stats:
+            if stat not in self.supportedStats:
+                print(f'ERROR: stat "{stat}" is not supported and therefore skipped.')
+                print(f'---    supported values are: {self.supportedStats}')
+        self.sliceInterval = sliceInterval
+        self.stats         = [stat for stat in stats if stat in self.supportedStats]
+
+        # finished intervals, if not passed to onClose
+        self.records       = []
+        self.onClose       = onClose
+        # currently open interval, which might continue with the next chunk
+        self.openRecord    = None
+        # dumpInterval of the time-series, derived from the passed dates
+        self.dumpInterval  = None
+        # last time-step passed, later time-steps only are accepted
+        self.lastDate      = startAfter
+
+    ###########################################################################
+    ########################## Auxiliary tools ################################
+    ###########################################################################
+    def __needs(self):
+        ''' Return the accumulators needed for the requested stats '''
+        needs = set()
+        for stat in self.stats:
+            if stat in ['mean', 'sum', 'count']:
+                needs.update(['sum', 'count'])
+            else:
+                needs.add(stat)
+        return needs
+
+    def __push(self, record):
+        ''' Append a record, merging it with the open record if continued '''
+        if self.openRecord is not None and self.openRecord['key'] == record['key']:
+            record = self.mergeRecords(self.openRecord, record)
+        elif self.openRecord is not None:
+            self.__close(self.openRecord)
+        self.openRecord = record
+
+    def __close(self, record):
+        ''' Pass a finished record to onClose, or keep it '''
+        if self.onClose is None:
+            self.records.append(record)
+        else:
+            self.onClose(self.get_result(record))
+
+    @staticmethod
+    def mergeRecords(rec1, rec2):
+        ''' Merge two records of the same interval.
+
+        rec2 is expected to follow rec1 in time.
+
+        Returns
+        -------
+        dict
+            The merged record
+        '''
+        merged = {
+            'key':    rec1['key'],
+            'first':  rec1['first'],
+            'last':   rec2['last'],
+            'nSteps': rec1['nSteps'] + rec2['nSteps'],
+        }
+        if 'sum' in rec1:
+            merged['sum']   = rec1['sum'] + rec2['sum']
+            merged['count'] = rec1['count'] + rec2['count']
+        if 'min' in rec1:
+            merged['min'] = np.fmin(rec1['min'], rec2['min'])
+        if 'max' in rec1:
+            merged['max'] = np.fmax(rec1['max'], rec2['max'])
+        return merged
+
+    ###########################################################################
+    ########################### Core functions ################################
+    ###########################################################################
+    def update(self, data, dates):
+        ''' Add a chunk of data to the running interval statistics.
+
+        Parameters
+        ----------
+        data : ndarray
+            The chunk of data with time as first axis. Masked values and
+            NaN are ignored.
+        dates : NDarray
+            The dates related to each time-step of data (datetime, cftime,
+            or np.datetime64).
+
+        Returns
+        -------
+        None
+        '''
+        dates = np.asarray(dates)
+        if data.shape[0] != dates.shape[0]:
+            print(f'ERROR: data.shape[0] {data.shape[0]} != dates.shape[0] {dates.shape[0]}')
+            return None
+        if dates.shape[0] == 0:
+            return None
+        if np.ma.isMaskedArray(data):
+            data = data.astype(float).filled(fill_value=np.nan)
+
+        # drop time-steps already passed, e.g. the overlap after a restart
+        if self.lastDate is not None:
+            newer = np.asarray(dates > self.lastDate, dtype=bool)
+            if not newer.all():
+                print(f'WARNING: {np.count_nonzero(~newer)} time-steps not later than {self.lastDate} are dropped')
+                data  = data[newer]
+                dates = dates[newer]
+                if dates.shape[0] == 0:
+                    return None
+
+        # derive the dumpInterval from the open record or the chunk itself
+        if self.dumpInterval is None and self.openRecord is not None:
+            self.dumpInterval = dates.min() - self.openRecord['last']
+        if self.dumpInterval is None and np.unique(dates).shape[0] < 2:
+            # a single time-step, which could be grouped without dumpInterval
+            groups = {
+                'index':  np.array([0]),
+                'bounds': np.array([0, 1]),
+                'key':    toolBox.get_intervalKeys(dates[:1], sliceInterval=self.sliceInterval),
+            }
+        else:
+            groups = toolBox.get_intervalGroups(dates, sliceInterval=self.sliceInterval,
+                                                dumpInterval=self.dumpInterval)
+            self.dumpInterval = groups['dumpInterval']
+        data   = data[groups['index']]
+        dates  = dates[groups['index']]
+        keys   = groups['key']
+        starts = groups['bounds'][:-1]
+        stops  = groups['bounds'][1:]
+        self.lastDate = dates[-1]
+
+        # accumulate all intervals of the chunk at once
+        needs = self.__needs()
+        accumulated = {}
+        if 'sum' in needs:
+            valid = ~np.isnan(data)
+            accumulated['sum']   = np.add.reduceat(np.where(valid, data, 0.), starts, axis=0)
+            accumulated['count'] = np.add.reduceat(valid, starts, axis=0, dtype=np.int32)
+        if 'min' in needs:
+            accumulated['min'] = np.fmin.reduceat(data, starts, axis=0)
+        if 'max' in needs:
+            accumulated['max'] = np.fmax.reduceat(data, starts, axis=0)
+
+        for i, (start, stop) in enumerate(zip(starts, stops)):
+            record = {
+                'key':    keys[i],
+                'first':  dates[start],
+                'last':   dates[stop-1],
+                'nSteps': int(stop - start),
+            }
+            for acc in accumulated:
+                record[acc] = accumulated[acc][i]
+            self.__push(record)
+
+    def add_records(self, records, dumpInterval=None):
+        ''' Add records of a previous aggregation.
+
+        This allows to combine the records of different aggregations, e.g.
+        records of individual files cached on disk (see get_records()). 
+        Records have to be added in temporal order, and a record continuing
+        the currently open interval is merged with it. Records not later 
+        than the last time-step already passed are dropped.
+
+        Parameters
+        ----------
+        records : list of dict
+            The records to add, as returned by get_records().
+        dumpInterval : timedelta, optional
+            The dumpInterval of the aggregation the records are taken from.
+        '''
+        if self.dumpInterval is None:
+            if dumpInterval is not None:
+                self.dumpInterval = dumpInterval
+            elif self.openRecord is not None and len(records) > 0:
+                self.dumpInterval = records[0]['first'] - self.openRecord['last']
+        for record in records:
+            if self.lastDate is not None and not record['last'] > self.lastDate:
+                print(f'WARNING: record ending {record["last"]} is not later than {self.lastDate} and dropped')
+                continue
+            if self.lastDate is not None and not record['first'] > self.lastDate:
+                print(f'WARNING: record starting {record["first"]} overlaps {self.lastDate}, time-steps might be counted twice')
+            self.__push(record)
+            self.lastDate = record['last']
+
+    def get_records(self):
+        ''' Close the open interval and return all records (see add_records()) '''
+        self.finalize()
+        return list(self.records)
+
+    def finalize(self):
+        ''' Close the currently open interval.
+
+        Call this after the last chunk was passed with update().
+        '''
+        if self.openRecord is not None:
+            self.__close(self.openRecord)
+            self.openRecord = None
+
+    def get_expected(self, records):
+        ''' Return the number of time-steps expected for each record.
+
+        See toolBox.get_intervalExpected(). None if the dumpInterval is 
+        unknown, e.g. if a single time-step was passed only.
+        '''
+        if self.dumpInterval is None or len(records) == 0:
+            return None
+        return toolBox.get_intervalExpected([rec['key'] for rec in records],
+                                            records[0]['first'], self.dumpInterval,
+                                            sliceInterval=self.sliceInterval)
+
+    def is_complete(self, record):
+        ''' Check if a record holds all time-steps expected for its interval '''
+        expected = self.get_expected([record])
+        if expected is None:
+            return False
+        return bool(record['nSteps'] >= expected[0])
+
+    def get_result(self, record):
+        ''' Return the interval statistics of a single record.
+
+        Same as get_results(), but for one interval and so without the 
+        interval as first axis.
+        '''
+        expected = self.get_expected([record])
+        if expected is None:
+            expected = np.zeros(1, dtype=np.int64)
+            complete = np.zeros(1, dtype=bool)
+        else:
+            complete = np.array([record['nSteps']]) >= expected
+        results = self.__stack([record], expected, complete)
+        return {key: value[0] for key, value in results.items()}
+
+    def get_results(self, skipIncomplete=True):
+        ''' Return the interval statistics of all finished intervals.
+
+        Intervals already passed to onClose are not included.
+
+        Parameters
+        ----------
+        skipIncomplete : bool
+            If True, incomplete intervals at the start and end of the
+            time-series are skipped (as with toolBox.get_intervalSlice()).
+            Incomplete intervals in between (with missing time-steps) are
+            kept, but flagged as not complete.
+
+        Returns
+        -------
+        results : dict
+            A dict holding the requested stats as ndarrays with the interval
+            as first axis (NaN where no valid value was found), and the keys
+            -) time:     center date of each interval
+            -) start:    date of the first time-step of each interval
+            -) key:      interval key of each interval
+            -) nSteps:   number of time-steps of each interval
+            -) expected: number of time-steps expected for each interval
+            -) complete: boolean ndarray, False for incomplete intervals
+        '''
+        self.finalize()
+        records  = self.records
+        expected = self.get_expected(records)
+        if expected is None:
+            expected = np.zeros(len(records), dtype=np.int64)
+            complete = np.zeros(len(records), dtype=bool)
+        else:
+            complete = np.array([rec['nSteps'] for rec in records]) >= expected
+        keep = np.ones(len(records), dtype=bool)
+        if skipIncomplete and len(records) > 0:
+            keep[0]  = complete[0]
+            keep[-1] = complete[-1]
+        records  = [rec for rec, isKept in zip(records, keep) if isKept]
+        return self.__stack(records, expected[keep], complete[keep])
+
+    def __stack(self, records, expected, complete):
+        ''' Calculate the requested stats of records, stacked along the first axis '''
+        results = {
+            'time':     np.array([rec['first'] + (rec['last'] - rec['first']) / 2 for rec in records]),
+            'start':    np.array([rec['first'] for rec in records]),
+            'key':      np.array([rec['key'] for rec in records], dtype=np.int64),
+            'nSteps':   np.array([rec['nSteps'] for rec in records], dtype=np.int64),
+            'expected': np.asarray(expected, dtype=np.int64),
+            'complete': np.asarray(complete, dtype=bool),
+        }
+        if len(records) == 0:
+            return results
+        for stat in self.stats:
+            if stat == 'mean':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    results['mean'] = np.stack([np.where(rec['count'] > 0, rec['sum'] / rec['count'], np.nan)
+                                                for rec in records])
+            elif stat == 'sum':
+                results['sum'] = np.stack([np.where(rec['count'] > 0, rec['sum'], np.nan)
+                                           for rec in records])
+            else:
+                results[stat] = np.stack([rec[stat] for rec in records])
+        return results
@@ -0,0 +1,358 @@
+import numpy as np
+
+from . import toolBox
+
+
+class QuantileClimatology():
+    ''' Class aimed to estimate per pixel quantiles of streamed time-series.
+
+    Quantiles like P10 / P50 / P90 calculated with np.percentile() need the
+    entire time-series of each pixel in memory. This class does keep a
+    fixed-size histogram (sketch) per pixel instead, which is updated chunk
+    by chunk, so the memory needed is O(pixels x nBins) and independent of
+    the number of time-steps.
+
+    Each histogram holds nBins bins of equal width, where the bin width is
+    a power of two and the lower edge is a multiple of the bin width. The
+    range of each pixel adapts to the data: if new values fall outside the
+    current range, the bin width is doubled (merging neighbouring bins)
+    until all values fit. As all bins are aligned to the same grid, two
+    sketches could be merged exactly (see merge()), e.g. if different
+    periods were processed by different workers.
+
+    Quantiles are interpolated linearly within the bin holding the
+    requested rank. The absolute error of each estimated quantile is
+    therefore at most the bin width of the related pixel, which is less
+    than 2 * (max - min) / nBins of the values seen by this pixel (see
+    get_errorBound()).
+
+    With sliceInterval set, one sketch per calendar interval (see
+    toolBox.get_calendarIndex()) and pixel is kept, e.g. to estimate the
+    quantiles of each month separately. Mind the memory: nBins=128 with
+    sliceInterval='month' on the EUR-11 grid (436 x 424) does need about
+    1.1 GB.
+
+    Example
+    -------
+    >>> sketch = QuantileClimatology(nBins=128)
+    >>> for tStart, chunk in sloth.IO.iter_timeChunks(pressFiles, chunkSize=24):
+    ...     sketch.update(chunk)
+    >>> P10, P50, P90 = sketch.get_quantiles([0.1, 0.5, 0.9])
+    '''
+
+    ###########################################################################
+    ############################# Definition ##################################
+    ###########################################################################
+    def __init__(self, nBins=128, sliceInterval=None):
+        ''' Default constructor of QuantileClimatology-class
+
+        Parameters
+        ----------
+        nBins : int
+            Number of histogram bins per pixel (an even number of at least
+            4). More bins give a smaller error but need more memory.
+        sliceInterval : str or None
+            If None (default), one sketch per pixel is kept for the entire
+            time-series. Otherwise one sketch per calendar interval and
+            pixel is kept. Supported are: 'hour', 'day', 'pentad', 'month',
+            'season', 'year', 'diurnal' (see toolBox.get_calendarIndex()).
+        '''
+        if nBins < 4 or nBins % 2 != 0:
+            print(f'ERROR: nBins has to be an even number >= 4, but is {nBins}; using 128')
+            nBins = 128
+        self.nBins         = int(nBins)
+        self.sliceInterval = sliceInterval
+        self.NoI           = 1
+        if sliceInterval is not None:
+            _, self.NoI = toolBox.get_calendarIndex({'month': np.array([1]),
+                                                     'day':   np.array([1]),
+                                                     'hour':  np.array([0])},
+                                                    sliceInterval=sliceInterval)
+        # the sketches are allocated with the first update, once the
+        # spatial shape is known. Each row is the sketch of one pixel (and
+        # calendar interval).
+        self.shape  = None
+        self.counts = None
+        self.lower  = None
+        self.width  = None
+        self.min    = None
+        self.max    = None
+
+    ###########################################################################
+    ########################## Auxiliary tools ################################
+    ###########################################################################
+    def __allocate(self, shape):
+        ''' Allocate the sketches for the given spatial shape '''
+        self.shape  = tuple(shape)
+        nRows       = self.NoI * int(np.prod(shape, dtype=np.int64))
+        self.counts = np.zeros((nRows, self.nBins), dtype=np.uint32)
+        # NaN marks sketches without any value so far
+        self.lower  = np.full(nRows, np.nan)
+        self.width  = np.full(nRows, np.nan)
+        self.min    = np.full(nRows, np.nan)
+        self.max    = np.full(nRows, np.nan)
+
+    def __double(self, rows, downward):
+        ''' Double the bin width of given rows, merging neighbouring bins.
+
+        The new lower edge is a multiple of the new bin width. If downward
+        is True for a row, the range is shifted down by one new bin, to
+        cover values below the current lower edge.
+        '''
+        width = self.width[rows]
+        lower = self.lower[rows]
+        newWidth = 2. * width
+        newLower = np.floor(lower / newWidth) * newWidth - downward * newWidth
+        # position of the old first bin on the new grid, in old bins (0..3)
+        offset = np.rint((lower - newLower) / width).astype(np.int64)
+        target = (offset[:, None] + np.arange(self.nBins)) // 2
+        target = target + np.arange(rows.size)[:, None] * self.nBins
+        counts = np.bincount(target.ravel(), weights=self.counts[rows].ravel(),
+                             minlength=rows.size * self.nBins)
+        self.counts[rows] = counts.reshape(rows.size, self.nBins).astype(np.uint32)
+        self.width[rows]  = newWidth
+        self.lower[rows]  = newLower
+
+    def __fit(self, rows, vmin, vmax, minWidth=None):
+        ''' Adapt the range of given rows to cover [vmin, vmax].
+
+        Rows without any value so far are initialized with the smallest
+        power of two bin width covering the range. If minWidth is passed,
+        the bin width is increased to at least minWidth.
+        '''
+        new = np.isnan(self.width[rows])
+        if new.any():
+            newRows = rows[new]
+            span    = np.maximum(vmax[new] - vmin[new],
+                                 np.maximum(np.abs(vmax[new]), np.abs(vmin[new])) * 1e-6)
+            span    = np.maximum(span, np.finfo(np.float64).tiny * self.nBins)
+            width   = 2.**np.ceil(np.log2(span / self.nBins))
+            if minWidth is not None:
+                width = np.maximum(width, minWidth[new])
+            self.width[newRows] = width
+            self.lower[newRows] = np.floor(vmin[new] / width) * width
+        while True:
+            width = self.width[rows]
+            lower = self.lower[rows]
+            below = vmin < lower
+            need  = below | (vmax >= lower + self.nBins * width)
+            if minWidth is not None:
+                need |= width < minWidth
+            if not need.any():
+                break
+            self.__double(rows[need], below[need])
+
+    def __add(self, rows, values):
+        ''' Add values (t, rows) to the sketches of given rows '''
+        valid = ~np.isnan(values)
+        hasValue = valid.any(axis=0)
+        if not hasValue.any():
+            return None
+        rows   = rows[hasValue]
+        values = values[:, hasValue]
+        valid  = valid[:, hasValue]
+        with np.errstate(all='ignore'):
+            vmin = np.nanmin(values, axis=0)
+            vmax = np.nanmax(values, axis=0)
+        self.__fit(rows, vmin, vmax)
+        self.min[rows] = np.fmin(self.min[rows], vmin)
+        self.max[rows] = np.fmax(self.max[rows], vmax)
+
+        binIdx = np.floor((values - self.lower[rows]) / self.width[rows])
+        binIdx = np.clip(np.where(valid, binIdx, 0), 0, self.nBins - 1).astype(np.int64)
+        flatIdx = binIdx + np.arange(rows.size) * self.nBins
+        counts = np.bincount(flatIdx[valid], minlength=rows.size * self.nBins)
+        self.counts[rows] += counts.reshape(rows.size, self.nBins).astype(np.uint32)
+
+    def __reshape(self, values):
+        ''' Reshape per row values to (NoI, *shape) or shape '''
+        if self.sliceInterval is None:
+            return values.reshape(values.shape[:-1] + self.shape)
+        return values.reshape(values.shape[:-1] + (self.NoI,) + self.shape)
+
+    ###########################################################################
+    ########################### Core functions ################################
+    ###########################################################################
+    def update(self, data, dates=None, index=None):
+        ''' Add a chunk of data to the sketches.
+
+        Parameters
+        ----------
+        data : ndarray
+            The chunk of data with time as first axis. Masked values and
+            NaN are ignored.
+        dates : NDarray, optional
+            The dates of each time-step. Required if sliceInterval is set
+            and index is not passed.
+        index : NDarray, optional
+            The calendar index of each time-step (0 <= index < NoI). Could
+            be passed instead of dates.
+
+        Returns
+        -------
+        None
+        '''
+        if np.ma.isMaskedArray(data):
+            data = data.astype(np.float64).filled(fill_value=np.nan)
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape[0] == 0:
+            return None
+        if self.counts is None:
+            self.__allocate(data.shape[1:])
+        elif data.shape[1:] != self.shape:
+            print(f'ERROR: data.shape[1:] {data.shape[1:]} != sketch shape {self.shape}')
+            return None
+        nPixels = int(np.prod(self.shape, dtype=np.int64))
+        data = data.reshape(data.shape[0], nPixels)
+
+        if self.sliceInterval is None:
+            self.__add(np.arange(nPixels), data)
+            return None
+
+        if index is None:
+            if dates is None:
+                print(f'ERROR: either dates or index has to be passed if sliceInterval is set')
+                return None
+            index, _ = toolBox.get_calendarIndex(np.asarray(dates), sliceInterval=self.sliceInterval)
+        index = np.asarray(index, dtype=np.int64)
+        if index.shape[0] != data.shape[0]:
+            print(f'ERROR: data.shape[0] {data.shape[0]} != number of time-steps {index.shape[0]}')
+            return None
+        for slot in np.unique(index):
+            self.__add(slot * nPixels + np.arange(nPixels), data[index == slot])
+
+    def merge(self, other):
+        ''' Merge another sketch into this one.
+
+        Parameters
+        ----------
+        other : QuantileClimatology
+            A sketch of the same nBins, sliceInterval, and spatial shape.
+
+        Returns
+        -------
+        self : QuantileClimatology
+        '''
+        if other.nBins != self.nBins or other.sliceInterval != self.sliceInterval:
+            print(f'ERROR: cannot merge sketches of different nBins or sliceInterval')
+            return self
+        if other.counts is None:
+            return self
+        if self.counts is None:
+            self.__allocate(other.shape)
+        elif other.shape != self.shape:
+            print(f'ERROR: cannot merge shape {other.shape} into {self.shape}')
+            return self
+
+        rows = np.flatnonzero(~np.isnan(other.width))
+        if rows.size == 0:
+            return self
+        # range of the occupied bins of other
+        occupied = other.counts[rows] > 0
+        first = np.argmax(occupied, axis=1)
+        last  = self.nBins - 1 - np.argmax(occupied[:, ::-1], axis=1)
+        width = other.width[rows]
+        vmin  = other.lower[rows] + first * width
+        vmax  = other.lower[rows] + (last + 0.5) * width
+        self.__fit(rows, vmin, vmax, minWidth=width)
+
+        # bring other onto the (coarser or equal) bins of self; as all bin
+        # edges are multiples of the bin width, this is exact
+        ratio  = np.rint(self.width[rows] / width).astype(np.int64)
+        edges  = other.lower[rows][:, None] + np.arange(self.nBins) * width[:, None]
+        target = np.floor((edges - self.lower[rows][:, None]) / self.width[rows][:, None] + 0.5 / ratio[:, None])
+        target = np.clip(target, 0, self.nBins - 1).astype(np.int64)
+        target = target + np.arange(rows.size)[:, None] * self.nBins
+        counts = np.bincount(target.ravel(), weights=other.counts[rows].ravel(),
+                             minlength=rows.size * self.nBins)
+        self.counts[rows] += counts.reshape(rows.size, self.nBins).astype(np.uint32)
+        self.min[rows] = np.fmin(self.min[rows], other.min[rows])
+        self.max[rows] = np.fmax(self.max[rows], other.max[rows])
+        return self
+
+    def get_quantiles(self, q):
+        ''' Return the estimated quantiles.
+
+        Parameters
+        ----------
+        q : float or list of float
+            The quantiles to estimate, between 0 and 1.
+
+        Returns
+        -------
+        ndarray
+            The estimated quantiles with shape (len(q), *shape) (with
+            NoI as second axis if sliceInterval is set), or without the
+            first axis if q is a float. NaN where no value was seen.
+        '''
+        if self.counts is None:
+            return None
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        cum   = np.cumsum(self.counts, axis=1, dtype=np.float64)
+        total = cum[:, -1]
+        results = np.empty((q.size, cum.shape[0]))
+        for n, quantile in enumerate(q):
+            rank = quantile * total
+            # first bin reaching the requested rank
+            binIdx = np.minimum(np.sum(cum < rank[:, None], axis=1), self.nBins - 1)
+            rows   = np.arange(cum.shape[0])
+            before = np.where(binIdx > 0, cum[rows, np.maximum(binIdx - 1, 0)], 0.)
+            inBin  = self.counts[rows, binIdx]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                frac = np.where(inBin > 0, (rank - before) / inBin, 0.)
+            value = self.lower + (binIdx + frac) * self.width
+            # the exact minimum and maximum are known
+            value = np.clip(value, self.min, self.max)
+            results[n] = np.where(total > 0, value, np.nan)
+        results = self.__reshape(results)
+        return results[0] if scalar else results
+
+    def get_errorBound(self):
+        ''' Return the maximum absolute error of the estimated quantiles.
+
+        This is the bin width of each pixel (NaN where no value was seen).
+        '''
+        if self.counts is None:
+            return None
+        return self.__reshape(self.width.copy())
+
+    def get_count(self):
+        ''' Return the number of valid values seen by each pixel '''
+        if self.counts is None:
+            return None
+        return self.__reshape(self.counts.sum(axis=1, dtype=np.int64))
+
+    def save(self, filename):
+        ''' Save the sketch to a .npz file, see load()
+
+        The extension .npz is appended to filename if missing.
+        '''
+        if self.counts is None:
+            print(f'ERROR: sketch is empty and therefore not saved')
+            return None
+        np.savez(toolBox.get_npzFile(filename), nBins=self.nBins,
+                 sliceInterval='' if self.sliceInterval is None else self.sliceInterval,
+                 shape=np.array(self.shape, dtype=np.int64), counts=self.counts,
+                 lower=self.lower, width=self.width, min=self.min, max=self.max)
+
+    @classmethod
+    def load(cls, filename):
+        ''' Load a sketch saved with save()
+
+        The extension .npz is appended to filename if missing.
+
+        Returns
+        -------
+        QuantileClimatology
+        '''
+        with np.load(toolBox.get_npzFile(filename)) as stored:
+            sliceInterval = str(stored['sliceInterval']) or None
+            sketch        = cls(nBins=int(stored['nBins']), sliceInterval=sliceInterval)
+            sketch.shape  = tuple(int(n) for n in stored['shape'])
+            sketch.counts = stored['counts']
+            sketch.lower  = stored['lower']
+            sketch.width  = stored['width']
+            sketch.min    = stored['min']
+            sketch.max    = stored['max']
+        return sketch
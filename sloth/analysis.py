@@ -8,6 +8,8 @@ Basically this are functions calculating some variabels.
 """
 import sys
 import os
+import hashlib
+import pickle
 import numpy as np
 try:
     import heat as ht
@@ -17,6 +19,11 @@ import netCDF4 as nc
 import datetime as dt
 import matplotlib.pyplot as plt
 
+from . import IO as io
+from . import toolBox
+from .IntervalAggregator import IntervalAggregator
+from .Climatology import Climatology
+
 
 def calc_wtd_HT(press, cellDepths):
     """
@@ -269,3 +276,683 @@ def vanGenuchten(refP, sSat, sRes, nVanG, aVanG):
 
     return vanG
 
+
+def calc_overlandFlow(pressTop, slopex, slopey, mannings, dx, dy, kinematic=False):
+    """
+    Calculate the overland flow out of the surface pressure (Manning's equation).
+
+    Parameters
+    ----------
+    pressTop : ndarray
+        Pressure head of the upper most layer. [L]
+        The dimensions could be (y, x) or (t, y, x).
+    slopex : ndarray
+        2D slopes in x-direction. [-]
+    slopey : ndarray
+        2D slopes in y-direction. [-]
+    mannings : ndarray or float
+        Manning's roughness coefficient. [T L^-1/3]
+    dx : float
+        Grid spacing in x-direction. [L]
+    dy : float
+        Grid spacing in y-direction. [L]
+    kinematic : bool, optional
+        If True, the friction slope is calculated as in ParFlow's 
+        'OverlandKinematic' boundary condition, else as in the default 
+        'OverlandFlow' boundary condition (default is False).
+
+    Returns
+    -------
+    flowx : ndarray
+        Overland flow through the cell face in x-direction. [L^3 T^-1]
+    flowy : ndarray
+        Overland flow through the cell face in y-direction. [L^3 T^-1]
+
+    Notes
+    -----
+    Only positive pressure (ponding water) contributes to overland flow:
+
+        h = max(pressTop, 0)
+
+    With 'OverlandFlow' both directions are handled independently:
+
+        flowx = -sign(slopex) * sqrt(|slopex|) / mannings * h**(5/3) * dy
+
+    With 'OverlandKinematic' the friction slope Sf = sqrt(slopex**2 + slopey**2)
+    is used:
+
+        flowx = -slopex / (mannings * sqrt(Sf)) * h**(5/3) * dy
+
+    and flowy accordingly with dx. The time unit of the result is the 
+    time unit of mannings, which is usually [h] for ParFlow simulations, so
+    divide by 3600 to get [m^3 s^-1].
+
+    """
+    depth = np.where(pressTop > 0., pressTop, 0.)
+    depth53 = depth**(5./3.)
+    if kinematic:
+        Sf = np.sqrt(slopex**2 + slopey**2)
+        # avoid division by zero on flat pixel
+        Sf = np.where(Sf > 0, Sf, 1.)
+        flowx = -slopex / (mannings * np.sqrt(Sf)) * depth53 * dy
+        flowy = -slopey / (mannings * np.sqrt(Sf)) * depth53 * dx
+    else:
+        flowx = -np.sign(slopex) * np.sqrt(np.abs(slopex)) / mannings * depth53 * dy
+        flowy = -np.sign(slopey) * np.sqrt(np.abs(slopey)) / mannings * depth53 * dx
+    return flowx, flowy
+
+def calc_discharge(source, slopex, slopey, mannings, dx, dy, stat='series',
+        kinematic=False, chunkSize=None, varName=None, layer=None,
+        dtype=np.float64):
+    """
+    Calculate the discharge out of a ParFlow pressure time-series.
+
+    The pressure is read chunk-wise along the time-axis (see 
+    `IO.iter_timeChunks()`), so long PFB series or large netCDF files 
+    could be handled with memory bound by the chunk size. The overland flow
+    of each chunk is calculated with `calc_overlandFlow()` and the discharge
+    of each pixel is the sum of the absolute flow through the cell faces:
+
+        Q = |flowx| + |flowy|
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The pressure time-series, e.g. a list of ParFlow press PFB files.
+        See `IO.iter_timeChunks()` for all supported sources.
+    slopex : ndarray
+        2D slopes in x-direction. [-]
+    slopey : ndarray
+        2D slopes in y-direction. [-]
+    mannings : ndarray or float
+        Manning's roughness coefficient. [T L^-1/3]
+    dx : float
+        Grid spacing in x-direction. [L]
+    dy : float
+        Grid spacing in y-direction. [L]
+    stat : str, optional
+        'series' to return the discharge of each time-step, or 'mean' to
+        return the temporal mean only, e.g. to be used as SimMeanQ with 
+        `mapper()` (default is 'series').
+    kinematic : bool, optional
+        See `calc_overlandFlow()`.
+    chunkSize : int, optional
+        Number of time-steps read at once.
+    varName : str, optional
+        Name of the pressure variable if source is a netCDF file.
+    layer : int or None, optional
+        Layer holding the surface pressure. If None (default), the upper 
+        most layer (-1) is selected for 4D sources (t, z, y, x) and for PFB
+        files (each holding z, y, x), while a 3D source (t, y, x) is taken
+        as the surface pressure already.
+    dtype : dtype, optional
+        dtype used for the calculation, e.g. np.float32 to half the memory
+        footprint (default is np.float64).
+
+    Returns
+    -------
+    ndarray
+        The discharge [L^3 T^-1] as (t, y, x) for stat='series' or (y, x) 
+        for stat='mean'.
+
+    Examples
+    --------
+    >>> pressFiles = sorted(glob.glob('cordex0.11.out.press.*.pfb'))
+    >>> SimMeanQ = calc_discharge(pressFiles, slopex, slopey, mannings=5.5e-5,
+    ...                           dx=12500., dy=12500., stat='mean') / 3600.
+
+    """
+    supportedStat = ['series', 'mean']
+    if stat not in supportedStat:
+        print(f'ERROR: stat "{stat}" is not supported.')
+        print(f'---    supported values are: {supportedStat}')
+        return None
+
+    slopex   = np.asarray(slopex, dtype=dtype)
+    slopey   = np.asarray(slopey, dtype=dtype)
+    mannings = np.asarray(mannings, dtype=dtype)
+
+    if layer is None:
+        # select the upper most layer of 4D sources only, the second axis of
+        # a 3D source is the y-axis
+        if isinstance(source, (list, tuple)):
+            ndim = 4
+        elif isinstance(source, str):
+            with nc.Dataset(source, 'r') as nc_file:
+                ndim = nc_file.variables[varName].ndim if varName in nc_file.variables else 3
+        else:
+            ndim = len(source.shape)
+        layer = -1 if ndim == 4 else None
+
+    tmp_series = []
+    sumQ = None
+    nt = 0
+    for tStart, pressTop in io.iter_timeChunks(source, chunkSize=chunkSize,
+            varName=varName, layer=layer, dtype=dtype):
+        flowx, flowy = calc_overlandFlow(pressTop, slopex, slopey, mannings,
+                dx, dy, kinematic=kinematic)
+        Q = np.abs(flowx) + np.abs(flowy)
+        if stat == 'series':
+            tmp_series.append(Q)
+        elif stat == 'mean':
+            # accumulate in float64 to not lose precision over long series
+            chunkSum = np.sum(Q, axis=0, dtype=np.float64)
+            sumQ = chunkSum if sumQ is None else sumQ + chunkSum
+        nt += Q.shape[0]
+
+    if nt == 0:
+        print(f'ERROR: source does not hold any time-step')
+        return None
+    if stat == 'series':
+        return np.concatenate(tmp_series, axis=0)
+    return (sumQ / nt).astype(dtype)
+
+def read_ncDates(ncTime):
+    """
+    Decode the time-variable of a netCDF file into dates.
+
+    Parameters
+    ----------
+    ncTime : netCDF4.Variable
+        The time-variable, holding the attributes `units` and (optionally)
+        `calendar`.
+
+    Returns
+    -------
+    ndarray
+        1D ndarray of datetime- or cftime-objects.
+
+    """
+    calendar = getattr(ncTime, 'calendar', 'standard')
+    return np.asarray(nc.num2date(ncTime[:], units=ncTime.units, calendar=calendar))
+
+def _get_intervalCacheFile(cacheDir, fileName, varName, sliceInterval, stats):
+    """
+    Return the cache file of the interval records of one file.
+
+    The name is build out of a hash of the absolute path and a hash of the
+    aggregation parameters, so each file and parameter set has its own 
+    cache file. Modification time and size of the file, as well as the 
+    last time-step of the previous files (see 
+    `IntervalAggregator(startAfter=...)`), are stored within the cache and
+    checked on read (see `_read_intervalCache()`).
+    """
+    pathHash  = hashlib.sha1(os.path.abspath(fileName).encode()).hexdigest()[:16]
+    paramHash = hashlib.sha1(repr((varName, sliceInterval, sorted(stats))).encode()).hexdigest()[:16]
+    return os.path.join(cacheDir, f'{os.path.basename(fileName)}.{pathHash}.{paramHash}.pkl')
+
+def _read_intervalCache(cacheFile, fileName, startAfter=None):
+    """
+    Read cached interval records, if still valid for fileName.
+
+    Returns
+    -------
+    records : list of dict or None
+        None if there is no cache, the file was changed since, or the 
+        records were aggregated after a different startAfter.
+    dumpInterval : timedelta or None
+    """
+    if not os.path.isfile(cacheFile):
+        return None, None
+    fileStat = os.stat(fileName)
+    try:
+        with open(cacheFile, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        print(f'WARNING: could not read cache {cacheFile}, recalculating')
+        return None, None
+    if cache['mtime'] != fileStat.st_mtime_ns or cache['size'] != fileStat.st_size:
+        return None, None
+    if not bool(cache.get('startAfter') == startAfter):
+        return None, None
+    return cache['records'], cache['dumpInterval']
+
+def _write_intervalCache(cacheFile, fileName, records, dumpInterval, startAfter=None):
+    """ Write interval records of fileName to cacheFile """
+    fileStat = os.stat(fileName)
+    cache = {
+        'mtime':        fileStat.st_mtime_ns,
+        'size':         fileStat.st_size,
+        'records':      records,
+        'dumpInterval': dumpInterval,
+        'startAfter':   startAfter,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(cacheFile)), exist_ok=True)
+    # write to a temporary file first, so an interrupted run does not leave
+    # a broken cache behind
+    with open(f'{cacheFile}.tmp', 'wb') as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{cacheFile}.tmp', cacheFile)
+
+def calc_intervalStats(source, sliceInterval='month', stats=('mean',),
+        varName=None, dates=None, chunkSize=None, skipIncomplete=True,
+        cacheDir=None, onClose=None):
+    """
+    Calculate interval statistics (e.g. monthly means) in a streaming manner.
+
+    The source is read in time chunks aligned to the storage chunking (see
+    `IO.iter_timeChunks()`), and running sums, counts, minima, and maxima 
+    are accumulated per interval with an `IntervalAggregator`. So not 
+    even one full interval has to be kept in memory, and the peak memory is 
+    bound by the chunk size and not by the file size.
+
+    If a sequence of netCDF files is passed, all files are streamed through
+    the same aggregator. Intervals spanning file boundaries (e.g. DJF 
+    seasons over year-split monthly files) are carried over from one file 
+    to the next and are closed only once the next interval starts, so there
+    is no need to concatenate the files in advance. Time-steps of a file 
+    not later than the last time-step of the previous files (e.g. the 
+    overlap written again after a restart) are dropped, and duplicated or
+    unsorted time-steps are handled with `toolBox.get_intervalGroups()`.
+    Intervals with missing time-steps are flagged as not complete. The
+    records of each file
+    could be cached on disk (see cacheDir), so reruns over a growing list of
+    files do only process new or changed files.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series to aggregate. If source is a path to a netCDF file,
+        or a list of paths to netCDF files (in temporal order), the dates 
+        are read from the time-variable of each file. A list of paths 
+        together with varName is treated as netCDF files, otherwise as PFB
+        files. See `IO.iter_timeChunks()` for all supported sources.
+    sliceInterval : str, optional
+        The interval to aggregate to. Supported are: 'hour', 'day', 
+        'pentad', 'month', 'season', 'year' (default is 'month').
+    stats : list of str, optional
+        The statistics to calculate. Supported are: 'mean', 'sum', 'min', 
+        'max', 'count' (default is ['mean']).
+    varName : str, optional
+        Name of the variable to read if source is a netCDF file.
+    dates : ndarray, optional
+        The dates of each time-step (of all files together). Required if 
+        source is not a netCDF file, e.g. for a list of PFB files.
+    chunkSize : int, optional
+        Number of time-steps read at once.
+    skipIncomplete : bool, optional
+        Skip incomplete intervals at the start and end (default is True).
+    cacheDir : str, optional
+        If passed, the interval records (sums, counts, etc.) of each netCDF
+        file are cached within this directory, keyed by the path of the 
+        file and the aggregation parameters. Files which were not modified
+        since (same modification time and size) are not read again, but 
+        their cached records are merged with the records of new or changed
+        files. So extending an experiment by another year only does need to
+        process the new files. Ignored if dates are passed.
+    onClose : callable, optional
+        If passed, the result of each interval (see 
+        `IntervalAggregator.get_result()`) is passed to onClose once the 
+        interval is closed, e.g. to write it to disk, and is not kept in 
+        memory. So only the open interval is carried from chunk to chunk 
+        and from file to file, and the memory needed is bound also for 
+        long time-series.
+
+    Returns
+    -------
+    results : dict
+        The requested stats with the interval as first axis, plus the 
+        interval dates and meta information. See 
+        `IntervalAggregator.get_results()`. None if onClose is passed.
+
+    Examples
+    --------
+    >>> results = calc_intervalStats('TSA.nc', varName='TSA', 
+    ...                              sliceInterval='month', stats=['mean', 'max'])
+    >>> results['mean'].shape, results['time'].shape
+    ((12, 412, 424), (12,))
+
+    >>> files = sorted(glob.glob('*/T_S_ts.nc'))
+    >>> results = calc_intervalStats(files, varName='T_S', sliceInterval='season')
+
+    >>> calc_intervalStats(files, varName='T_S', sliceInterval='month',
+    ...                    onClose=lambda result: ncMean.append(result['mean']))
+
+    """
+    if onClose is None:
+        closeInterval = None
+    else:
+        # hold back the last closed interval, so incomplete intervals at the
+        # start and end could be skipped before passed to onClose
+        held    = []
+        nClosed = 0
+        def passInterval(result, isEdge):
+            if not (skipIncomplete and isEdge and not result['complete']):
+                onClose(result)
+        def closeInterval(result):
+            nonlocal nClosed
+            if held:
+                passInterval(held.pop(), isEdge=nClosed == 1)
+            held.append(result)
+            nClosed += 1
+    aggregator = IntervalAggregator(sliceInterval=sliceInterval, stats=stats,
+                                    onClose=closeInterval)
+
+    def get_results():
+        if onClose is None:
+            return aggregator.get_results(skipIncomplete=skipIncomplete)
+        aggregator.finalize()
+        if held:
+            passInterval(held.pop(), isEdge=True)
+        return None
+
+    if isinstance(source, str) or (isinstance(source, (list, tuple)) and varName is not None):
+        if varName is None:
+            print(f'ERROR: varName is required to read {source}')
+            return None
+        fileNames = [source] if isinstance(source, str) else source
+        useCache  = cacheDir is not None and dates is None
+        tOffset = 0
+        for fileName in fileNames:
+            records    = None
+            startAfter = aggregator.lastDate
+            if useCache:
+                cacheFile = _get_intervalCacheFile(cacheDir, fileName, varName,
+                                                   sliceInterval, aggregator.stats)
+                records, dumpInterval = _read_intervalCache(cacheFile, fileName, 
+                                                            startAfter=startAfter)
+            if records is not None:
+                aggregator.add_records(records, dumpInterval=dumpInterval)
+                continue
+            # if cached, aggregate each file on its own and merge the records
+            # of intervals spanning file boundaries afterwards, otherwise 
+            # stream the file directly through the aggregator
+            if useCache:
+                fileAggregator = IntervalAggregator(sliceInterval=sliceInterval, stats=stats,
+                                                    startAfter=startAfter)
+            else:
+                fileAggregator = aggregator
+            with nc.Dataset(fileName, 'r') as nc_file:
+                ncVar = nc_file.variables[varName]
+                if dates is None:
+                    fileDates = read_ncDates(nc_file.variables['time'])
+                else:
+                    fileDates = np.asarray(dates)[tOffset:tOffset+ncVar.shape[0]]
+                for tStart, chunk in io.iter_timeChunks(ncVar, chunkSize=chunkSize):
+                    fileAggregator.update(chunk, fileDates[tStart:tStart+chunk.shape[0]])
+                tOffset += ncVar.shape[0]
+            if useCache:
+                records      = fileAggregator.get_records()
+                dumpInterval = fileAggregator.dumpInterval
+                _write_intervalCache(cacheFile, fileName, records, dumpInterval,
+                                     startAfter=startAfter)
+                aggregator.add_records(records, dumpInterval=dumpInterval)
+        return get_results()
+
+    if dates is None:
+        print(f'ERROR: dates are required if source is not a netCDF file')
+        return None
+    dates = np.asarray(dates)
+
+    for tStart, chunk in io.iter_timeChunks(source, chunkSize=chunkSize):
+        aggregator.update(chunk, dates[tStart:tStart+chunk.shape[0]])
+    return get_results()
+
+def calc_anomalies(source, climatology, dates=None, varName=None,
+        standardize=False, domainMean=False, weights=None, saveFile=None,
+        saveVarName='anomaly', chunkSize=None):
+    """
+    Calculate anomalies of a time-series against a climatology.
+
+    The anomaly of each time-step is its deviation from the climatological
+    mean of the calendar interval it belongs to (see 
+    `toolBox.get_calendarIndex()`):
+
+        anomaly = data - climatology[calendarIndex]
+
+    The source is processed chunk-wise (see `IO.iter_timeChunks()`) and for
+    each chunk the climatology is broadcast against all time-steps at once,
+    so only a handful of array operations per chunk are needed. Standardized
+    anomalies (anomaly / climatological standard deviation) and the 
+    (area-weighted) domain mean series are calculated in the same pass.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series, e.g. the interval means returned by 
+        `calc_intervalStats()`. If source is a path to a netCDF file, the 
+        dates are read from its time-variable. See `IO.iter_timeChunks()`
+        for all supported sources.
+    climatology : Climatology or str
+        The climatology, or the path to a climatology saved with 
+        `Climatology.save()`. Its sliceInterval defines the calendar index.
+    dates : ndarray, optional
+        The dates of each time-step. Required if source is not a netCDF 
+        file.
+    varName : str, optional
+        Name of the variable to read if source is a netCDF file.
+    standardize : bool, optional
+        Calculate standardized anomalies as well (default is False).
+    domainMean : bool, optional
+        Calculate the domain mean series of the anomalies (default is 
+        False). NaN are ignored.
+    weights : ndarray, optional
+        Weights of each pixel for the domain mean, e.g. the pixel area or
+        np.cos(np.deg2rad(lat2D)) on regular lat-lon grids. Default are 
+        equal weights.
+    saveFile : str, optional
+        If passed, the anomaly fields are written chunk by chunk to this 
+        netCDF file and are not returned, so the memory needed is bound by
+        the chunk size. An existing file (e.g. created with 
+        `IO.createNetCDF()`) is extended, otherwise a new file is created.
+        The anomalies are appended along the unlimited time dimension, 
+        after the time-steps stored already. Time-steps are never 
+        overwritten, so the first date has to be later than the last 
+        stored time-step.
+    saveVarName : str, optional
+        Name of the anomaly variable in saveFile (default is 'anomaly'). 
+        Standardized anomalies are stored as f'{saveVarName}_std'.
+    chunkSize : int, optional
+        Number of time-steps processed at once.
+
+    Returns
+    -------
+    results : dict
+        A dict with the keys
+        -) time: the dates of each time-step
+        -) anomaly: the anomaly fields (if saveFile is None)
+        -) standardized: the standardized anomaly fields (if standardize
+           and saveFile is None)
+        -) domainMean: the domain mean series of anomaly (if domainMean)
+        -) domainMeanStandardized: the domain mean series of the 
+           standardized anomaly (if domainMean and standardize)
+
+    Examples
+    --------
+    >>> clima = Climatology.load('climatology_month.npz')
+    >>> results = calc_anomalies(intervalMean, clima, dates=intervalTime,
+    ...                          domainMean=True)
+    >>> results['domainMean'].shape
+    (360,)
+
+    """
+    if isinstance(source, str):
+        if varName is None:
+            print(f'ERROR: varName is required to read {source}')
+            return None
+        with nc.Dataset(source, 'r') as nc_file:
+            if dates is None:
+                dates = read_ncDates(nc_file.variables['time'])
+            return calc_anomalies(nc_file.variables[varName], climatology,
+                    dates=dates, standardize=standardize, 
+                    domainMean=domainMean, weights=weights, 
+                    saveFile=saveFile, saveVarName=saveVarName, 
+                    chunkSize=chunkSize)
+    if dates is None:
+        print(f'ERROR: dates are required if source is not a netCDF file')
+        return None
+    dates = np.asarray(dates)
+    if isinstance(climatology, str):
+        climatology = Climatology.load(climatology)
+    climMean = climatology.get_mean()
+    if climMean is None:
+        print(f'ERROR: climatology is empty')
+        return None
+    if standardize:
+        climStd = climatology.get_std()
+        # avoid to divide by zero for constant pixels
+        climStd[climStd == 0] = np.nan
+    if domainMean:
+        weights = np.ones(climMean.shape[1:]) if weights is None else np.asarray(weights, dtype=np.float64)
+        weights = weights.ravel()
+
+    tmp_anomaly = []
+    tmp_standardized = []
+    tmp_domainMean = []
+    tmp_domainMeanStd = []
+    nc_file = None
+    try:
+        if saveFile is not None:
+            nc_file = nc.Dataset(saveFile, 'a' if os.path.isfile(saveFile) else 'w')
+            spatialDims = ('rlat', 'rlon') if climMean.ndim == 3 else ('lvl', 'rlat', 'rlon')
+            for dimName, dimSize in zip(spatialDims, climMean.shape[1:]):
+                if dimName not in nc_file.dimensions:
+                    nc_file.createDimension(dimName, dimSize)
+            if 'time' not in nc_file.dimensions:
+                nc_file.createDimension('time', None)
+            if 'time' not in nc_file.variables:
+                ncTime = nc_file.createVariable('time', 'f8', ('time',), zlib=True)
+                ncTime.units    = 'days since 1970-01-01 00:00:00'
+                ncTime.calendar = getattr(dates.flat[0], 'calendar', 'standard') or 'standard'
+            ncTime = nc_file.variables['time']
+            def date2num(tmpDates):
+                if np.issubdtype(tmpDates.dtype, np.datetime64):
+                    tmpDates = tmpDates.astype('datetime64[s]').astype(object)
+                return nc.date2num(list(tmpDates), units=ncTime.units,
+                                   calendar=getattr(ncTime, 'calendar', 'standard'))
+            # time-steps already stored are never overwritten, the anomalies
+            # are appended after the last stored time-step
+            tOffset = ncTime.shape[0]
+            if tOffset > 0 and not date2num(dates[:1])[0] > ncTime[tOffset-1]:
+                print(f'ERROR: {saveFile} does hold time-steps until {ncTime[tOffset-1]} {ncTime.units} already, which would be overwritten --> EXIT')
+                return None
+            ncVars = []
+            varNames = [saveVarName, f'{saveVarName}_std'] if standardize else [saveVarName]
+            for ncVarName, longName in zip(varNames, ['anomaly', 'standardized anomaly']):
+                if ncVarName in nc_file.variables:
+                    if nc_file.variables[ncVarName].dimensions != ('time',) + spatialDims:
+                        print(f'ERROR: {ncVarName} in {saveFile} is of dimensions {nc_file.variables[ncVarName].dimensions} and could not be extended --> EXIT')
+                        return None
+                    ncVars.append(nc_file.variables[ncVarName])
+                    continue
+                ncVar = nc_file.createVariable(ncVarName, 'f4', ('time',) + spatialDims,
+                                               fill_value=-9999, zlib=True)
+                ncVar.long_name = f'{longName} against {climatology.sliceInterval} climatology'
+                ncVars.append(ncVar)
+
+        for tStart, chunk in io.iter_timeChunks(source, chunkSize=chunkSize):
+            tStop = tStart + chunk.shape[0]
+            calIdx, _ = toolBox.get_calendarIndex(dates[tStart:tStop],
+                    sliceInterval=climatology.sliceInterval)
+            anomaly = chunk - climMean[calIdx]
+            fields = [anomaly]
+            if standardize:
+                fields.append(anomaly / climStd[calIdx])
+
+            if domainMean:
+                means = []
+                for field in fields:
+                    flat  = field.reshape(field.shape[0], -1)
+                    valid = ~np.isnan(flat)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        means.append(np.where(valid, flat, 0.) @ weights / (valid @ weights))
+                tmp_domainMean.append(means[0])
+                if standardize:
+                    tmp_domainMeanStd.append(means[1])
+
+            if nc_file is not None:
+                # append along the unlimited time dimension
+                ncTime[tOffset+tStart:tOffset+tStop] = date2num(dates[tStart:tStop])
+                for ncVar, field in zip(ncVars, fields):
+                    ncVar[tOffset+tStart:tOffset+tStop] = np.ma.masked_invalid(field)
+            else:
+                tmp_anomaly.append(anomaly)
+                if standardize:
+                    tmp_standardized.append(fields[1])
+    finally:
+        if nc_file is not None:
+            nc_file.close()
+
+    results = {'time': dates}
+    if saveFile is None:
+        results['anomaly'] = np.concatenate(tmp_anomaly, axis=0)
+        if standardize:
+            results['standardized'] = np.concatenate(tmp_standardized, axis=0)
+    if domainMean:
+        results['domainMean'] = np.concatenate(tmp_domainMean)
+        if standardize:
+            results['domainMeanStandardized'] = np.concatenate(tmp_domainMeanStd)
+    return results
+
+def calc_diurnalCycle(source, varName=None, dates=None, chunkSize=None):
+    """
+    Calculate the mean diurnal cycle of each month in one streaming pass.
+
+    Each time-step is assigned to its (month, hour of day) composite with
+    `toolBox.get_calendarIndex(sliceInterval='diurnal')`, and the 
+    composites are accumulated chunk by chunk with a `Climatology`. So the
+    full (12, 24, ny, nx) composite of e.g. hourly TSMP output is calculated
+    with one read of the data and memory bound by the chunk size.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The (sub-daily) time-series. If source is a path to a netCDF file, 
+        or a list of paths to netCDF files, the dates are read from the 
+        time-variable of each file. See `IO.iter_timeChunks()` for all 
+        supported sources.
+    varName : str, optional
+        Name of the variable to read if source is a netCDF file.
+    dates : ndarray, optional
+        The dates of each time-step. Required if source is not a netCDF 
+        file.
+    chunkSize : int, optional
+        Number of time-steps read at once.
+
+    Returns
+    -------
+    results : dict
+        A dict with the keys 'mean', 'std', 'min', 'max', and 'count', each
+        of shape (12, 24, ...) with month and hour of day as first axes. 
+        NaN where no time-step was found (e.g. hours not covered by 3-hourly
+        output).
+
+    Examples
+    --------
+    >>> files = sorted(glob.glob('*/SHF_ts.nc'))
+    >>> diurnal = calc_diurnalCycle(files, varName='SHF')
+    >>> diurnal['mean'][6, 12].shape   # July, 12 UTC
+    (412, 424)
+
+    """
+    climatology = Climatology(sliceInterval='diurnal')
+
+    if isinstance(source, str) or (isinstance(source, (list, tuple)) and varName is not None):
+        if varName is None:
+            print(f'ERROR: varName is required to read {source}')
+            return None
+        fileNames = [source] if isinstance(source, str) else source
+        for fileName in fileNames:
+            with nc.Dataset(fileName, 'r') as nc_file:
+                fileDates = read_ncDates(nc_file.variables['time'])
+                for tStart, chunk in io.iter_timeChunks(nc_file.variables[varName], chunkSize=chunkSize):
+                    climatology.update(chunk, dates=fileDates[tStart:tStart+chunk.shape[0]])
+    else:
+        if dates is None:
+            print(f'ERROR: dates are required if source is not a netCDF file')
+            return None
+        dates = np.asarray(dates)
+        for tStart, chunk in io.iter_timeChunks(source, chunkSize=chunkSize):
+            climatology.update(chunk, dates=dates[tStart:tStart+chunk.shape[0]])
+
+    if climatology.count is None:
+        print(f'ERROR: source does not contain any time-step')
+        return None
+    shape = (12, 24) + climatology.count.shape[1:]
+    return {
+        'mean':  climatology.get_mean().reshape(shape),
+        'std':   climatology.get_std().reshape(shape),
+        'min':   climatology.min.reshape(shape),
+        'max':   climatology.max.reshape(shape),
+        'count': climatology.count.reshape(shape),
+    }
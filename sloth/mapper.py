@@ -2,7 +2,13 @@ import numpy as np
 import csv
 import sys
 import os
+import warnings
+import hashlib
+from scipy.spatial import cKDTree
 from . import toolBox
+from . import IO as io
+from . import coordTrafo
+from . import slothHelper
 
 class mapper:
     ''' 
@@ -45,7 +51,12 @@ class mapper:
             GRDC station stored with the object
         SimMeanQ : 2D ndarray
             Two dimensional ndarray containing the mean discharge for each point
-            of SimGrid (mean Q for entire period or ref period) 
+            of SimGrid (mean Q for entire period or ref period). Could also 
+            be a 3D stack (n_members, ny, nx) of several ensemble members or
+            sensitivity runs, see MapBestQ() and MapHighQ().
+        MapYIdx_fitMembers, MapXIdx_fitMembers : 2D ndarray
+            The fit of each member (n_members, nObs) if SimMeanQ is a stack,
+            None otherwise. MapYIdx_fit and MapXIdx_fit are always 1D.
         ObsMeanQ : 1D ndarray
             One dimensional ndarray containing the mean discharge for each individual 
             GRDC station stored with the object
@@ -60,6 +71,8 @@ class mapper:
         # input
         self.SimLons        = SimLons
         self.SimLats        = SimLats
+        # domain definition, if SimGrid is a regular rotated grid
+        self.SimGridDef     = None
         self.ObsLons        = ObsLons
         self.ObsLats        = ObsLats
 
@@ -73,6 +86,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
         self.ObsMeanArea    = None
         self.SimMeanArea    = None
@@ -83,6 +98,12 @@ class mapper:
     @SimLons.setter
     def SimLons(self, SimLons):
         """ SimLons is expected to be an 2D ndarray """
+        # the spatial index of SimGrid has to be rebuild, and SimGrid is no
+        # longer known to be a regular rotated grid (see setGridFromDef()).
+        # All results cached per ObsID are related to the old SimGrid.
+        self.__SimTree      = None
+        self.SimGridDef     = None
+        self.__stationCache = {}
         if SimLons is None:
             print(f'Initialize SimLons as NoneType')
             self.__SimLons = None
@@ -101,6 +122,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def SimLats(self):
@@ -108,6 +131,12 @@ class mapper:
     @SimLats.setter
     def SimLats(self, SimLats):
         """ SimLats is expected to be an 2D ndarray """
+        # the spatial index of SimGrid has to be rebuild, and SimGrid is no
+        # longer known to be a regular rotated grid (see setGridFromDef()).
+        # All results cached per ObsID are related to the old SimGrid.
+        self.__SimTree      = None
+        self.SimGridDef     = None
+        self.__stationCache = {}
         if SimLats is None:
             print(f'Initialize SimLats as NoneType')
             self.__SimLats = None
@@ -126,6 +155,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def ObsLons(self):
@@ -151,6 +182,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def ObsLats(self):
@@ -176,6 +209,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def ObsIDs(self):
@@ -201,13 +236,16 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def SimMeanQ(self):
         return self.__SimMeanQ
     @SimMeanQ.setter
     def SimMeanQ(self, SimMeanQ):
-        """ SimMeanQ is expected to be an 2D ndarray """
+        """ SimMeanQ is expected to be an 2D ndarray, or a 3D stack of 
+        several members (n_members, ny, nx) """
         if SimMeanQ is None:
             print(f'Initialize SimMeanQ as NoneType')
             self.__SimMeanQ = None
@@ -216,8 +254,8 @@ class mapper:
             print(f'SimMeanQ is of type {type(SimMeanQ)} but <class "numpy.ndarray"> is required!')
             self.__SimMeanQ = None
             return None
-        if not SimMeanQ.ndim == 2:
-            print(f'SimMeanQ is of dimension {SimMeanQ.ndim} but dimension 2 is required!')
+        if not SimMeanQ.ndim in [2, 3]:
+            print(f'SimMeanQ is of dimension {SimMeanQ.ndim} but dimension 2 or 3 is required!')
             self.__SimMeanQ = None
             return None
         self.__SimMeanQ     = SimMeanQ
@@ -226,6 +264,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     @property
     def ObsMeanQ(self):
@@ -251,6 +291,8 @@ class mapper:
         self.MapYIdx_raw    = None
         self.MapXIdx_fit    = None
         self.MapYIdx_fit    = None
+        self.MapXIdx_fitMembers = None
+        self.MapYIdx_fitMembers = None
 
     """
     One can think about additional functions like:
@@ -280,6 +322,87 @@ class mapper:
         return Rearth * np.arccos(term1+term2*term3)
 
 
+    @staticmethod
+    def lonlat2xyz(lons, lats):
+        """ convert lon / lat in degree to 3D coordinates on the unit sphere
+
+        The euclidean distance of those coordinates (chord length) is 
+        monotonic to the spherical distance, so the nearest neighbour in 3D
+        is the nearest neighbour on the sphere.
+
+        return ndarray of shape (N, 3)
+        """
+        lons = np.deg2rad(np.asarray(lons, dtype=float)).ravel()
+        lats = np.deg2rad(np.asarray(lats, dtype=float)).ravel()
+        cosLats = np.cos(lats)
+        return np.column_stack([cosLats * np.cos(lons), 
+                                cosLats * np.sin(lons), 
+                                np.sin(lats)])
+
+    def get_SimTree(self):
+        """ return a cKDTree of SimGrid on the unit sphere
+
+        The tree is build once and cached with the object. It is rebuild 
+        if SimLons or SimLats are set again (changing SimLons or SimLats 
+        in place is not detected).
+        """
+        if self.__SimTree is None:
+            self.__SimTree = cKDTree(self.lonlat2xyz(self.SimLons, self.SimLats))
+        return self.__SimTree
+
+    def reset_stationCache(self):
+        """ clear all results cached per ObsID (see MapRaw())
+
+        The cache is cleared automatically if SimLons or SimLats are set,
+        but not if e.g. SimLons is changed in place.
+        """
+        self.__stationCache = {}
+
+    def setGridFromDef(self, domain):
+        """ set SimGrid from a domain definition of a regular rotated grid
+
+        Instead of passing 2D SimLons and SimLats, SimGrid could be defined
+        by a CORDEX or griddes domain definition. SimLons and SimLats are 
+        calculated out of it, and MapRaw() does find the pixel of each 
+        station analytically (see toolBox.get_rotGridIndex()) instead of 
+        searching the nearest pixel.
+
+        Parameters
+        ----------
+        domain : dict or str
+            domain definition as returned by slothHelper.get_cordexDomDef() 
+            or slothHelper.get_griddesDomDef(), the name of a CORDEX domain
+            (e.g. 'EUR-11'), the name of a griddes file shipped with SLOTH
+            (e.g. 'DE06'), or the path to a griddes file.
+
+        Returns
+        -------
+        None
+        """
+        if isinstance(domain, str):
+            if os.path.isfile(domain):
+                domainDef = slothHelper.get_griddesDomDef(domain)
+            elif domain in slothHelper.get_listOfCordexGrids():
+                domainDef = slothHelper.get_cordexDomDef(domain)
+            elif domain in slothHelper.get_listOfGriddes():
+                griddesFile = f'{os.path.dirname(__file__)}/configs/{domain}_griddes.txt'
+                domainDef = slothHelper.get_griddesDomDef(griddesFile)
+            else:
+                print(f'ERROR: passed domain is not supported. domain={domain}')
+                return None
+        else:
+            domainDef = domain
+
+        rlon = domainDef['SWlon'] + np.arange(domainDef['Nlon']) * domainDef['dlon']
+        rlat = domainDef['SWlat'] + np.arange(domainDef['Nlat']) * domainDef['dlat']
+        rlon2D, rlat2D = np.meshgrid(rlon, rlat)
+        SimLats, SimLons = coordTrafo.undo_grid_rotation(rlat=rlat2D, rlon=rlon2D,
+                np_lat=domainDef['NPlat'], np_lon=domainDef['NPlon'])
+        self.SimLons    = SimLons
+        self.SimLats    = SimLats
+        # set after SimLons and SimLats, as their setters reset SimGridDef
+        self.SimGridDef = domainDef
+
     ###########################################################################
     ########################### Core functions ################################
     ########################################################################### 
@@ -336,6 +459,15 @@ class mapper:
         choose as the correct location of OBS on SimGrid. 
         The 'real' distance is hereby the distance in [m] between OBS and SimGrind 
         calculated on a sphere.
+        The nearest point is found with a cKDTree on 3D coordinates of 
+        SimGrid on the unit sphere (see get_SimTree()), which is build once
+        and queried for all OBS at once.
+        If SimGrid was set with setGridFromDef(), the pixel holding OBS is 
+        calculated analytically in rotated coordinates instead.
+        The results are cached per ObsID together with ObsLon and ObsLat, so
+        after adding, removing, or moving ObsIDs only new or moved ObsIDs 
+        are mapped again (see also MapBestCatchment()). Setting SimLons or 
+        SimLats does clear the cache (see also reset_stationCache()).
 
         Returns
         -------------
@@ -353,31 +485,54 @@ class mapper:
             print('checkt4MapRaw() failed --> self.MapRaw() canceled!')
             return None
 
-        # Create empty lists for results
-        tmp_MapXIdx_raw = []
-        tmp_MapYIdx_raw = []
-        # Loop over all ObsIDs stored with the object
         print('MapRaw start', end='')
-        numObsIDs = len(self.ObsIDs)
-        for idx, ObsID in enumerate(self.ObsIDs):
-            print(f'\rMapRaw ObsID: {ObsID} ({idx} / {numObsIDs})', end='', flush=True)
-            ObsLon = self.ObsLons[idx]
-            ObsLat = self.ObsLats[idx]
-            # Calculate distance between Obs and SimGrid on Earth surface
-            dist = self.spher_dist(np.deg2rad(self.SimLons),
-                                      np.deg2rad(self.SimLats),
-                                      np.deg2rad(ObsLon),
-                                      np.deg2rad(ObsLat))
-            # Find index of smallest distance
-            mapped_idx = np.unravel_index(np.argmin(dist, axis=None),dist.shape)
-            # Temporally store found idx in list
-            tmp_MapYIdx_raw.append(mapped_idx[0])
-            tmp_MapXIdx_raw.append(mapped_idx[1])
-        print('MapRaw done', flush=True)
+        ObsIDs  = np.asarray(self.ObsIDs).tolist()
+        MapYIdx = np.zeros(self.ObsLons.shape, dtype=np.int64)
+        MapXIdx = np.zeros(self.ObsLons.shape, dtype=np.int64)
+        # take all ObsIDs which did not move from the station cache
+        cached  = np.zeros(self.ObsLons.shape, dtype=bool)
+        for idx, ObsID in enumerate(ObsIDs):
+            entry = self.__stationCache.get(ObsID)
+            if (entry is not None and entry['lon'] == self.ObsLons[idx] 
+                    and entry['lat'] == self.ObsLats[idx]):
+                MapYIdx[idx], MapXIdx[idx] = entry['raw']
+                cached[idx] = True
+
+        todo = np.flatnonzero(~cached)
+        if self.SimGridDef is not None and todo.size > 0:
+            # SimGrid is a regular rotated grid, so the pixel of each ObsID
+            # is found analytically. Only ObsIDs outside SimGrid are mapped
+            # on the nearest (border) pixel by the spatial index below.
+            MapYIdx[todo], MapXIdx[todo], inside = toolBox.get_rotGridIndex(
+                    self.ObsLons[todo], self.ObsLats[todo], self.SimGridDef)
+            todo = todo[~inside]
+        if todo.size > 0:
+            # Query the nearest pixel of all remaining ObsIDs at once from 
+            # the (cached) spatial index of SimGrid
+            _, flatIdx = self.get_SimTree().query(self.lonlat2xyz(self.ObsLons[todo], 
+                                                                  self.ObsLats[todo]))
+            mapped_idx = np.unravel_index(flatIdx, self.SimLons.shape)
+            MapYIdx[todo] = mapped_idx[0]
+            MapXIdx[todo] = mapped_idx[1]
+        print('\rMapRaw done', flush=True)
+
+        # Rebuild the station cache for the current ObsIDs, keeping all 
+        # further results of ObsIDs which did not move
+        stationCache = {}
+        for idx, ObsID in enumerate(ObsIDs):
+            if cached[idx]:
+                stationCache[ObsID] = self.__stationCache[ObsID]
+            else:
+                stationCache[ObsID] = {'lon': self.ObsLons[idx], 'lat': self.ObsLats[idx],
+                                       'raw': (MapYIdx[idx], MapXIdx[idx]),
+                                       'candidates': {}}
+        self.__stationCache = stationCache
 
         # update object-variables with found information
-        self.MapYIdx_raw = np.array(tmp_MapYIdx_raw)
-        self.MapXIdx_raw = np.array(tmp_MapXIdx_raw)
+        self.MapYIdx_raw = MapYIdx
+        self.MapXIdx_raw = MapXIdx
+        self.MapYIdx_fitMembers = None
+        self.MapXIdx_fitMembers = None
 
     def __check4MapQ(self):
         ''' This is a separate function to keep MapXXX functions readable.
@@ -401,7 +556,7 @@ class mapper:
         if self.ObsMeanQ is None:
             print('self.ObsMeanQ is not defined yet, but required by function self.check4MapQ()!')
             return False
-        if self.SimMeanQ.shape != self.SimLons.shape:
+        if self.SimMeanQ.shape[-2:] != self.SimLons.shape:
             print(f'The shape of self.SimMeanQ {self.SimMeanQ.shape} is not equal the shape of self.SimLons / self.SimLats {self.SimLons.shape}!')
             return False
         if self.ObsMeanQ.shape != self.ObsLons.shape:
@@ -410,6 +565,72 @@ class mapper:
 
         return True
 
+    def __get_searchWindows(self, search_rad, field=None):
+        ''' Gather the search window around the raw pixel of all ObsIDs.
+
+        The windows of all ObsIDs are gathered at once with one fancy index
+        of the candidate pixel (y-offset outer, x-offset inner). Pixel 
+        outside the domain are NaN, so windows at the domain border are 
+        complete. The field (SimMeanQ by default) could be a stack of 
+        fields (..., ny, nx), e.g. of several ensemble members, in which 
+        case the same pixel are gathered from each field without copying 
+        the stack.
+
+        Returns
+        -------
+        windows : ndarray
+            (..., nObs, (2*search_rad+1)**2) flattened windows
+        '''
+        if field is None:
+            field = self.SimMeanQ
+        ny, nx = field.shape[-2:]
+        y_inc, x_inc = np.meshgrid(np.arange(-search_rad, search_rad+1),
+                                   np.arange(-search_rad, search_rad+1),
+                                   indexing='ij')
+        candidateY = self.MapYIdx_raw[:, None] + y_inc.ravel()[None, :]
+        candidateX = self.MapXIdx_raw[:, None] + x_inc.ravel()[None, :]
+        inside = ((candidateY >= 0) & (candidateY < ny) & 
+                  (candidateX >= 0) & (candidateX < nx))
+        windows = field[..., np.clip(candidateY, 0, ny-1), np.clip(candidateX, 0, nx-1)]
+        windows = np.ma.filled(np.ma.asarray(windows, dtype=float), fill_value=np.nan)
+        windows[..., ~inside] = np.nan
+        return windows
+
+    def __window2Idx(self, winIdx, search_rad):
+        ''' Convert flat window indices (..., nObs) to global indices '''
+        winSize = 2 * search_rad + 1
+        return (self.MapYIdx_raw + winIdx // winSize - search_rad,
+                self.MapXIdx_raw + winIdx % winSize - search_rad)
+
+    def __fitWindows(self, windows, search_rad, select):
+        ''' Set MapXXXIdx_fit to the pixel selected within each window.
+
+        select is called with the windows and returns the flat window index
+        of the selected pixel. ObsIDs without any valid pixel within their 
+        window (all NaN, e.g. masked or outside the domain) keep their raw
+        pixel, since any selected index would be arbitrary. If the windows are gathered from a stack of 
+        SimMeanQ (n_members, nObs, winSize), the fit of each member is set 
+        to self.MapYIdx_fitMembers and self.MapXIdx_fitMembers (n_members, 
+        nObs), while self.MapYIdx_fit and self.MapXIdx_fit are kept 1D and 
+        hold the fit of the ensemble mean.
+        '''
+        def fit(windows):
+            fitY, fitX = self.__window2Idx(select(windows), search_rad)
+            empty = np.isnan(windows).all(axis=-1)
+            return (np.where(empty, self.MapYIdx_raw, fitY), 
+                    np.where(empty, self.MapXIdx_raw, fitX))
+
+        if windows.ndim == 3:
+            self.MapYIdx_fitMembers, self.MapXIdx_fitMembers = fit(windows)
+            # windows of the ensemble mean, pixel outside the domain stay NaN
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                windows = np.nanmean(windows, axis=0)
+        empty = np.isnan(windows).all(axis=-1)
+        if empty.any():
+            print(f'WARNING: no valid pixel within search_rad {search_rad} of ObsIDs {self.ObsIDs[empty]} --> raw pixel kept')
+        self.MapYIdx_fit, self.MapXIdx_fit = fit(windows)
+
     def MapBestQ(self, search_rad=1):
         ''' This functions maps OBS on SimGrid by choosing that pixel with best 
         fitting discharge (Q) within given radius.
@@ -418,6 +639,16 @@ class mapper:
         each pixel within a given radius around the origin pixel.
         The origin pixel is hereby defined by MapRaw().
         That pixel with Q closes to GRDC data is than set.
+        All ObsIDs are handled at once. Near the domain border only pixel
+        inside the domain are considered.
+        If SimMeanQ is a stack of several members (n_members, ny, nx), the
+        raw mapping and the search windows are calculated once and the best
+        fitting pixel of all members is found by one reduction. The fit of 
+        each member is stored in self.MapYIdx_fitMembers and 
+        self.MapXIdx_fitMembers of shape (n_members, nObs), while 
+        self.MapYIdx_fit and self.MapXIdx_fit hold the fit of the ensemble
+        mean, so all functions using the fit (e.g. writeMap2File(), 
+        get_SimSeries()) work as with a single SimMeanQ.
 
         Parameters
         ----------
@@ -442,33 +673,19 @@ class mapper:
             print('check4MapQ() failed --> self.MapBestQ() canceled!')
             return None
 
-        # Create empty lists for results
-        tmp_MapXIdx_fit = []
-        tmp_MapYIdx_fit = []
-        # Loop over all ObsIDs stored with the object
-        for idx, ObsID in enumerate(self.ObsIDs):
-            # Set the original pixel around which to search
-            y = self.MapYIdx_raw[idx]
-            x = self.MapXIdx_raw[idx]
-            # extract subset of self.SimMeanQ around origin pixel
-            # and search radius search_rad (+1 cause last is exclusive)
-            sub_SimMeanQ = self.SimMeanQ[y-search_rad:y+search_rad+1, x-search_rad:x+search_rad+1]
-            sub_ObsMeanQ = self.ObsMeanQ[idx]
-            # Calculate difference between SimMeanQ and ObsMeanQ (GRDC) within subset
-            dist = np.abs(sub_SimMeanQ - sub_ObsMeanQ)
-            # Get index of best fitting Q (min(dist)) within subset
-            mapped_idx = np.unravel_index(np.argmin(dist, axis=None),dist.shape)
-
-            # Convert subset-index to global index and
-            # store (x|y) of best fitting Q in results list
-            tmp_realYidx = (y - search_rad) + mapped_idx[0]
-            tmp_realXidx = (x - search_rad) + mapped_idx[1]
-            tmp_MapYIdx_fit.append(tmp_realYidx)
-            tmp_MapXIdx_fit.append(tmp_realXidx)
-
-        # update object-variables with found information
-        self.MapYIdx_fit = np.array(tmp_MapYIdx_fit)
-        self.MapXIdx_fit = np.array(tmp_MapXIdx_fit)
+        # Gather the search windows of all ObsIDs at once
+        windows = self.__get_searchWindows(search_rad)
+        ObsMeanQ = np.asarray(self.ObsMeanQ, dtype=float)[:, None]
+        def select(windows):
+            # difference between SimMeanQ and ObsMeanQ (GRDC) within each 
+            # window, with a stack of SimMeanQ ObsMeanQ is broadcasted along
+            # the members
+            dist = np.abs(windows - ObsMeanQ)
+            # pixel outside the domain (NaN) never fit best
+            dist[np.isnan(dist)] = np.inf
+            # index of best fitting Q (min(dist)) within each window
+            return np.argmin(dist, axis=-1)
+        self.__fitWindows(windows, search_rad, select)
 
     def MapHighQ(self, search_rad=1):
         ''' This functions maps OBS on SimGrid by choosing that pixel with highest 
@@ -478,6 +695,11 @@ class mapper:
         the subset (search_rad around origin pixel) of SimMeanQ.
         The origin pixel is hereby defined by MapRaw()
         SimMeanQ is part of the objects-variables
+        All ObsIDs are handled at once. Near the domain border only pixel
+        inside the domain are considered.
+        If SimMeanQ is a stack of several members (n_members, ny, nx), the
+        fit of each member is stored in self.MapYIdx_fitMembers and 
+        self.MapXIdx_fitMembers, see MapBestQ().
         
         Parameters
         ----------
@@ -501,31 +723,12 @@ class mapper:
             print('check4MapQ() failed --> self.MapBestQ() canceled!')
             return None
 
-        # Create empty lists for results
-        tmp_MapXIdx_fit = []
-        tmp_MapYIdx_fit = []
-        # Loop over all ObsIDs stored with the object
-        for idx, ObsID in enumerate(self.ObsIDs):
-            # Set the original pixel around which to search
-            y = self.MapYIdx_raw[idx]
-            x = self.MapXIdx_raw[idx]
-            # extract sub area of self.SimMeanQ according to current ObsID
-            # and search radius search_rad (+1 because last is exclusive)
-            sub_SimMeanQ = self.SimMeanQ[y-search_rad:y+search_rad+1, x-search_rad:x+search_rad+1]
-            # sub_ObsMeanQ = self.ObsMeanQ[idx] # REMOVE
-            # Get index of Q within subset
-            mapped_idx = np.unravel_index(np.argmax(sub_SimMeanQ, axis=None),sub_SimMeanQ.shape)
-
-            # Convert subset-index to global index and
-            # store (x|y) of highest Q in results list
-            tmp_realYidx = (y - search_rad) + mapped_idx[0]
-            tmp_realXidx = (x - search_rad) + mapped_idx[1]
-            tmp_MapYIdx_fit.append(tmp_realYidx)
-            tmp_MapXIdx_fit.append(tmp_realXidx)
-
-        # update object-variables with found information
-        self.MapYIdx_fit = np.array(tmp_MapYIdx_fit)
-        self.MapXIdx_fit = np.array(tmp_MapXIdx_fit)
+        # Gather the search windows of all ObsIDs at once
+        windows = self.__get_searchWindows(search_rad)
+        def select(windows):
+            # pixel outside the domain (NaN) are never the highest
+            return np.argmax(np.where(np.isnan(windows), -np.inf, windows), axis=-1)
+        self.__fitWindows(windows, search_rad, select)
 
     def __check4MapArea(self):
         ''' This is a separate function to keep MapXXX functions readable.
@@ -549,7 +752,8 @@ class mapper:
 
         return True
 
-    def MapBestCatchment(self, search_rad=1, dx=12500., dy=12500., slopey=None, slopex=None):
+    def MapBestCatchment(self, search_rad=1, dx=12500., dy=12500., slopey=None, slopex=None,
+                         n_workers=1, progress=None):
         ''' This functions maps OBS on SimGrid by choosing that pixel which related 
         catchment area fits best to GRDC.
 
@@ -570,6 +774,15 @@ class mapper:
             defining the ParFlow slopes in y-direction used to calculate the catchment
         slopex: 2D ndarray
             defining the ParFlow slopes in x-direction used to calculate the catchment
+        n_workers: int
+            number of processes used to calculate the catchments of all 
+            candidate pixels. With n_workers > 1 the slopes are shared with 
+            the workers via shared memory (see toolBox.calc_catchmentSizes()).
+        progress: callable
+            called as progress(nDone, nTotal) each time all candidates of 
+            an ObsID are finished, e.g. to update a progress bar, where 
+            nTotal is the number of ObsIDs to calculate. Results are always
+            returned in the order of self.ObsIDs.
 
         Returns
         -------
@@ -578,7 +791,13 @@ class mapper:
         Notes
         -----
         This function sets / updates the object variables self.MapYIdx_fit, 
-        self.MapXIdx_fit, and self.SimMeanArea directly
+        self.MapXIdx_fit, and self.SimMeanArea directly.
+        The catchment areas of all candidate pixel are cached per ObsID 
+        (see MapRaw()), so calling this function again, e.g. after adding 
+        ObsIDs or changing ObsMeanArea, does only calculate the candidates 
+        of new or moved ObsIDs, or if search_rad, dx, dy, or the slopes 
+        changed. Only the candidates of the latest search_rad, dx, dy, and
+        slopes are kept.
 
         '''
 
@@ -589,20 +808,73 @@ class mapper:
             print('check4MapArea() failed --> self.MapBestCatchment() canceled!')
             return None
 
+        # Only ObsIDs without cached candidates for the current parameters 
+        # are calculated, all others are taken from the station cache
+        candidateKey = self.__get_candidateKey(search_rad, dx, dy, slopey, slopex)
+        ObsIDs = np.asarray(self.ObsIDs).tolist()
+        rows = [idx for idx, ObsID in enumerate(ObsIDs) 
+                if candidateKey not in self.__stationCache[ObsID]['candidates']]
+        print(f'MapBestCatchment start ({len(rows)} of {len(ObsIDs)} ObsIDs to calculate)', flush=True)
+        if len(rows) > 0:
+            rows = np.asarray(rows)
+            if n_workers > 1:
+                candidates = self.__calc_candidateAreas_parallel(rows, search_rad=search_rad,
+                        dx=dx, dy=dy, slopey=slopey, slopex=slopex, n_workers=n_workers, 
+                        progress=progress)
+            else:
+                candidates = self.__calc_candidateAreas(rows, search_rad=search_rad,
+                        dx=dx, dy=dy, slopey=slopey, slopex=slopex, progress=progress)
+            # keep the candidates of the latest parameters only, so the cache
+            # does not grow with each set of parameters used
+            for n, idx in enumerate(rows):
+                self.__stationCache[ObsIDs[idx]]['candidates'] = \
+                        {candidateKey: tuple(candidate[n] for candidate in candidates)}
+
+        candidateY, candidateX, catchmentArea = (np.stack(candidate) for candidate in 
+                zip(*[self.__stationCache[ObsID]['candidates'][candidateKey] for ObsID in ObsIDs]))
+        # Calculate difference between calculated catchment areas and GRDC 
+        # data and get index of best fitting catchment (min(dist)) per ObsID
+        dist = np.abs(catchmentArea - np.asarray(self.ObsMeanArea)[:, None])
+        best = np.argmin(dist, axis=1)
+        rows = np.arange(candidateX.shape[0])
+        print(f'MapBestCatchment done',  flush=True)
+        # update object-variables with found information
+        self.MapYIdx_fit = candidateY[rows, best]
+        self.MapXIdx_fit = candidateX[rows, best]
+        self.SimMeanArea = catchmentArea[rows, best]
+
+    def __get_candidateKey(self, search_rad, dx, dy, slopey, slopex):
+        ''' Return the key candidate catchments are cached with.
+
+        The catchment areas of the candidate pixel do depend on the raw 
+        pixel of an ObsID, search_rad, dx, dy, and the slopes (hashed by 
+        content), but not on ObsMeanArea.
+        '''
+        slopeHash = hashlib.sha1()
+        for slope in [slopex, slopey]:
+            slope = np.ascontiguousarray(np.ma.filled(np.ma.asarray(slope), fill_value=np.nan))
+            slopeHash.update(f'{slope.shape}{slope.dtype}'.encode())
+            slopeHash.update(slope.tobytes())
+        return (int(search_rad), float(dx), float(dy), slopeHash.hexdigest())
+
+    def __calc_candidateAreas(self, rows, search_rad, dx, dy, slopey, slopex, progress=None):
+        ''' Calculate the catchment area of all candidate pixel of given rows.
+
+        Returns
+        -------
+        candidateY, candidateX, catchmentArea : ndarray
+            (len(rows), nCandidates) ndarrays
+        '''
         # Create empty lists for results
-        tmp_MapXIdx_fit = []
-        tmp_MapYIdx_fit = []
-        tmp_SimManArea = []
-        # Loop over all ObsIDs stored with the object
-        print(f'MapBestCatchment ObsID: start',  end='')
-        numObsIDs = len(self.ObsIDs)
-        for idx, ObsID in enumerate(self.ObsIDs):
-            print(f'\rMapBestCatchment ObsID: {ObsID} ({idx} / {numObsIDs})', end='', flush=True)
+        tmp_catchmentY = []
+        tmp_catchmentX = []
+        tmp_catchmentArea = []
+        # Loop over all requested ObsIDs
+        numRows = len(rows)
+        for n, idx in enumerate(rows):
             # Set the original pixel around which to search
             y        = self.MapYIdx_raw[idx]
             x        = self.MapXIdx_raw[idx]
-            # Set catchment area defined by GRDC to compare with
-            meanArea = self.ObsMeanArea[idx]
 
             # Create lists for temporary results
             tmp_catchmentAreaList = []
@@ -622,41 +894,402 @@ class mapper:
                     # Than change units from [m^2] to [km^2] to stay compatible to GRDC
                     tmp_catchmentMask *= dx*dy
                     tmp_catchmentMask *= 1./(1000.*1000.)
-                    tmp_catchmentArea= np.nansum(tmp_catchmentMask)
+                    tmp_catchmentArea_pixel = np.nansum(tmp_catchmentMask)
                     # Add information for current inspected pixel in 
                     # temporary results list
-                    tmp_catchmentAreaList.append(tmp_catchmentArea)
+                    tmp_catchmentAreaList.append(tmp_catchmentArea_pixel)
                     tmp_catchmentXList.append(tmp_x)
                     tmp_catchmentYList.append(tmp_y)
 
-            # Convert temporary results list to ndarray
-            tmp_catchmentArea = np.asarray(tmp_catchmentAreaList)
-            tmp_catchmentX = np.asarray(tmp_catchmentXList)
-            tmp_catchmentY = np.asarray(tmp_catchmentYList)
-            # Now tmp_catchmentArea is a numpy.ndarray holding the catchment-size
-            # of the pixel related to X and Y values stored in tmp_catchmentX 
-            # and tmp_catchmentY;
             # X and Y are absolute pixels of passed slopex and slopey and NOT of 
             # a subset.
+            tmp_catchmentY.append(tmp_catchmentYList)
+            tmp_catchmentX.append(tmp_catchmentXList)
+            tmp_catchmentArea.append(tmp_catchmentAreaList)
+            if progress is not None:
+                progress(n + 1, numRows)
+
+        return (np.asarray(tmp_catchmentY), np.asarray(tmp_catchmentX),
+                np.asarray(tmp_catchmentArea, dtype=float))
+
+    def __calc_candidateAreas_parallel(self, rows, search_rad, dx, dy, slopey, slopex, n_workers,
+                                       progress=None):
+        ''' Parallel version of self.__calc_candidateAreas()
+
+        All candidate pixel of all rows are collected first and handed 
+        over to toolBox.calc_catchmentSizes() at once, which distributes them
+        among n_workers processes. The candidates are ordered as in the 
+        serial loop, so both versions do select the same pixel. As the 
+        results are returned in order, all candidates of an ObsID are 
+        finished once its last candidate is, which is reported to progress.
+        '''
+        # Offsets of all pixel within search_rad around the origin pixel, in
+        # the same order as the serial loop (x_inc outer, y_inc inner)
+        x_inc, y_inc = np.meshgrid(np.arange(-search_rad, search_rad+1),
+                                   np.arange(-search_rad, search_rad+1),
+                                   indexing='ij')
+        # (nRows, nCandidates)
+        candidateX = self.MapXIdx_raw[rows, None] + x_inc.ravel()[None, :]
+        candidateY = self.MapYIdx_raw[rows, None] + y_inc.ravel()[None, :]
+
+        print(f'MapBestCatchment: {candidateX.size} candidates on {n_workers} workers', flush=True)
+        nCandidates = candidateX.shape[1]
+        numRows     = candidateX.shape[0]
+        candidateProgress = None
+        if progress is not None:
+            def candidateProgress(nDone, nTotal):
+                if nDone % nCandidates == 0:
+                    progress(nDone // nCandidates, numRows)
+        catchmentSize = toolBox.calc_catchmentSizes(slopex, slopey,
+                candidateX.ravel(), candidateY.ravel(), n_workers=n_workers,
+                progress=candidateProgress)
+        # Calculate area of catchment by multiplying with dx and dy
+        # Than change units from [m^2] to [km^2] to stay compatible to GRDC
+        catchmentArea = catchmentSize.reshape(candidateX.shape) * dx*dy / (1000.*1000.)
+        return candidateY, candidateX, catchmentArea
+
+    def MapFlowPath(self, flow_dist=5, criterion='Q', network=None, slopey=None, slopex=None,
+                    threshold=None, snap_rad=None, dx=12500., dy=12500., n_workers=1):
+        ''' This functions maps OBS on SimGrid by choosing the best fitting 
+        pixel along the river network.
+
+        Instead of all pixel of a square window (see MapBestQ() and 
+        MapBestCatchment()), only river pixel connected to the origin pixel
+        by the D4 drainage graph are considered: the origin pixel (defined 
+        by MapRaw()) is snapped to the river network first, and the network
+        is followed up to flow_dist pixel downstream and upstream (see 
+        toolBox.get_flowPathCandidates()). Of those candidates the pixel 
+        fitting best according to criterion is set; with equal fit the 
+        pixel closer along the flow path is chosen.
+        With criterion 'area' the catchment area of each candidate is taken
+        out of the flow accumulation of the network, so no catchment has to
+        be traced at all. This is only done if each pixel drains in one 
+        direction only (network['nDualDrain'] == 0), otherwise the flow 
+        accumulation differs from toolBox.calc_catchment() (see 
+        toolBox.get_dualDrain()), and the catchments of the candidates are 
+        traced from slopex and slopey as in MapBestCatchment(). So both 
+        methods do fit the same catchment areas.
 
-            # Calculate difference between calculated catchment areas and GRDC data
-            dist = np.abs( tmp_catchmentArea - meanArea )
-            # Get index of best fitting catchment (min(dist)) within temporary 
-            # result list
-            mapped_idx = np.unravel_index(np.argmin(dist, axis=None),dist.shape)
-            # Store information of best fitting pixel with results list 
-            tmp_best_fitting_area_x = tmp_catchmentX[mapped_idx[0]]
-            tmp_best_fitting_area_y = tmp_catchmentY[mapped_idx[0]]
-            tmp_best_fitting_area   = tmp_catchmentArea[mapped_idx[0]]
-            tmp_MapYIdx_fit.append(tmp_best_fitting_area_y)
-            tmp_MapXIdx_fit.append(tmp_best_fitting_area_x)
-            tmp_SimManArea.append(tmp_best_fitting_area)
+        Parameters
+        ----------
+        flow_dist : int 
+            maximal flow distance in pixel to follow the river network 
+            downstream and upstream.
+        criterion : str
+            'Q' to select the pixel with SimMeanQ closest to ObsMeanQ, or 
+            'area' to select the pixel with catchment area closest to 
+            ObsMeanArea.
+        network : dict
+            river network as returned by toolBox.calc_riverNetwork(). If 
+            None, the network is calculated out of slopex, slopey, and 
+            threshold.
+        slopey: 2D ndarray
+            defining the ParFlow slopes in y-direction
+        slopex: 2D ndarray
+            defining the ParFlow slopes in x-direction
+        threshold: int
+            minimum flow accumulation (number of pixel) of a river pixel
+        snap_rad: float
+            maximal distance in pixel to snap the origin pixel to the river
+            network (default is flow_dist). ObsIDs without river pixel 
+            within snap_rad keep their origin pixel.
+        dy: float
+            defining the y-resolution of slope-grid (in [m])
+        dx: float
+            defining the x-resolution of slope-grid (in [m])
+        n_workers: int
+            number of processes used to trace the catchments of the 
+            candidates, if needed (see toolBox.calc_catchmentSizes()).
 
-        print(f'MapBestCatchment done',  flush=True)
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        This function sets / updates the object variables self.MapYIdx_fit, 
+        self.MapXIdx_fit, and self.SimMeanArea directly (the latter with 
+        criterion 'area' only).
+
+        '''
+        supportedCriteria = ['Q', 'area']
+        if criterion not in supportedCriteria:
+            print(f'ERROR: criterion "{criterion}" is not supported, supported are: {supportedCriteria}')
+            return None
+        # First MapRaw(), than adjust along the river network
+        self.MapRaw()
+        #check if all needed data are already defined
+        if criterion == 'Q':
+            if not self.__check4MapQ():
+                print('check4MapQ() failed --> self.MapFlowPath() canceled!')
+                return None
+            if self.SimMeanQ.ndim != 2:
+                print('a stack of SimMeanQ is not supported --> self.MapFlowPath() canceled!')
+                return None
+        if criterion == 'area' and not self.__check4MapArea():
+            print('check4MapArea() failed --> self.MapFlowPath() canceled!')
+            return None
+        if network is None:
+            if slopex is None or slopey is None or threshold is None:
+                print('either network or slopex, slopey, and threshold are required --> self.MapFlowPath() canceled!')
+                return None
+            network = toolBox.calc_riverNetwork(slopex, slopey, threshold)
+        if tuple(network['shape']) != self.SimLons.shape:
+            print(f'The shape of the network {network["shape"]} is not equal the shape of self.SimLons / self.SimLats {self.SimLons.shape}!')
+            return None
+        traceCatchments = criterion == 'area' and network.get('nDualDrain', 0) > 0
+        if traceCatchments and (slopex is None or slopey is None):
+            print(f'{network["nDualDrain"]} pixel of the network drain in x- and y-direction, so slopex and slopey are required to trace the catchments --> self.MapFlowPath() canceled!')
+            return None
+        if snap_rad is None:
+            snap_rad = flow_dist
+
+        candPoint, candX, candY, candDist = toolBox.get_flowPathCandidates(network,
+                self.MapXIdx_raw, self.MapYIdx_raw, maxDist=flow_dist, snapDist=snap_rad)
+        print(f'MapFlowPath: {candPoint.size} candidates for {self.MapXIdx_raw.size} ObsIDs', flush=True)
+
+        if criterion == 'Q':
+            candQ = np.ma.filled(np.ma.asarray(self.SimMeanQ[candY, candX], dtype=float),
+                                 fill_value=np.nan)
+            cost = np.abs(candQ - np.asarray(self.ObsMeanQ, dtype=float)[candPoint])
+        else:
+            # Calculate area of catchment by multiplying with dx and dy
+            # Than change units from [m^2] to [km^2] to stay compatible to GRDC
+            if traceCatchments:
+                catchmentSize = toolBox.calc_catchmentSizes(slopex, slopey, candX, candY,
+                                                            n_workers=n_workers)
+            else:
+                catchmentSize = network['flowAcc'][candY, candX]
+            candArea = catchmentSize * dx*dy / (1000.*1000.)
+            cost = np.abs(candArea - np.asarray(self.ObsMeanArea, dtype=float)[candPoint])
+
+        # Sort the candidates by ObsID, fit (NaN last), and flow distance, so
+        # the first candidate of each ObsID is the best fitting one
+        order = np.lexsort((np.abs(candDist), cost, candPoint))
+        best  = order[np.flatnonzero(np.diff(candPoint[order], prepend=-1))]
+        # update object-variables with found information
+        self.MapYIdx_fit = candY[best]
+        self.MapXIdx_fit = candX[best]
+        if criterion == 'area':
+            self.SimMeanArea = candArea[best]
+
+    def MapScore(self, search_rad=1, weights=None,
+                 dx=12500., dy=12500., slopey=None, slopex=None, n_workers=1):
+        ''' This functions maps OBS on SimGrid by a weighted score of several 
+        criteria, evaluated for all candidate pixel at once.
+
+        Instead of running MapBestQ(), MapHighQ(), or MapBestCatchment() one 
+        after the other, this function evaluates each candidate pixel within
+        search_rad around the origin pixel (defined by MapRaw()) of all 
+        ObsIDs once, for the criteria
+        -) 'dist': spherical distance between OBS and the candidate pixel, 
+                   relative to the largest distance within the window
+        -) 'Q':    |SimMeanQ - ObsMeanQ| / ObsMeanQ
+        -) 'area': |catchment area - ObsMeanArea| / ObsMeanArea
+        The criteria are combined to score = sum(weight * criterion), and 
+        the candidate with the lowest score is set. Criteria with weight 0 
+        are not calculated, so e.g. no slopes are needed without 'area'.
+        Candidates outside the domain are never set.
+
+        Parameters
+        ----------
+        search_rad : int 
+            defining the radius around the origin pixel to search in. 
+        weights : dict
+            the weight of each criterion, with the keys 'dist', 'Q', 'area'.
+            Missing keys are treated as 0. Default is weight 1 for all 
+            criteria.
+        dy: float
+            defining the y-resolution of slope-grid (in [m])
+        dx: float
+            defining the x-resolution of slope-grid (in [m])
+        slopey: 2D ndarray
+            defining the ParFlow slopes in y-direction used to calculate the catchment
+        slopex: 2D ndarray
+            defining the ParFlow slopes in x-direction used to calculate the catchment
+        n_workers: int
+            number of processes used to calculate the catchments of all 
+            candidate pixel (see toolBox.calc_catchmentSizes()).
+
+        Returns
+        -------
+        scores : dict
+            The score cube for diagnostics, holding ndarrays of shape 
+            (nObs, 2*search_rad+1, 2*search_rad+1) centered at the origin 
+            pixel: 'score', each calculated criterion, and 'candidateY' and
+            'candidateX', the global indices of the candidates.
+
+        Notes
+        -----
+        This function sets / updates the object variables self.MapYIdx_fit, 
+        and self.MapXIdx_fit directly, and self.SimMeanArea if 'area' is 
+        used.
+
+        '''
+        if weights is None:
+            weights = {'dist': 1., 'Q': 1., 'area': 1.}
+        weights = {key: float(weights.get(key, 0.)) for key in ['dist', 'Q', 'area']}
+        self.MapRaw()
+        #check if all needed data are already defined
+        if weights['Q'] != 0. and not self.__check4MapQ():
+            print('check4MapQ() failed --> self.MapScore() canceled!')
+            return None
+        if weights['Q'] != 0. and self.SimMeanQ.ndim != 2:
+            print('a stack of SimMeanQ is not supported --> self.MapScore() canceled!')
+            return None
+        if weights['area'] != 0.:
+            if not self.__check4MapArea():
+                print('check4MapArea() failed --> self.MapScore() canceled!')
+                return None
+            if slopex is None or slopey is None:
+                print('slopex and slopey are required for criterion "area" --> self.MapScore() canceled!')
+                return None
+
+        winSize = 2 * search_rad + 1
+        y_inc, x_inc = np.meshgrid(np.arange(-search_rad, search_rad+1),
+                                   np.arange(-search_rad, search_rad+1),
+                                   indexing='ij')
+        # (nObs, nCandidates), in the order of self.__get_searchWindows()
+        candidateY = self.MapYIdx_raw[:, None] + y_inc.ravel()[None, :]
+        candidateX = self.MapXIdx_raw[:, None] + x_inc.ravel()[None, :]
+        inside = ((candidateY >= 0) & (candidateY < self.SimLons.shape[0]) & 
+                  (candidateX >= 0) & (candidateX < self.SimLons.shape[1]))
+
+        criteria = {}
+        if weights['dist'] != 0.:
+            candLons = self.__get_searchWindows(search_rad, field=self.SimLons)
+            candLats = self.__get_searchWindows(search_rad, field=self.SimLats)
+            dist = self.spher_dist(np.deg2rad(candLons), np.deg2rad(candLats),
+                                   np.deg2rad(self.ObsLons)[:, None],
+                                   np.deg2rad(self.ObsLats)[:, None])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                criteria['dist'] = dist / np.nanmax(dist, axis=1, keepdims=True)
+        if weights['Q'] != 0.:
+            candQ = self.__get_searchWindows(search_rad)
+            ObsMeanQ = np.asarray(self.ObsMeanQ, dtype=float)[:, None]
+            criteria['Q'] = np.abs(candQ - ObsMeanQ) / np.abs(ObsMeanQ)
+        if weights['area'] != 0.:
+            print(f'MapScore: {np.sum(inside)} catchments on {n_workers} workers', flush=True)
+            catchmentSize = np.full(candidateY.shape, np.nan)
+            catchmentSize[inside] = toolBox.calc_catchmentSizes(slopex, slopey,
+                    candidateX[inside], candidateY[inside], n_workers=n_workers)
+            # Calculate area of catchment by multiplying with dx and dy
+            # Than change units from [m^2] to [km^2] to stay compatible to GRDC
+            catchmentArea = catchmentSize * dx*dy / (1000.*1000.)
+            ObsMeanArea = np.asarray(self.ObsMeanArea, dtype=float)[:, None]
+            criteria['area'] = np.abs(catchmentArea - ObsMeanArea) / ObsMeanArea
+
+        score = np.zeros(candidateY.shape)
+        for key in criteria:
+            score += weights[key] * criteria[key]
+        # candidates outside the domain (or with invalid data) are never set
+        score[~inside | np.isnan(score)] = np.inf
+        best = np.argmin(score, axis=1)
+        rows = np.arange(candidateY.shape[0])
         # update object-variables with found information
-        self.MapYIdx_fit = np.array(tmp_MapYIdx_fit)
-        self.MapXIdx_fit = np.array(tmp_MapXIdx_fit)
-        self.SimMeanArea = np.array(tmp_SimManArea)
+        self.MapYIdx_fit = candidateY[rows, best]
+        self.MapXIdx_fit = candidateX[rows, best]
+        if weights['area'] != 0.:
+            self.SimMeanArea = catchmentArea[rows, best]
+
+        cubeShape = (candidateY.shape[0], winSize, winSize)
+        scores = {'score': score.reshape(cubeShape),
+                  'candidateY': candidateY.reshape(cubeShape),
+                  'candidateX': candidateX.reshape(cubeShape)}
+        for key in criteria:
+            scores[key] = criteria[key].reshape(cubeShape)
+        return scores
+
+    def get_SimSeries(self, source, varName=None, fit=True, dates=None,
+                      alignDates=None, sliceInterval='month', layer=None,
+                      chunkSize=None, boxSize=32):
+        ''' Read the simulated time-series at the mapped pixel of all ObsIDs.
+
+        Instead of reading the entire field (e.g. the discharge of the full
+        domain) only the mapped pixel are read, where nearby ObsIDs share 
+        one bounding box and the source is read chunk-wise along time (see 
+        IO.read_pointSeries()). So the memory needed is bound by the 
+        returned series.
+        If alignDates is passed (e.g. GRDCdataset.time), the simulated 
+        series are aligned to it: all time-steps of the same interval (see 
+        toolBox.get_intervalKeys()) are averaged and set at the date of 
+        alignDates within the same interval, NaN where no simulated data 
+        is available.
+
+        Parameters
+        ----------
+        source : ndarray, netCDF4.Variable, str, or list of str
+            The simulated time-series, see IO.iter_timeChunks() for all
+            supported sources.
+        varName : str
+            name of the variable to read if source is a netCDF file.
+        fit : bool
+            If True the fit indices (self.MapYIdx_fit, self.MapXIdx_fit) 
+            are used, the raw indices otherwise.
+        dates : NDarray
+            the dates of each time-step of source, required with alignDates.
+        alignDates : NDarray
+            the dates to align the series to, e.g. GRDCdataset.time. A 2D
+            ndarray of shape (n_stations, t) is expected to hold the same
+            dates for each station, so only the first row is used.
+        sliceInterval : str
+            the interval used to match dates and alignDates (default is 
+            'month').
+        layer : int
+            layer to select if source is 4D or a series of 3D PFB files.
+        chunkSize : int
+            number of time-steps read at once.
+        boxSize : int
+            edge length of the tiles ObsIDs are grouped into.
+
+        Returns
+        -------
+        ndarray
+            2D ndarray of shape (n_stations, t), in the order of 
+            self.ObsIDs, where t is the length of alignDates if passed.
+        '''
+        if fit:
+            MapYIdx, MapXIdx = self.MapYIdx_fit, self.MapXIdx_fit
+        else:
+            MapYIdx, MapXIdx = self.MapYIdx_raw, self.MapXIdx_raw
+        if MapYIdx is None or MapXIdx is None:
+            print(f'ERROR: no mapped pixel (fit={fit}) defined yet, run e.g. MapBestQ() first')
+            return None
+
+        series = io.read_pointSeries(source, MapYIdx, MapXIdx, varName=varName,
+                                     layer=layer, chunkSize=chunkSize, boxSize=boxSize)
+        if series is None or alignDates is None:
+            return series
+
+        alignDates = np.asarray(alignDates)
+        if alignDates.ndim == 2:
+            alignDates = alignDates[0]
+        if dates is None:
+            print(f'ERROR: dates of source are required to align the series to alignDates')
+            return None
+        dates = np.asarray(dates)
+        if dates.shape[0] != series.shape[1]:
+            print(f'ERROR: number of dates {dates.shape[0]} != number of time-steps {series.shape[1]}')
+            return None
+
+        # average all time-steps of the same interval and place them at the 
+        # matching interval of alignDates
+        simKeys   = toolBox.get_intervalKeys(dates, sliceInterval=sliceInterval)
+        alignKeys = toolBox.get_intervalKeys(alignDates, sliceInterval=sliceInterval)
+        uniqueKeys, groupIdx = np.unique(simKeys, return_inverse=True)
+        valid = ~np.isnan(series)
+        sums   = np.zeros((series.shape[0], uniqueKeys.size))
+        counts = np.zeros((series.shape[0], uniqueKeys.size))
+        np.add.at(sums.T, groupIdx.ravel(), np.where(valid, series, 0.).T)
+        np.add.at(counts.T, groupIdx.ravel(), valid.T)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            intervalMeans = np.where(counts > 0, sums / counts, np.nan)
+
+        pos = np.clip(np.searchsorted(uniqueKeys, alignKeys), 0, uniqueKeys.size - 1)
+        found = uniqueKeys[pos] == alignKeys
+        aligned = np.full((series.shape[0], alignKeys.size), np.nan)
+        aligned[:, found] = intervalMeans[:, pos[found]]
+        return aligned
 
     def writeMap2File(self, file):
         ''' Write mapped coordinates to a given file.
@@ -694,3 +1327,222 @@ class mapper:
                        self.SimLons[self.MapYIdx_raw[idx], self.MapXIdx_raw[idx]], self.SimLats[self.MapYIdx_raw[idx], self.MapXIdx_raw[idx]]]
                        #self.SimLons[self.MapXIdx_raw[idx], self.MapYIdx_raw[idx]], self.SimLats[self.MapXIdx_raw[idx], self.MapYIdx_raw[idx]]]
                 writer.writerow(row)
+
+    def get_fingerprint(self, method=None, search_rad=None, **params):
+        ''' Return a fingerprint of the mapping input and parameters.
+
+        The fingerprint is a sha1 hash over SimGrid (SimLons, SimLats, and 
+        the grid definition SimGridDef, see setGridFromDef()), the 
+        stations (ObsIDs, ObsLons, ObsLats), the data used for mapping 
+        (SimMeanQ, ObsMeanQ, ObsMeanArea), the mapping method, search_rad,
+        and further parameters of the method (ndarrays as e.g. slopes are 
+        hashed by content). Any change of those does change the fingerprint.
+        Parameters not affecting the result ('n_workers', 'progress') are 
+        ignored.
+
+        Returns
+        -------
+        str
+            the hexdigest of the hash
+        '''
+        fingerprint = hashlib.sha1()
+        def addItem(name, value):
+            fingerprint.update(name.encode())
+            if value is None:
+                fingerprint.update(b'None')
+            elif isinstance(value, dict):
+                # e.g. a river network, see MapFlowPath()
+                for key in sorted(value):
+                    addItem(str(key), value[key])
+            elif isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value)
+                fingerprint.update(f'{value.shape}{value.dtype}'.encode())
+                if value.dtype == object:
+                    fingerprint.update(repr(value.tolist()).encode())
+                else:
+                    fingerprint.update(value.tobytes())
+            else:
+                fingerprint.update(repr(value).encode())
+
+        for name in ['SimLons', 'SimLats', 'SimGridDef', 'ObsIDs', 'ObsLons', 'ObsLats',
+                     'SimMeanQ', 'ObsMeanQ', 'ObsMeanArea']:
+            addItem(name, getattr(self, name))
+        addItem('method', method)
+        addItem('search_rad', search_rad)
+        for name in sorted(params):
+            if name in ['n_workers', 'progress']:
+                continue
+            addItem(name, params[name])
+        return fingerprint.hexdigest()
+
+    # results stored by save(), as far as set
+    __savedNames = ['MapXIdx_raw', 'MapYIdx_raw', 'MapXIdx_fit', 'MapYIdx_fit',
+                    'MapXIdx_fitMembers', 'MapYIdx_fitMembers', 'SimMeanArea']
+
+    @staticmethod
+    def __npzFile(file):
+        ''' Append the extension .npz if missing, as np.savez() does '''
+        return toolBox.get_npzFile(file)
+
+    def save(self, file, method=None, search_rad=None, fingerprint=None, flow_dist=None):
+        ''' Save the mapping results to a compact .npz file.
+
+        Stores the raw and fit indices, the fit of each member (if 
+        SimMeanQ is a stack, see MapBestQ()), SimMeanArea (if calculated), 
+        and the parameters used for mapping, so the results could be loaded again
+        with load() instead of being recalculated (see also 
+        load_or_compute()).
+
+        Parameters
+        ----------
+        file : str 
+            defining the file-path to which data should be written. The 
+            extension .npz is appended if missing.
+        method : str
+            the mapping method used, e.g. 'MapBestQ'.
+        search_rad : int
+            the search_rad used (MapBestQ(), MapHighQ(), MapBestCatchment()).
+        fingerprint : str
+            fingerprint of input and parameters (see get_fingerprint()). 
+            If None, the fingerprint is calculated from method, search_rad,
+            and flow_dist.
+        flow_dist : int
+            the flow_dist used (MapFlowPath()).
+
+        Returns
+        -------
+        None
+        '''
+        if self.MapXIdx_raw is None or self.MapYIdx_raw is None:
+            print(f'ERROR: no mapping results to save, run e.g. MapRaw() first')
+            return None
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint(method=method, search_rad=search_rad,
+                                               flow_dist=flow_dist)
+        results = {}
+        for name in self.__savedNames:
+            if getattr(self, name) is not None:
+                results[name] = np.asarray(getattr(self, name))
+        ObsIDs = np.asarray(self.ObsIDs)
+        # avoid object arrays, which could only be loaded with allow_pickle
+        if ObsIDs.dtype == object:
+            ObsIDs = ObsIDs.astype(str)
+        np.savez(self.__npzFile(file), ObsIDs=ObsIDs, method=str(method),
+                 search_rad=-1 if search_rad is None else int(search_rad),
+                 flow_dist=-1 if flow_dist is None else int(flow_dist),
+                 fingerprint=fingerprint, **results)
+
+    def load(self, file):
+        ''' Load mapping results saved with save().
+
+        The stored indices (including the fit of each member, if stored) 
+        and SimMeanArea are set to the object. Note that
+        the stored results are not checked against the input of the object
+        (see load_or_compute() for this).
+
+        Parameters
+        ----------
+        file : str 
+            defining the file-path from which data should be read. The 
+            extension .npz is appended if missing.
+
+        Returns
+        -------
+        dict
+            the stored parameters 'method', 'search_rad', 'flow_dist', 
+            'fingerprint', and 'ObsIDs' (search_rad and flow_dist are None 
+            if not used by method).
+        '''
+        with np.load(self.__npzFile(file)) as stored:
+            for name in self.__savedNames:
+                setattr(self, name, stored[name] if name in stored.files else None)
+            method     = str(stored['method'])
+            search_rad = int(stored['search_rad'])
+            flow_dist  = int(stored['flow_dist']) if 'flow_dist' in stored.files else -1
+            params = {
+                'method':      None if method == 'None' else method,
+                'search_rad':  None if search_rad < 0 else search_rad,
+                'flow_dist':   None if flow_dist < 0 else flow_dist,
+                'fingerprint': str(stored['fingerprint']),
+                'ObsIDs':      stored['ObsIDs'],
+            }
+        return params
+
+    def load_or_compute(self, file, method='MapBestQ', search_rad=1, **kwargs):
+        ''' Load the mapping from file if it does match, compute it otherwise.
+
+        If file exists and its fingerprint (see get_fingerprint()) does 
+        match the current input, method, search_rad, and kwargs, the stored
+        results are loaded. Otherwise the mapping is computed by calling 
+        method and the results are saved to file. This way repeated 
+        analysis runs do skip the mapping entirely.
+        With a stack of SimMeanQ, files without the fit of each member (see
+        MapBestQ()) are recalculated as well.
+
+        Parameters
+        ----------
+        file : str 
+            the .npz file to load from / save to. The extension .npz is 
+            appended if missing.
+        method : str
+            the mapping method, one of 'MapRaw', 'MapBestQ', 'MapHighQ', 
+            'MapBestCatchment', 'MapFlowPath', 'MapScore'.
+        search_rad : int
+            passed to method (ignored for 'MapRaw' and 'MapFlowPath').
+        kwargs :
+            further arguments passed to method, e.g. slopex and slopey for 
+            'MapBestCatchment', flow_dist and network for 'MapFlowPath', 
+            or weights for 'MapScore'.
+
+        Notes
+        -----
+        For 'MapScore' only the mapping results (indices and SimMeanArea)
+        are stored, but not the score cube returned by MapScore(). Call 
+        MapScore() directly if the scores are needed.
+
+        Returns
+        -------
+        bool
+            True if the mapping was loaded, False if it was computed.
+        '''
+        supportedMethods = ['MapRaw', 'MapBestQ', 'MapHighQ', 'MapBestCatchment',
+                            'MapFlowPath', 'MapScore']
+        if method not in supportedMethods:
+            print(f'ERROR: method "{method}" is not supported, supported are: {supportedMethods}')
+            return None
+        flow_dist = None
+        if method in ['MapRaw', 'MapFlowPath']:
+            search_rad = None
+        if method == 'MapFlowPath':
+            # flow_dist is stored separately, as it is no search radius
+            flow_dist = kwargs.pop('flow_dist', 5)  # default of MapFlowPath()
+        fingerprint = self.get_fingerprint(method=method, search_rad=search_rad,
+                                           flow_dist=flow_dist, **kwargs)
+
+        # with a stack of SimMeanQ the fit of each member has to be stored
+        # as well, older files without are recalculated
+        requiredNames = ['MapXIdx_raw', 'MapYIdx_raw']
+        if (method in ['MapBestQ', 'MapHighQ'] and self.SimMeanQ is not None 
+                and np.ndim(self.SimMeanQ) == 3):
+            requiredNames += ['MapXIdx_fitMembers', 'MapYIdx_fitMembers']
+
+        file = self.__npzFile(file)
+        if os.path.isfile(file):
+            with np.load(file) as stored:
+                storedFingerprint = str(stored['fingerprint'])
+                storedNames       = stored.files
+            if (storedFingerprint == fingerprint and 
+                    all(name in storedNames for name in requiredNames)):
+                self.load(file)
+                return True
+            print(f'{file} does not match the current input and is recalculated')
+
+        if method == 'MapRaw':
+            self.MapRaw()
+        elif method == 'MapFlowPath':
+            self.MapFlowPath(flow_dist=flow_dist, **kwargs)
+        else:
+            getattr(self, method)(search_rad=search_rad, **kwargs)
+        self.save(file, method=method, search_rad=search_rad, fingerprint=fingerprint,
+                  flow_dist=flow_dist)
+        return False
@@ -5,10 +5,14 @@ import os
 import glob
 import numpy as np
 import datetime
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
 from calendar import monthrange
 from . import IO as io
+from . import coordTrafo
 from scipy import ndimage as nd
+from scipy.spatial import cKDTree
 
 import sloth.slothHelper as slothHelper
 
@@ -43,6 +47,37 @@ def calc_catchment(slopex, slopey, x, y):
     """
     dims = slopey.shape
     nx = dims[1]
+    fdx, fdy = get_flatDrain(slopex, slopey)
+    # flat_idx order='C': idx = (y * nx) + x
+    start = (y * nx ) + x
+    fc = trace_catchment(fdx, fdy, nx, start)
+    return fc.reshape(dims)
+
+def get_flatDrain(slopex, slopey):
+    """ Convert x- and y-slopes to flat 'in which 1D index I do drain' arrays.
+
+    This is the drainage graph used by `calc_catchment()`, split off so it
+    can be calculated once and reused (or shared between processes) when
+    tracing many catchments on the same slopes.
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+
+    Returns
+    -------
+    fdx : ndarray
+        1D ndarray (C-order) holding the flat index offset each pixel drains
+        to in x-direction (1, -1, or -999 if not draining in x-direction).
+    fdy : ndarray
+        1D ndarray (C-order) holding the flat index offset each pixel drains
+        to in y-direction (nx, -nx, or -999 if not draining in y-direction).
+
+    """
+    nx = slopey.shape[1]
     # convert slopes to: 'in which 1D index I do drain'
     drainx = np.zeros_like(slopex)
     drainx = np.where(slopex<0, 1, drainx)
@@ -52,16 +87,38 @@ def calc_catchment(slopex, slopey, x, y):
     drainy = np.where(slopey<0, nx, drainy)
     drainy = np.where(slopey>0, -nx, drainy)
     drainy = np.where(slopey==0, -999, drainy)
-    # plt.imshow(drainx)
-    # plt.show()
     # FlatDrainX
     fdx = drainx.ravel(order='C')
     # FlatDrainY
     fdy = drainy.ravel(order='C')
+    return fdx, fdy
+
+def trace_catchment(fdx, fdy, nx, start):
+    """ Trace the catchment of one outlet on a flat drainage graph.
+
+    See `calc_catchment()` for a description of the algorithm and 
+    `get_flatDrain()` for the drainage graph.
+
+    Parameters
+    ----------
+    fdx : ndarray
+        1D flat drainage in x-direction as returned by `get_flatDrain()`
+    fdy : ndarray
+        1D flat drainage in y-direction as returned by `get_flatDrain()`
+    nx : int
+        number of pixels in x-direction of the original 2D grid
+    start : int
+        flat index (C-order) of the outlet pixel
+
+    Returns
+    -------
+    fc : ndarray
+        1D flat catchment of the same size as fdx. 0 = not part of 
+        catchment; 1 = part of catchment
+    """
     # FlatCatchment
     fc = np.zeros_like(fdx)
-    # flat_idx order='C': idx = (y * nx) + x
-    start = (y * nx ) + x
+    n = fdx.size
 
     openEnds = [start]
     while openEnds:
@@ -69,27 +126,1054 @@ def calc_catchment(slopex, slopey, x, y):
         step = openEnds.pop()
         # Mark open end as catchment
         fc[step] = 1
-        # GET surrounding Pixel
+        # GET surrounding Pixel inside the domain, so pixel at the border do
+        # neither wrap around to the opposite border nor the next row
         # Nort = step - nx; East = step +1
         # West = step - 1 ;South = step + nx
-        # NEWS = [step-nx, step+1, step-1, step+nx]
-        NS = [step-nx, step+nx]
-        EW = [step+1, step-1]
+        NS = [idx for idx in [step-nx, step+nx] if 0 <= idx < n]
+        EW = [idx for idx in [step+1, step-1] if idx // nx == step // nx]
         # CHECK if surrounding drain to step (D2S) and are NOT catchment already.
         # Step is the current handled open end.
-        try:
-            NSD2S = [ idx for idx in  NS if (idx + fdy[idx] == step and not fc[idx] ) ] 
-            EWD2S = [ idx for idx in  EW if (idx + fdx[idx] == step and not fc[idx] ) ] 
-        except IndexError:
-            print('FEHLER')
-            continue
+        NSD2S = [ idx for idx in  NS if (idx + fdy[idx] == step and not fc[idx] ) ] 
+        EWD2S = [ idx for idx in  EW if (idx + fdx[idx] == step and not fc[idx] ) ] 
         D2S = NSD2S + EWD2S
         # add all found pixes to openEnds
         openEnds += D2S
 
-    return fc.reshape(dims)
+    return fc
+
+# Drainage graph shared with the worker processes of calc_catchmentSizes().
+# Set by _init_catchmentWorker() in each worker.
+_sharedDrain = {}
+
+def _attach_sharedArray(name, shape, dtype):
+    """ Attach to an existing shared memory block as ndarray """
+    try:
+        # Python >= 3.13: do not let the workers resource tracker unlink the
+        # block, this is done by the parent process.
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _init_catchmentWorker(shmInfo, nx):
+    """ Initialize a worker of calc_catchmentSizes() """
+    for key, (name, shape, dtype) in shmInfo.items():
+        shm, arr = _attach_sharedArray(name, shape, dtype)
+        # keep a reference to shm, otherwise the buffer gets released
+        _sharedDrain[f'{key}_shm'] = shm
+        _sharedDrain[key] = arr
+    _sharedDrain['nx'] = nx
+
+def _calc_catchmentSize(start):
+    """ Number of pixel of the catchment draining to start (worker task) """
+    fc = trace_catchment(_sharedDrain['fdx'], _sharedDrain['fdy'],
+            _sharedDrain['nx'], start)
+    return int(np.sum(fc))
+
+def calc_catchmentSizes(slopex, slopey, x, y, n_workers=None, chunksize=16,
+        progress=None):
+    """ Calculate the catchment size of many outlet pixels in parallel.
+
+    The drainage graph (see `get_flatDrain()`) is calculated once and placed
+    in shared memory (`multiprocessing.shared_memory`), so the worker 
+    processes of the pool can access it without the grids being pickled 
+    for each task. The outlets are than distributed among the workers and 
+    each outlet is traced with `trace_catchment()`.
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+    x : ndarray
+        1D ndarray of indices in x-direction of the outlets
+    y : ndarray
+        1D ndarray of indices in y-direction of the outlets
+    n_workers : int, optional
+        Number of worker processes. If None, `os.cpu_count()` is used.
+        With n_workers=1 everything is calculated in the current process.
+    chunksize : int, optional
+        Number of outlets send to a worker at once.
+    progress : callable, optional
+        Called as progress(nDone, nTotal) each time the catchment of an 
+        outlet is finished, e.g. to update a progress bar.
+
+    Returns
+    -------
+    ndarray
+        1D ndarray holding the number of pixel of each outlets catchment,
+        in the same order as x and y. Multiply with the pixel area to get
+        the catchment area.
+
+    """
+    nx = slopey.shape[1]
+    fdx, fdy = get_flatDrain(slopex, slopey)
+    # flat_idx order='C': idx = (y * nx) + x
+    starts = [int(tmp_y * nx + tmp_x) for tmp_x, tmp_y in zip(x, y)]
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    nTotal = len(starts)
+    if n_workers <= 1:
+        sizes = []
+        for start in starts:
+            sizes.append(int(np.sum(trace_catchment(fdx, fdy, nx, start))))
+            if progress is not None:
+                progress(len(sizes), nTotal)
+        return np.array(sizes, dtype=int)
+
+    shmBlocks = []
+    shmInfo = {}
+    try:
+        for key, arr in [('fdx', fdx), ('fdy', fdy)]:
+            shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+            shmBlocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            shmInfo[key] = (shm.name, arr.shape, arr.dtype.str)
+        with mp.Pool(processes=n_workers, initializer=_init_catchmentWorker,
+                initargs=(shmInfo, nx)) as pool:
+            # imap does keep the input order
+            sizes = []
+            for size in pool.imap(_calc_catchmentSize, starts, chunksize=chunksize):
+                sizes.append(size)
+                if progress is not None:
+                    progress(len(sizes), nTotal)
+    finally:
+        for shm in shmBlocks:
+            shm.close()
+            shm.unlink()
+
+    return np.array(sizes, dtype=int)
+
+def get_dualDrain(slopex, slopey):
+    """ Return a mask of pixel draining in x- and y-direction at once.
+
+    `calc_catchment()` (see `get_flatDrain()`) lets a pixel with non-zero
+    x- and y-slope drain into both neighbours, while `calc_flowDirection()`
+    and all functions based on it (`calc_flowAccumulation()`, 
+    `calc_riverNetwork()`) follow the steeper slope only. Both drainage 
+    graphs, and so the catchment sizes, are equal if this mask is empty.
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+
+    Returns
+    -------
+    ndarray
+        2D boolean ndarray, True for pixel with both slopes non-zero.
+    """
+    return (np.asarray(slopex) != 0) & (np.asarray(slopey) != 0)
+
+def calc_flowDirection(slopex, slopey):
+    """ Calculate the single direction D4 flow direction out of x- and y-slopes.
+
+    The sign of the slopes is interpreted as in `calc_catchment()`: a 
+    negative slope drains towards increasing indices, a positive slope 
+    towards decreasing indices. Unlike `calc_catchment()`, which lets a 
+    pixel with both slopes non-zero drain into both neighbours, each pixel
+    drains into one neighbour only here: if both slopes of a pixel are 
+    non-zero, the pixel drains in direction of the steeper slope. So both
+    drainage graphs differ for such pixel (see `get_dualDrain()`).
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+
+    Returns
+    -------
+    ndarray
+        1D ndarray (C-order) holding for each pixel the flat index of the 
+        pixel it drains to. Pixel draining out of the domain or not draining
+        at all (both slopes zero) are set to -1.
+    """
+    ny, nx = slopey.shape
+    yy, xx = np.divmod(np.arange(ny*nx), nx)
+    sx = np.asarray(slopex).ravel(order='C')
+    sy = np.asarray(slopey).ravel(order='C')
+    useX = (np.abs(sx) >= np.abs(sy)) & (sx != 0)
+    useY = ~useX & (sy != 0)
+    # target pixel in x- and y-direction
+    tx = xx - np.sign(sx).astype(int)
+    ty = yy - np.sign(sy).astype(int)
+    down = np.full(ny*nx, -1, dtype=np.int64)
+    validX = useX & (tx >= 0) & (tx < nx)
+    validY = useY & (ty >= 0) & (ty < ny)
+    down[validX] = yy[validX] * nx + tx[validX]
+    down[validY] = ty[validY] * nx + xx[validY]
+    return down
+
+def _get_topoLevels(down, active=None):
+    """ Sort pixel of a drainage graph into topological levels.
+
+    Level 0 holds all pixel without any (active) upstream pixel, level n 
+    all pixel whose upstream pixel are in levels < n. Pixel which are part 
+    of a loop are never reached and therefore not included.
+
+    Returns a list of 1D ndarrays of flat indices, one per level.
+    """
+    n = down.size
+    if active is None:
+        active = np.ones(n, dtype=bool)
+    edge = active & (down >= 0)
+    edge[edge] = active[down[edge]]
+    indeg = np.bincount(down[edge], minlength=n)
+    levels = []
+    current = np.flatnonzero(active & (indeg == 0))
+    while current.size > 0:
+        levels.append(current)
+        targets = down[current[edge[current]]]
+        np.subtract.at(indeg, targets, 1)
+        targets = np.unique(targets)
+        current = targets[indeg[targets] == 0]
+    return levels
+
+def calc_flowAccumulation(slopex, slopey):
+    """ Calculate the D4 flow accumulation out of x- and y-slopes.
+
+    The flow accumulation is the number of pixel draining through a given 
+    pixel, including the pixel itself. Multiplied with the pixel area this 
+    is the catchment area of each pixel.
+    The accumulation is calculated for all pixel at once, by processing 
+    the drainage graph (see `calc_flowDirection()`) level by level from the
+    sources to the outlets.
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+
+    Returns
+    -------
+    ndarray
+        2D integer ndarray of the same shape as slopex/y
+
+    Notes
+    -----
+    For slopes where each pixel drains in one direction only (D4), the 
+    result equals the size of `calc_catchment()` for each pixel. Pixel 
+    with both slopes non-zero drain in direction of the steeper slope only
+    (see `calc_flowDirection()`), so the result differs from 
+    `calc_catchment()` for such slopes, what is reported by a warning 
+    (see `get_dualDrain()`).
+    """
+    nDualDrain = int(np.sum(get_dualDrain(slopex, slopey)))
+    if nDualDrain > 0:
+        print(f'WARNING: {nDualDrain} pixel drain in x- and y-direction, which are followed in the steeper direction only')
+        print(f'---      so the flow accumulation differs from the catchment size of calc_catchment()')
+    down = calc_flowDirection(slopex, slopey)
+    flowAcc = np.ones(down.size, dtype=np.int64)
+    for level in _get_topoLevels(down):
+        level = level[down[level] >= 0]
+        np.add.at(flowAcc, down[level], flowAcc[level])
+    return flowAcc.reshape(slopey.shape)
+
+def calc_riverNetwork(slopex, slopey, threshold, flowAcc=None):
+    """ Extract a river network with segments and Strahler order from slopes.
+
+    All pixel with a flow accumulation of at least `threshold` pixel are 
+    defined as river pixel. The network is based on the single direction
+    drainage graph of `calc_flowDirection()`, see `get_dualDrain()` for 
+    the difference to `calc_catchment()`. The river pixel are divided into segments, 
+    which are the reaches between sources, confluences, and outlets, and 
+    the Strahler order is calculated for each pixel and segment.
+    The network is stored as compact arrays (CSR-like), so that later 
+    queries like snapping stations onto the network or walking up and down 
+    the river have to handle the river pixel only and not the full grid.
+
+    Parameters
+    ----------
+    slopex : ndarray
+        2D slopes in x-direction
+    slopey : ndarray
+        2D slopes in y-direction
+    threshold : int
+        Minimum flow accumulation (number of pixel) of a river pixel.
+    flowAcc : ndarray, optional
+        Precalculated flow accumulation (see `calc_flowAccumulation()`).
+
+    Returns
+    -------
+    network : dict
+        A dict holding the river network in individual keys:
+
+        - 'shape': shape of the 2D grid
+        - 'flowAcc': 2D flow accumulation
+        - 'down': 1D flat index each pixel drains to (-1 = none)
+        - 'segmentID': 2D segment ID of each pixel (-1 = no river pixel)
+        - 'strahler': 2D Strahler order of each pixel (0 = no river pixel)
+        - 'segPixels': 1D flat indices of all river pixel, sorted by segment
+          and within each segment from upstream to downstream
+        - 'segStart': 1D offsets into 'segPixels'; the pixel of segment i 
+          are segPixels[segStart[i]:segStart[i+1]]
+        - 'segDown': 1D ID of the downstream segment (-1 = outlet)
+        - 'segOrder': 1D Strahler order of each segment
+        - 'nDualDrain': number of pixel draining in x- and y-direction, 
+          for which 'flowAcc' differs from `calc_catchment()` (see 
+          `get_dualDrain()`)
+
+    Examples
+    --------
+    >>> network = calc_riverNetwork(slopex, slopey, threshold=100)
+    >>> i = network['segmentID'][y, x]
+    >>> pixel = network['segPixels'][network['segStart'][i]:network['segStart'][i+1]]
+    >>> y, x = np.unravel_index(pixel, network['shape'])
+
+    """
+    shape = slopey.shape
+    n = shape[0] * shape[1]
+    down = calc_flowDirection(slopex, slopey)
+    nDualDrain = int(np.sum(get_dualDrain(slopex, slopey)))
+    if flowAcc is None:
+        flowAcc = calc_flowAccumulation(slopex, slopey)
+    isRiver = np.asarray(flowAcc).ravel(order='C') >= threshold
+
+    # river pixel draining into another river pixel
+    riverEdge = isRiver & (down >= 0)
+    riverEdge[riverEdge] = isRiver[down[riverEdge]]
+    nUp = np.bincount(down[riverEdge], minlength=n)
+    # With D4 at most 4 pixel could drain into one pixel, so store upstream
+    # river pixel in a (n, 4) table.
+    src = np.flatnonzero(riverEdge)
+    dst = down[src]
+    order = np.argsort(dst, kind='stable')
+    src, dst = src[order], dst[order]
+    rank = np.arange(dst.size) - np.searchsorted(dst, dst, side='left')
+    upTab = np.full((n, 4), -1, dtype=np.int64)
+    upTab[dst, rank] = src
+
+    strahler = np.zeros(n, dtype=np.int64)
+    segmentID = np.full(n, -1, dtype=np.int64)
+    topoLevel = np.zeros(n, dtype=np.int64)
+    nSeg = 0
+    for lvl, level in enumerate(_get_topoLevels(down, active=isRiver)):
+        topoLevel[level] = lvl
+        # Strahler order: max upstream order, +1 if reached by at least two
+        # upstream reaches of that order; sources are of order 1
+        ups = upTab[level]
+        upOrder = np.where(ups >= 0, strahler[ups], 0)
+        maxOrder = upOrder.max(axis=1)
+        nMax = np.sum(upOrder == maxOrder[:, None], axis=1)
+        strahler[level] = np.where(maxOrder == 0, 1,
+                                   maxOrder + (nMax >= 2))
+        # segments start at sources and confluences, otherwise the segment
+        # of the single upstream pixel is continued
+        isHead = nUp[level] != 1
+        segmentID[level[isHead]] = nSeg + np.arange(np.sum(isHead))
+        nSeg += int(np.sum(isHead))
+        segmentID[level[~isHead]] = segmentID[ups[~isHead, 0]]
+
+    riverPix = np.flatnonzero(segmentID >= 0)
+    riverPix = riverPix[np.lexsort((topoLevel[riverPix], segmentID[riverPix]))]
+    segOfPix = segmentID[riverPix]
+    segStart = np.searchsorted(segOfPix, np.arange(nSeg+1), side='left')
+    # downstream segment of the last pixel of each segment
+    segLast = riverPix[segStart[1:] - 1]
+    segDown = np.where(riverEdge[segLast], segmentID[down[segLast]], -1)
+    segOrder = strahler[riverPix[segStart[:-1]]]
+
+    network = {
+        'shape':     shape,
+        'flowAcc':   np.asarray(flowAcc).reshape(shape),
+        'down':      down,
+        'segmentID': segmentID.reshape(shape),
+        'strahler':  strahler.reshape(shape),
+        'segPixels': riverPix,
+        'segStart':  segStart,
+        'segDown':   segDown,
+        'segOrder':  segOrder,
+        'nDualDrain': nDualDrain,
+    }
+    return network
+
+def snap_toRiverNetwork(network, x, y, maxDist=None):
+    """ Snap points to the nearest pixel of a river network.
+
+    Parameters
+    ----------
+    network : dict
+        River network as returned by `calc_riverNetwork()`.
+    x : ndarray
+        1D ndarray of indices in x-direction of the points to snap.
+    y : ndarray
+        1D ndarray of indices in y-direction of the points to snap.
+    maxDist : float, optional
+        Maximal distance in pixel to snap. Points without river pixel 
+        within maxDist keep their original location.
+
+    Returns
+    -------
+    snapX, snapY : ndarray
+        1D ndarrays of the snapped indices in x- and y-direction.
+    """
+    riverY, riverX = np.unravel_index(network['segPixels'], network['shape'])
+    tree = cKDTree(np.column_stack([riverY, riverX]))
+    points = np.column_stack([np.asarray(y), np.asarray(x)])
+    upper = np.inf if maxDist is None else maxDist
+    dist, idx = tree.query(points, distance_upper_bound=upper)
+    found = np.isfinite(dist)
+    snapX = np.where(found, riverX[np.minimum(idx, riverX.size-1)], x)
+    snapY = np.where(found, riverY[np.minimum(idx, riverY.size-1)], y)
+    return snapX, snapY
+
+def get_flowPathCandidates(network, x, y, maxDist, snapDist=None):
+    """ Collect the river pixel along the flow path around given points.
+
+    Each point is snapped to the nearest river pixel first (see 
+    `snap_toRiverNetwork()`). Starting from there, the river network is 
+    followed up to maxDist pixel downstream and upstream (along all 
+    upstream branches). Instead of all pixel of a square window around a 
+    point, only pixel on the river network which are connected to the 
+    point by the drainage graph are returned. All points are handled at 
+    once, walking the network step by step for all points together.
+
+    Parameters
+    ----------
+    network : dict
+        River network as returned by `calc_riverNetwork()`.
+    x : ndarray
+        1D ndarray of indices in x-direction of the points.
+    y : ndarray
+        1D ndarray of indices in y-direction of the points.
+    maxDist : int
+        Maximal flow distance in pixel (D4 steps) to follow the network 
+        downstream and upstream.
+    snapDist : float, optional
+        Maximal distance in pixel to snap a point to the network (see 
+        `snap_toRiverNetwork()`). Points without river pixel within 
+        snapDist get their own pixel as only candidate.
+
+    Returns
+    -------
+    candPoint : ndarray
+        1D ndarray of the index of the point each candidate belongs to.
+    candX, candY : ndarray
+        1D ndarrays of the indices of each candidate in x- and y-direction.
+    candDist : ndarray
+        1D ndarray of the flow distance of each candidate to the snapped
+        pixel, negative upstream and positive downstream.
+
+    Examples
+    --------
+    >>> network = calc_riverNetwork(slopex, slopey, threshold=100)
+    >>> candPoint, candX, candY, candDist = get_flowPathCandidates(network,
+    ...         x, y, maxDist=5)
+
+    """
+    shape = network['shape']
+    n = shape[0] * shape[1]
+    down = network['down']
+    isRiver = np.asarray(network['segmentID']).ravel(order='C') >= 0
+    snapX, snapY = snap_toRiverNetwork(network, x, y, maxDist=snapDist)
+    start = np.asarray(snapY, dtype=np.int64) * shape[1] + np.asarray(snapX, dtype=np.int64)
+    points = np.arange(start.size)
+
+    # river pixel draining into another river pixel, and the upstream river
+    # pixel of each pixel stored CSR-like: upPix[upStart[i]:upStart[i+1]]
+    riverEdge = isRiver & (down >= 0)
+    riverEdge[riverEdge] = isRiver[down[riverEdge]]
+    upPix = np.flatnonzero(riverEdge)
+    upDst = down[upPix]
+    order = np.argsort(upDst, kind='stable')
+    upPix, upDst = upPix[order], upDst[order]
+    upStart = np.searchsorted(upDst, np.arange(n+1), side='left')
+
+    tmp_point = [points]
+    tmp_pixel = [start]
+    tmp_dist  = [np.zeros(start.size, dtype=np.int64)]
+    # walk downstream, stopping at the outlet of the river network
+    point, pixel = points, start
+    for step in range(1, maxDist+1):
+        keep = riverEdge[pixel]
+        point, pixel = point[keep], down[pixel[keep]]
+        tmp_point.append(point)
+        tmp_pixel.append(pixel)
+        tmp_dist.append(np.full(pixel.size, step, dtype=np.int64))
+    # walk upstream, following all branches
+    keep = isRiver[start]
+    point, pixel = points[keep], start[keep]
+    for step in range(1, maxDist+1):
+        counts = upStart[pixel+1] - upStart[pixel]
+        offsets = np.repeat(upStart[pixel] - np.cumsum(counts) + counts, counts)
+        point = np.repeat(point, counts)
+        pixel = upPix[offsets + np.arange(offsets.size)]
+        tmp_point.append(point)
+        tmp_pixel.append(pixel)
+        tmp_dist.append(np.full(pixel.size, -step, dtype=np.int64))
+
+    candPoint = np.concatenate(tmp_point)
+    candPixel = np.concatenate(tmp_pixel)
+    candDist  = np.concatenate(tmp_dist)
+    order = np.argsort(candPoint, kind='stable')
+    candY, candX = np.unravel_index(candPixel[order], shape)
+    return candPoint[order], candX, candY, candDist[order]
+
+def calc_catchmentSeries(labels, source, stat='mean', weights=None,
+        chunkSize=None, varName=None, layer=None):
+    """ Calculate catchment aggregated time-series out of a (t, y, x) field.
+
+    This function aggregates a 3D time-series for all catchments defined by
+    a label raster in one single pass over the data. The source is read
+    chunk-wise along the time-axis (see `IO.iter_timeChunks()`), so also
+    large netCDF files or PFB series can be handled without reading them
+    at once.
+    The pixels of all catchments are sorted by their label once, so that the
+    aggregation of each chunk breaks down to one gather operation and one
+    `np.add.reduceat()` over the sorted index groups.
+
+    Parameters
+    ----------
+    labels : ndarray
+        2D integer ndarray of the same shape as one time-step of source.
+        Each pixel holds the ID of the catchment it belongs to. Pixel with
+        ID <= 0 do not belong to any catchment.
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series to aggregate. See `IO.iter_timeChunks()` for all
+        supported sources.
+    stat : str, optional
+        The statistic to calculate per catchment and time-step. Supported
+        are 'mean' and 'sum' (default is 'mean').
+    weights : ndarray, optional
+        2D ndarray of the same shape as labels, e.g. the area of each pixel.
+        With 'sum' the weighted sum is calculated (e.g. a volume out of a
+        flux and the pixel area), with 'mean' the weighted mean.
+    chunkSize : int, optional
+        Number of time-steps read at once.
+    varName : str, optional
+        Name of the variable to read if source is a netCDF file.
+    layer : int, optional
+        Layer to select if source is 4D or a series of 3D PFB files.
+
+    Returns
+    -------
+    series : ndarray
+        2D ndarray of shape (t, n_catchments) holding the aggregated
+        time-series of each catchment.
+    catchmentIDs : ndarray
+        1D ndarray holding the catchment ID related to each column of series.
 
-def get_intervalSlice(dates, sliceInterval='month'):
+    Notes
+    -----
+    Each pixel can belong to one catchment only. Nested catchments, e.g. of
+    several gauges along the same river, should therefore be passed as
+    incremental areas and be summed up afterwards.
+    Missing values (masked or NaN) are ignored; catchments without any valid
+    pixel at a given time-step are set to NaN.
+
+    Examples
+    --------
+    >>> labels = np.zeros(slopex.shape, dtype=int)
+    >>> for ID, (x, y) in enumerate(zip(outletsX, outletsY), start=1):
+    ...     labels[calc_catchment(slopex, slopey, x, y) == 1] = ID
+    >>> series, IDs = calc_catchmentSeries(labels, 'pr.nc', varName='pr')
+
+    """
+    supportedStat = ['mean', 'sum']
+    if stat not in supportedStat:
+        print(f'ERROR: stat "{stat}" is not supported.')
+        print(f'---    supported values are: {supportedStat}')
+        return None
+
+    # Sort all pixel belonging to a catchment by their label, so each
+    # catchment becomes one contiguous index group.
+    flatLabels = np.asarray(labels).ravel(order='C')
+    pixIdx = np.flatnonzero(flatLabels > 0)
+    pixIdx = pixIdx[np.argsort(flatLabels[pixIdx], kind='stable')]
+    if pixIdx.size == 0:
+        print('ERROR: labels does not contain any catchment (ID > 0)')
+        return None
+    sortedLabels = flatLabels[pixIdx]
+    groupStarts = np.flatnonzero(np.diff(sortedLabels, prepend=sortedLabels[:1]-1))
+    catchmentIDs = sortedLabels[groupStarts]
+    if weights is not None:
+        pixWeights = np.asarray(weights, dtype=float).ravel(order='C')[pixIdx]
+
+    tmp_series = []
+    for tStart, chunk in io.iter_timeChunks(source, chunkSize=chunkSize,
+            varName=varName, layer=layer):
+        if chunk.shape[1:] != np.shape(labels):
+            print(f'ERROR: shape of source {chunk.shape[1:]} does not match shape of labels {np.shape(labels)}')
+            return None
+        # gather all catchment pixel --> (t, nPix)
+        values = chunk.reshape(chunk.shape[0], -1)[:, pixIdx]
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.)
+        if weights is not None:
+            values = values * pixWeights
+            counts = np.add.reduceat(valid * pixWeights, groupStarts, axis=1)
+        else:
+            counts = np.add.reduceat(valid, groupStarts, axis=1)
+        sums = np.add.reduceat(values, groupStarts, axis=1)
+        if stat == 'sum':
+            tmp_series.append(np.where(counts > 0, sums, np.nan))
+        elif stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                tmp_series.append(np.where(counts > 0, sums / counts, np.nan))
+
+    if len(tmp_series) == 0:
+        print(f'ERROR: source does not hold any time-step')
+        return None
+    series = np.concatenate(tmp_series, axis=0)
+    return series, catchmentIDs
+
+def iter_rollingWindow(source, window, stat='mean', minCount=None,
+        chunkSize=None, varName=None, layer=None):
+    """
+    Iterate over the rolling-window statistic of a chunked time-series.
+
+    The statistic of each time-step t is calculated over the trailing 
+    window [t-window+1, t]. The source is read chunk-wise (see 
+    `IO.iter_timeChunks()`) and the window sums are calculated by 
+    differencing the cumulative sum along time, so the cost does not 
+    depend on the window length. The last window-1 time-steps of each chunk
+    are carried over to the next chunk, so the result does not depend on 
+    the chunk size. The cumulative sum is restarted with each chunk, which
+    keeps the round-off of the differencing small also for long series.
+
+    Parameters
+    ----------
+    source : ndarray, netCDF4.Variable, str, or list of str
+        The time-series with time as first axis. See 
+        `IO.iter_timeChunks()` for all supported sources.
+    window : int
+        Length of the window in time-steps, e.g. 3 for a 3-month window 
+        over monthly means.
+    stat : str, optional
+        'mean' or 'sum' (default is 'mean').
+    minCount : int, optional
+        Minimum number of valid (not NaN) values within a window, else the
+        result is NaN. Default is window, so any NaN (and the incomplete 
+        windows at the start of the series) give NaN.
+    chunkSize : int, optional
+        Number of time-steps read at once.
+    varName : str, optional
+        Name of the variable to read if source is a netCDF file.
+    layer : int, optional
+        Select one layer of the second axis (see `IO.iter_timeChunks()`).
+
+    Yields
+    ------
+    tStart : int
+        Index of the first time-step of the chunk in the entire series.
+    chunk : ndarray
+        The rolling-window statistic of the current chunk.
+
+    """
+    supportedStat = ['mean', 'sum']
+    if stat not in supportedStat:
+        print(f'ERROR: stat "{stat}" is not supported.')
+        print(f'---    supported values are: {supportedStat}')
+        return
+    window   = int(window)
+    minCount = window if minCount is None else int(minCount)
+
+    tailValues = None
+    tailValid  = None
+    for tStart, chunk in io.iter_timeChunks(source, chunkSize=chunkSize,
+            varName=varName, layer=layer):
+        valid  = ~np.isnan(chunk)
+        values = np.where(valid, chunk, 0.)
+        if tailValues is not None:
+            values = np.concatenate([tailValues, values], axis=0)
+            valid  = np.concatenate([tailValid, valid], axis=0)
+        nTail = values.shape[0] - chunk.shape[0]
+
+        # cumulative sums with a leading zero, so the sum over [i, j) is 
+        # cumSum[j] - cumSum[i]
+        zeros     = np.zeros((1,) + values.shape[1:])
+        cumSum    = np.concatenate([zeros, np.cumsum(values, axis=0)], axis=0)
+        cumCount  = np.concatenate([zeros.astype(np.int64), 
+                                    np.cumsum(valid, axis=0, dtype=np.int64)], axis=0)
+        stop      = np.arange(nTail, values.shape[0]) + 1
+        start     = np.maximum(stop - window, 0)
+        sums      = cumSum[stop] - cumSum[start]
+        counts    = cumCount[stop] - cumCount[start]
+
+        if stat == 'sum':
+            result = np.where(counts >= minCount, sums, np.nan)
+        elif stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.where((counts >= minCount) & (counts > 0), sums / counts, np.nan)
+        yield tStart, result
+
+        # carry over the last window-1 time-steps to the next chunk
+        nKeep      = min(window - 1, values.shape[0])
+        tailValues = values[values.shape[0] - nKeep:]
+        tailValid  = valid[valid.shape[0] - nKeep:]
+
+def calc_rollingWindow(source, window, stat='mean', minCount=None,
+        chunkSize=None, varName=None, layer=None):
+    """
+    Calculate the rolling-window statistic of a time-series.
+
+    See `iter_rollingWindow()` for a detailed description of the 
+    parameters. This function does collect all chunks and returns the 
+    entire series, so use `iter_rollingWindow()` directly to keep the 
+    memory bound by the chunk size.
+
+    Returns
+    -------
+    ndarray
+        The rolling-window statistic of the same shape as source (or of the
+        selected layer).
+
+    Examples
+    --------
+    >>> # 3- and 12-month moving mean of monthly precipitation
+    >>> pr03 = calc_rollingWindow(prMonthly, window=3)
+    >>> pr12 = calc_rollingWindow(prMonthly, window=12, minCount=10)
+
+    """
+    tmp_result = [chunk for _, chunk in iter_rollingWindow(source, window,
+        stat=stat, minCount=minCount, chunkSize=chunkSize, varName=varName,
+        layer=layer)]
+    if len(tmp_result) == 0:
+        return None
+    return np.concatenate(tmp_result, axis=0)
+
+def get_timeComponents(dates):
+    ''' Split a time-series into integer arrays of its time components.
+
+    Parameters
+    ----------
+    dates : NDarray
+        the time-series as datetime-objects, cftime-objects, or np.datetime64.
+
+    Returns
+    -------
+    components : dict
+        A dict holding 1D integer ndarrays of the same length as dates in the
+        keys 'year', 'month', 'day', 'hour', and 'minute'.
+
+    Notes
+    -----
+    np.datetime64 input is handled fully vectorized. For datetime- and 
+    cftime-objects (e.g. as returned by netCDF4.num2date()) each component 
+    is read once per time-step, what is cheap compared to any other 
+    per time-step operation and works for all calendars.
+    '''
+    dates = np.asarray(dates)
+    if np.issubdtype(dates.dtype, np.datetime64):
+        Y = dates.astype('datetime64[Y]')
+        M = dates.astype('datetime64[M]')
+        D = dates.astype('datetime64[D]')
+        h = dates.astype('datetime64[h]')
+        m = dates.astype('datetime64[m]')
+        return {
+            'year':   Y.astype(np.int64) + 1970,
+            'month':  (M - Y).astype(np.int64) + 1,
+            'day':    (D - M.astype('datetime64[D]')).astype(np.int64) + 1,
+            'hour':   (h - D.astype('datetime64[h]')).astype(np.int64),
+            'minute': (m - h.astype('datetime64[m]')).astype(np.int64),
+        }
+    components = {}
+    for key in ['year', 'month', 'day', 'hour', 'minute']:
+        components[key] = np.fromiter((getattr(date, key) for date in dates.flat),
+                                      dtype=np.int64, count=dates.size)
+    return components
+
+def get_intervalKeys(dates, sliceInterval='month'):
+    ''' Calculate an integer key of the interval each time-step belongs to.
+
+    The keys are increasing with time and are equal for all time-steps 
+    belonging to the same interval, so interval boundaries are simply where
+    the key changes.
+
+    Parameters
+    ----------
+    dates : NDarray or dict
+        the time-series (see get_timeComponents()), or the components 
+        already returned by get_timeComponents().
+    sliceInterval : str
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year'
+
+    Returns
+    -------
+    keys : NDarray
+        1D integer ndarray of the same length as dates.
+
+    Notes
+    -----
+    'pentad' divides each month in 6 pentads, where the last pentad holds 
+    all days from the 26th on, so pentads never cross month boundaries.
+    'season' are the meteorological seasons DJF, MAM, JJA, SON, where 
+    December is assigned to the season of the following year.
+    '''
+    c = dates if isinstance(dates, dict) else get_timeComponents(dates)
+    month = c['year'] * 12 + (c['month'] - 1)
+    if sliceInterval == 'hour':
+        return (month * 31 + (c['day'] - 1)) * 24 + c['hour']
+    elif sliceInterval == 'day':
+        return month * 31 + (c['day'] - 1)
+    elif sliceInterval == 'pentad':
+        return month * 6 + np.minimum((c['day'] - 1) // 5, 5)
+    elif sliceInterval == 'month':
+        return month
+    elif sliceInterval == 'season':
+        return (c['year'] + (c['month'] == 12)) * 4 + (c['month'] % 12) // 3
+    elif sliceInterval == 'year':
+        return c['year']
+    print(f'ERROR: sliceInterval "{sliceInterval}" is not supported.')
+    return None
+
+def get_calendarIndex(dates, sliceInterval='month'):
+    ''' Calculate the position of each time-step within the calendar year.
+
+    While get_intervalKeys() does distinguish the same interval of different
+    years, this function does not. All Januaries get the same index, all
+    DJF seasons get the same index, etc. This is what climatologies are 
+    based on.
+
+    Parameters
+    ----------
+    dates : NDarray or dict
+        the time-series (see get_timeComponents()), or the components 
+        already returned by get_timeComponents().
+    sliceInterval : str
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year', and 'diurnal' (the hour of day within 
+        each month, index = (month - 1) * 24 + hour, NoI=288) for diurnal
+        cycle composites.
+
+    Returns
+    -------
+    index : NDarray
+        1D integer ndarray of the same length as dates.
+    NoI : int
+        Number of intervals per year, so 0 <= index < NoI.
+
+    Notes
+    -----
+    'day' and 'hour' are indexed on a leap year, so the 29th of February 
+    does get its own index (NoI=366 and NoI=366*24) and the same day has 
+    the same index each year, independent of the calendar used.
+    '''
+    c = dates if isinstance(dates, dict) else get_timeComponents(dates)
+    # day of year on a leap year (the 29th of February always exists)
+    cumDays = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+    if sliceInterval == 'hour':
+        return (cumDays[c['month'] - 1] + c['day'] - 1) * 24 + c['hour'], 366 * 24
+    elif sliceInterval == 'day':
+        return cumDays[c['month'] - 1] + c['day'] - 1, 366
+    elif sliceInterval == 'pentad':
+        return (c['month'] - 1) * 6 + np.minimum((c['day'] - 1) // 5, 5), 72
+    elif sliceInterval == 'month':
+        return c['month'] - 1, 12
+    elif sliceInterval == 'season':
+        return (c['month'] % 12) // 3, 4
+    elif sliceInterval == 'year':
+        return np.zeros_like(c['month']), 1
+    elif sliceInterval == 'diurnal':
+        return (c['month'] - 1) * 24 + c['hour'], 12 * 24
+    print(f'ERROR: sliceInterval "{sliceInterval}" is not supported.')
+    return None, None
+
+def get_intervalStartDates(keys, refDate, sliceInterval='month'):
+    ''' Construct the first date of intervals given by their interval key.
+
+    This is the inverse of get_intervalKeys(), returning the date the 
+    interval starts at.
+
+    Parameters
+    ----------
+    keys : NDarray
+        1D integer ndarray of interval keys (see get_intervalKeys()).
+    refDate : datetime, cftime, or np.datetime64
+        A date of the time-series, defining the type (and calendar) of the 
+        returned dates.
+    sliceInterval : str
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year'
+
+    Returns
+    -------
+    starts : NDarray
+        1D ndarray of dates of the same type as refDate.
+    '''
+    keys = np.asarray(keys, dtype=np.int64)
+    hour = np.zeros_like(keys)
+    day  = np.ones_like(keys)
+    if sliceInterval == 'hour':
+        hour  = keys % 24
+        day   = (keys // 24) % 31 + 1
+        month = keys // 24 // 31
+    elif sliceInterval == 'day':
+        day   = keys % 31 + 1
+        month = keys // 31
+    elif sliceInterval == 'pentad':
+        day   = (keys % 6) * 5 + 1
+        month = keys // 6
+    elif sliceInterval == 'month':
+        month = keys
+    elif sliceInterval == 'season':
+        # DJF of year y starts in December of year y-1
+        month = (keys // 4) * 12 + (keys % 4) * 3 - 1
+    elif sliceInterval == 'year':
+        month = keys * 12
+    else:
+        print(f'ERROR: sliceInterval "{sliceInterval}" is not supported.')
+        return None
+    year  = month // 12
+    month = month % 12 + 1
+    if isinstance(refDate, np.datetime64):
+        return np.array([np.datetime64(f'{y:04d}-{m:02d}-{d:02d}T{h:02d}:00')
+                         for y, m, d, h in zip(year, month, day, hour)])
+    return np.array([refDate.replace(year=int(y), month=int(m), day=int(d), 
+                                     hour=int(h), minute=0, second=0, microsecond=0)
+                     for y, m, d, h in zip(year, month, day, hour)])
+
+def get_intervalExpected(keys, refDate, dumpInterval, sliceInterval='month'):
+    ''' Calculate the number of time-steps expected per interval.
+
+    The expected number of time-steps is the length of each interval 
+    divided by the nominal dumpInterval, but at least one, also if the 
+    interval is shorter than the dumpInterval. The interval edges are 
+    constructed with the date type of refDate (so with its calendar).
+
+    Parameters
+    ----------
+    keys : NDarray
+        1D integer ndarray of interval keys (see get_intervalKeys()).
+    refDate : datetime, cftime, or np.datetime64
+        A date of the time-series, defining the type (and calendar) of the 
+        dates (see get_intervalStartDates()).
+    dumpInterval : timedelta or np.timedelta64
+        The nominal dumpInterval of the time-series.
+    sliceInterval : str
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year'
+
+    Returns
+    -------
+    expected : NDarray
+        1D integer ndarray of the same length as keys.
+    '''
+    keys = np.asarray(keys, dtype=np.int64)
+    if isinstance(refDate, np.datetime64):
+        toTimedelta  = lambda sec: np.timedelta64(int(round(sec * 1000)), 'ms')
+        totalSeconds = lambda delta: np.asarray(delta).astype('timedelta64[ms]').astype(np.float64) / 1000.
+    else:
+        toTimedelta  = lambda sec: datetime.timedelta(seconds=sec)
+        totalSeconds = lambda delta: np.array([d.total_seconds() for d in np.atleast_1d(delta)])
+    dumpSeconds = float(np.ravel(totalSeconds(dumpInterval))[0])
+    starts = get_intervalStartDates(keys, refDate, sliceInterval=sliceInterval)
+    if sliceInterval == 'hour':
+        stops = starts + toTimedelta(3600.)
+    elif sliceInterval == 'day':
+        stops = starts + toTimedelta(86400.)
+    else:
+        stops = get_intervalStartDates(keys + 1, refDate, sliceInterval=sliceInterval)
+    lengths = totalSeconds(stops - starts)
+    return np.maximum(np.rint(lengths / dumpSeconds).astype(np.int64), 1)
+
+def get_intervalGroups(dates, sliceInterval='month', dumpInterval=None):
+    ''' Group an irregular time-series into intervals.
+
+    Real archives of model output are not always perfect: time-steps might
+    be missing, or duplicated (and not strictly increasing) after a restart.
+    This function does not assume a uniform dumpInterval. Instead, the 
+    time-steps are sorted and cleaned from duplicates, and the intervals 
+    are found with np.searchsorted() on the interval keys (see 
+    get_intervalKeys()). For each interval the number of available 
+    time-steps is compared against the number of time-steps expected by the
+    nominal dumpInterval, so gaps are reported instead of breaking the 
+    grouping.
+
+    Parameters
+    ----------
+    dates : NDarray
+        the time-series as datetime-object (or cftime, np.datetime64).
+    sliceInterval : str
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year'
+    dumpInterval : timedelta or np.timedelta64, optional
+        The nominal dumpInterval. If None, the median step of dates is 
+        used, what requires at least two different time-steps.
+
+    Returns
+    -------
+    groups : dict
+        A dict with the keys
+        -) index:        1D integer ndarray, the indices of the time-steps
+                         to use, sorted by time and without duplicates. So
+                         data[index] is the cleaned time-series.
+        -) bounds:       1D integer ndarray of length (number of intervals
+                         + 1), where interval i is 
+                         index[bounds[i]:bounds[i+1]].
+        -) key:          interval key of each interval
+        -) count:        number of available time-steps of each interval
+        -) expected:     number of time-steps expected for each interval 
+                         with the nominal dumpInterval
+        -) complete:     boolean ndarray, True where count >= expected
+        -) dumpInterval: the nominal dumpInterval (the median step, if not
+                         passed)
+
+    Notes
+    -----
+    Only intervals holding at least one time-step are returned. Of 
+    duplicated time-steps the first occurrence is used.
+
+    Example
+    -------
+    >>> groups = get_intervalGroups(dates, sliceInterval='month')
+    >>> data = data[groups['index']]
+    >>> monthlyMean = np.add.reduceat(data, groups['bounds'][:-1], axis=0) \\
+    ...               / groups['count'][:, None, None]
+    '''
+    supportedSliceInterval = ['hour', 'day', 'pentad', 'month', 'season', 'year']
+    if sliceInterval not in supportedSliceInterval:
+        print(f'ERROR: sliceInterval "{sliceInterval}" is not supported.')
+        print(f'---    supported values are: {supportedSliceInterval}')
+        return None
+
+    dates = np.asarray(dates)
+    # time in seconds relative to the first time-step, to sort and to find
+    # duplicates on plain floats independent of the date type
+    if np.issubdtype(dates.dtype, np.datetime64):
+        seconds   = (dates - dates[0]).astype('timedelta64[ms]').astype(np.float64) / 1000.
+        toTimedelta = lambda sec: np.timedelta64(int(round(sec * 1000)), 'ms')
+    else:
+        seconds   = np.array([delta.total_seconds() for delta in (dates - dates[0])])
+        toTimedelta = lambda sec: datetime.timedelta(seconds=sec)
+    _, index = np.unique(seconds, return_index=True)
+    dates    = dates[index]
+    seconds  = seconds[index]
+    if dumpInterval is None:
+        if dates.shape[0] < 2:
+            print('ERROR: at least two different time-steps are needed to calculate the dumpInterval')
+            return None
+        dumpInterval = toTimedelta(float(np.median(np.diff(seconds))))
+
+    keys       = get_intervalKeys(dates, sliceInterval=sliceInterval)
+    uniqueKeys = np.unique(keys)
+    # keys are sorted, since the time-steps are
+    bounds     = np.searchsorted(keys, np.append(uniqueKeys, uniqueKeys[-1] + 1), side='left')
+    count      = np.diff(bounds)
+    expected   = get_intervalExpected(uniqueKeys, dates[0], dumpInterval, 
+                                      sliceInterval=sliceInterval)
+
+    return {
+        'index':        index,
+        'bounds':       bounds,
+        'key':          uniqueKeys,
+        'count':        count,
+        'expected':     expected,
+        'complete':     count >= expected,
+        'dumpInterval': dumpInterval,
+    }
+
+def get_intervalSlice(dates, sliceInterval='month', returnBounds=False):
     ''' This functions calculates interval slices of a given time-series
 
     This function calculates interval slices of a given time-series, 
@@ -97,9 +1181,11 @@ def get_intervalSlice(dates, sliceInterval='month'):
     to also enable multi dimensional slicing.    
     The calculation takes the models dumpintervall into account, wherefore 
     this function is working for (nearly) every time-resolution.   
-    The calculation is based on datetime-objects and therefore really 
-    calculates the slice of individual interval, even if the time-series 
-    does not start or end at the first or last of a given interval.  
+    The calculation is based on the time components of the dates and 
+    therefore really calculates the slice of individual interval, even if 
+    the time-series does not start or end at the first or last of a given 
+    interval. Incomplete intervals at the start and the end of the 
+    time-series are skipped.  
 
     Use case:   
     You got a time-series of hourly data points and want to calculate the
@@ -109,14 +1195,22 @@ def get_intervalSlice(dates, sliceInterval='month'):
     Parameters
     ----------
     dates : NDarray 
-        the time-series as datetime-object. 
+        the time-series as datetime-object (or cftime, np.datetime64). 
     sliceInterval : str
-        defining the interval. Supported are: 'day', 'month'
+        defining the interval. Supported are: 'hour', 'day', 'pentad', 
+        'month', 'season', 'year'
+    returnBounds : bool
+        If True, a boundaries array is returned instead of a list of slices.
 
     Returns
     -------
     Slices : list
         A list with length of found intervals with related slices
+    Bounds : NDarray
+        If returnBounds=True: 1D integer ndarray of length 
+        (number of intervals + 1), where interval i is 
+        dates[Bounds[i]:Bounds[i+1]]. Could be used directly with
+        np.add.reduceat(data, Bounds[:-1]) for the complete series.
 
     Notes 
     -----
@@ -125,98 +1219,78 @@ def get_intervalSlice(dates, sliceInterval='month'):
     ii) At least hourly steps / dumpIntervals! 
     iii) No seconds in dates - model output is at least on full minutes!
 
+    An interval is complete at its start if one dumpInterval before the 
+    first time-step belongs to the previous interval, and complete at its
+    end if one dumpInterval after the last time-step belongs to the next 
+    interval. This way also time-axis of averaged model output, which might
+    got shifted in between the time-bounds, are handled.
+
+    If the dumpInterval is not equal for all time-steps (e.g. missing 
+    time-steps after a restart), the intervals are found with 
+    get_intervalGroups() instead, and first and last interval are skipped 
+    if they hold less time-steps than expected. Use get_intervalGroups() 
+    directly to get the coverage of each interval, or to handle duplicated
+    time-steps.
+
     '''
 
     # Check is passed sliceInterval is supported and exit if not.
-    supportedSliceInterval = ['day', 'month']
+    supportedSliceInterval = ['hour', 'day', 'pentad', 'month', 'season', 'year']
     if sliceInterval not in supportedSliceInterval:
         print(f'ERROR: sliceInterval "{sliceInterval}" is not supported.')
         print(f'---    supported values are: {supportedSliceInterval}')
-        print(f'---    EXIT program')
         return False
 
-    print(f'########################################################################')
-    print(f'#### calculate dumpInterval and check if equal for all data-points')
-    print(f'########################################################################')
+    dates = np.asarray(dates)
+    if dates.shape[0] < 2:
+        print('ERROR: at least two time-steps are needed to calculate the dumpInterval')
+        return False
     # Calculating dumpInterval
     tmp_dumpInterval = np.diff(dates, n=1)
-    # Check if dumpInterval equal for all data-points
-    # and if so define set dumpInterval 
+    # If the dumpInterval is not equal for all data-points (missing 
+    # time-steps) group with get_intervalGroups() instead, which does not 
+    # rely on a uniform dumpInterval. Slices do require an increasing 
+    # time-axis without duplicates, though.
     if not np.all(tmp_dumpInterval == tmp_dumpInterval[0]):
-        print('ERROR: calculated dumpInterval is not equal for all data-points')
-        # In case of error: break function
-        return False
-    else:
-        dumpInterval = tmp_dumpInterval[0]
-        print(f'DONE --> DumpInterval: {dumpInterval}')        
-    
-    # Finding the first time-step of a interval, by looping over the time-series and 
-    # check for each time-step if this is the first of the interval (break loop if found).
-    print(f'########################################################################')
-    print(f'#### Finding first of month')
-    print(f'########################################################################')
-    Offset = 0
-    while True:
-        # verify first date is first of interval.
-        # idea explained with sliceInterval='month': 
-        # first step - dumpInterval (or 0.5*dumpInterval) is first of month 00UTC
-        # By checking 1*dumpInterval and 0.5*dumpInterval we do take into account, that
-        # the time-axis of averaged model output might got shifted in between the 
-        # time-bounds.
-        print(f'Offset: {Offset}')
-        tmp_first = dates[Offset]
-        if sliceInterval == 'day':
-            # using midnight as reference
-            tmp_first_ref = tmp_first.replace(hour=0, minute=0, second=0)
-        elif sliceInterval == 'month':
-            # using the first of current month at midnight as reference
-            tmp_first_ref = tmp_first.replace(day=1, hour=0, minute=0, second=0)
-        # First time-step of dates is already first of a interval
-        if (tmp_first == tmp_first_ref):
-            print(f'check step {Offset} is first of a month at midnight')
-            break
-        #if (tmp_first - dumpInterval) == tmp_first_ref:
-        #    print(f'check step {Offset} is first of a month at midnight')
-        #    break
-        # First time-step is not the exact first of a interval but set in
-        # middle of time-bounds and therefore halfe a dumpInteral away from
-        # first date of a interval
-        elif (tmp_first - (0.5*dumpInterval)) == tmp_first_ref:
-            print(f'check step {Offset} is first of a month at midnight')
-            break
-        else:
-            print(f'ERROR: step {Offset} is not first step of month at midnight!')
-            print(f'step: {tmp_first}')
-            Offset += 1
-            # hard break of loop if no 'beginning' is found after 50 time-steps
-            if Offset > 50:
-                break
-            continue
-
-    # Calculating the slices by looping over all time-steps and check if the 
-    # next time-step belong to the next interval.
-    # NWR 20210422:
-    # there should be some clever and short solution for below loop ...!
-    # now that we know the dumpInterval and first step is first of interval...
-    print(f'########################################################################')
-    print(f'#### getting month series / slices')
-    print(f'########################################################################')
-    t_lower = Offset
-    Slices = []
-    for t in range(Offset, dates.shape[0]):
-        # I decided to go for the solution checking current month and next month
-        # to catch the case if the dateset contains one month only!
-        if sliceInterval == 'day':
-            currInterval = dates[t].day
-            nextInterval = (dates[t] + dumpInterval).day
-        elif sliceInterval == 'month':
-            currInterval = dates[t].month
-            nextInterval = (dates[t] + dumpInterval).month
-        if nextInterval != currInterval:
-            Slices.append(slice(t_lower,t+1,None))
-            t_lower = t+1
-
-    return Slices 
+        groups = get_intervalGroups(dates, sliceInterval=sliceInterval)
+        if groups is None:
+            return False
+        if groups['index'].size != dates.shape[0] or np.any(np.diff(groups['index']) != 1):
+            print('ERROR: time-axis is not strictly increasing, use get_intervalGroups()')
+            return False
+        Bounds = groups['bounds']
+        # Skip incomplete intervals at the start and end of the time-series
+        if not groups['complete'][0]:
+            Bounds = Bounds[1:]
+        if Bounds.size > 1 and not groups['complete'][-1]:
+            Bounds = Bounds[:-1]
+        if Bounds.size < 2:
+            Bounds = np.array([], dtype=int)
+        if returnBounds:
+            return Bounds
+        return [slice(start, stop, None) for start, stop in zip(Bounds[:-1], Bounds[1:])]
+    dumpInterval = tmp_dumpInterval[0]
+
+    keys = get_intervalKeys(dates, sliceInterval=sliceInterval)
+    # Interval boundaries are where the key changes
+    Bounds = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1, [keys.size]])
+
+    # Skip incomplete intervals at the start and end of the time-series.
+    # Check this by looking one dumpInterval ahead / back.
+    edgeKeys = get_intervalKeys(np.array([dates[0] - dumpInterval,
+                                          dates[-1] + dumpInterval]),
+                                sliceInterval=sliceInterval)
+    if edgeKeys[0] == keys[0]:
+        Bounds = Bounds[1:]
+    if edgeKeys[1] == keys[-1]:
+        Bounds = Bounds[:-1]
+    # Not even one complete interval found
+    if Bounds.size < 2:
+        Bounds = np.array([], dtype=int)
+
+    if returnBounds:
+        return Bounds
+    return [slice(start, stop, None) for start, stop in zip(Bounds[:-1], Bounds[1:])]
 
 def spher_dist_v1(lon1, lat1, lon2, lat2, Rearth=6373):
     """ calculate the spherical / haversine distance
@@ -296,6 +1370,49 @@ def find_nearest_Index_2D(point, coord2D):
     idx = np.unravel_index(np.argmin(dist, axis=None),dist.shape)
     return idx[0], idx[1]
 
+def get_rotGridIndex(lons, lats, domainDef):
+    """
+    Find the pixel of a regular rotated-pole grid containing given points.
+
+    Grids as CORDEX or griddes domains are regular in rotated coordinates,
+    so the pixel holding a point is simply found by rotating the point into
+    the rotated system (see `coordTrafo.rotate_grid()`) and rounding its 
+    distance to the south-west corner in units of the grid spacing. No 
+    distance search is needed, wherefore this is fast also for millions of
+    points.
+
+    Parameters
+    ----------
+    lons : ndarray
+        geographical longitudes of the points (in degree)
+    lats : ndarray
+        geographical latitudes of the points (in degree)
+    domainDef : dict
+        domain definition as returned by `slothHelper.get_cordexDomDef()` or
+        `slothHelper.get_griddesDomDef()`, with the keys 'SWlon', 'SWlat', 
+        'dlon', 'dlat', 'NPlon', 'NPlat', 'Nlon', 'Nlat'.
+
+    Returns
+    -------
+    yIdx, xIdx : ndarray
+        integer index of the pixel of each point (of the same shape as lons)
+    inside : ndarray
+        boolean ndarray, False for points outside the grid, whose index is
+        not valid.
+
+    """
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    rlat, rlon = coordTrafo.rotate_grid(np.atleast_1d(lats), np.atleast_1d(lons),
+                                        domainDef['NPlat'], domainDef['NPlon'])
+    # rotated longitude relative to the western border in [0, 360)
+    relLon = (rlon - domainDef['SWlon']) % 360.
+    relLat = rlat - domainDef['SWlat']
+    xIdx = np.rint(relLon / domainDef['dlon']).astype(np.int64).reshape(lons.shape)
+    yIdx = np.rint(relLat / domainDef['dlat']).astype(np.int64).reshape(lats.shape)
+    inside = (xIdx >= 0) & (xIdx < domainDef['Nlon']) & (yIdx >= 0) & (yIdx < domainDef['Nlat'])
+    return yIdx, xIdx, inside
+
 def plusOneMonth(currDate):
     """
     Return the passed date incremented by one month.
@@ -628,5 +1745,24 @@ def mapDataRange_lin(X, y_min=0, y_max=1,
 
     return Y
 
+def get_npzFile(filename):
+    """ Return filename with the extension .npz, appended if missing.
+
+    np.savez() does append .npz to filenames without, while np.load() does
+    open the filename as passed. Passing filename through this function on
+    save and load lets both refer to the same file.
+
+    Parameters
+    ----------
+    filename : str
+        The path to a .npz file, with or without extension.
+
+    Returns
+    -------
+    str
+        filename ending with .npz
+    """
+    return filename if filename.endswith('.npz') else f'{filename}.npz'
+
 if __name__ == '__main__':
     print('Im there!')